@@ -1,10 +1,16 @@
 import psycopg
 import os
 from datetime import datetime
+from bus_connector import get_logger
 
 PAGE_SIZE_AUTO_JOBS = 2  # Número de trabajos automáticos por página
 PAGE_SIZE_BACKUP_INSTANCES = 1 # Número de instancias por página
 
+# Estados de BackedUpFiles.cloud_status que aún no tienen copia en la nube.
+CLOUD_STATUS_LABELS = {"pending": "pendiente", "retrying": "reintentando"}
+
+logger = get_logger("DBHandler")
+
 def get_db_connection():
     """Crea y retorna una nueva conexión a la base de datos."""
     try:
@@ -13,13 +19,14 @@ def get_db_connection():
         conn = psycopg.connect(conn_string)
         return conn
     except psycopg.OperationalError as e:
-        print(f"[DBHandler] Error al conectar con la base de datos: {e}")
+        logger.error("Error al conectar con la base de datos: %s", e)
         return None
 
 def list_backup_instances(page_number=1):
     """
     Consulta la base de datos y devuelve una lista paginada detallada de
     instancias de respaldo, sus archivos asociados y el trabajo automático de origen si aplica.
+    Indica también qué instancias aún no tienen todos sus archivos replicados en la nube.
     """
     conn = get_db_connection()
     if conn is None:
@@ -53,6 +60,7 @@ def list_backup_instances(page_number=1):
                     bf.path_within_source AS file_path,
                     bf.size AS file_size,
                     bf.file_hash AS file_hash,
+                    bf.cloud_status AS cloud_status,
                     aj.job_name AS auto_job_name
                 FROM
                     BackupInstances bi
@@ -72,7 +80,7 @@ def list_backup_instances(page_number=1):
 
             processed_instances = {}
             for row in results:
-                instance_id, timestamp, structure, file_path, file_size, file_hash, auto_job_name = row
+                instance_id, timestamp, structure, file_path, file_size, file_hash, cloud_status, auto_job_name = row
                 if instance_id not in processed_instances:
                     instance_details_str = f"ID de respaldo: {instance_id}\n"
                     instance_details_str += f"  Fecha: {timestamp.strftime('%Y-%m-%d %H:%M:%S')}\n"
@@ -81,12 +89,16 @@ def list_backup_instances(page_number=1):
                         instance_details_str += f"  Origen: Trabajo automático ('{auto_job_name}')\n"
                     else:
                         instance_details_str += f"  Origen: Manual\n"
-                    instance_details_str += f"  Archivos:\n"
-                    processed_instances[instance_id] = {"details": instance_details_str, "files_str": "", "has_files": False, "timestamp": timestamp}
+                    processed_instances[instance_id] = {"details": instance_details_str, "files_str": "", "file_count": 0,
+                                                        "not_replicated": 0, "timestamp": timestamp}
 
                 if file_path:
-                    processed_instances[instance_id]["files_str"] += f"    - Ruta: {file_path}, Tamaño: {file_size} bytes, Hash: {file_hash}\n"
-                    processed_instances[instance_id]["has_files"] = True
+                    file_line = f"    - Ruta: {file_path}, Tamaño: {file_size} bytes, Hash: {file_hash}"
+                    if cloud_status in CLOUD_STATUS_LABELS:
+                        file_line += f", Nube: {CLOUD_STATUS_LABELS[cloud_status]}"
+                        processed_instances[instance_id]["not_replicated"] += 1
+                    processed_instances[instance_id]["files_str"] += file_line + "\n"
+                    processed_instances[instance_id]["file_count"] += 1
             
             response_parts = []
             # Ordenar por timestamp y luego id para la salida final, usando los IDs obtenidos para la página
@@ -96,7 +108,12 @@ def list_backup_instances(page_number=1):
                 if inst_id in processed_instances:
                     data = processed_instances[inst_id]
                     final_response_str += data["details"]
-                    if data["has_files"]:
+                    if data["not_replicated"]:
+                        final_response_str += f"  Copia en la nube: pendiente ({data['not_replicated']} de {data['file_count']} archivos)\n"
+                    elif data["file_count"]:
+                        final_response_str += "  Copia en la nube: completa\n"
+                    final_response_str += "  Archivos:\n"
+                    if data["file_count"]:
                         final_response_str += data["files_str"]
                     else:
                         final_response_str += "    (Esta instancia de respaldo no contiene archivos)\n"
@@ -110,7 +127,7 @@ def list_backup_instances(page_number=1):
 
     except Exception as e:
         # Loggear el error real en el servidor
-        print(f"[DBHandler] Error al listar instancias de respaldo paginadas: {e}", flush=True)
+        logger.error("Error al listar instancias de respaldo paginadas: %s", e)
         import traceback
         traceback.print_exc()
         return f"Error al consultar la base de datos: {str(e)}"
@@ -152,7 +169,7 @@ def list_auto_backup_jobs(page_number=1):
                 })
         return jobs_list 
     except Exception as e:
-        print(f"[DBHandler] Error al listar trabajos automáticos paginados: {e}", flush=True)
+        logger.error("Error al listar trabajos automáticos paginados: %s", e)
         return {"status": "ERROR", "message": f"Error al consultar trabajos automáticos: {str(e)}"} 
     finally:
         if conn:
@@ -178,7 +195,7 @@ def update_auto_job_timestamp(job_id):
                 return False, f"No se encontró ningún trabajo con ID {job_id} para actualizar."
             return True, f"Timestamp actualizado para el trabajo ID {job_id}."
     except Exception as e:
-        print(f"[DBHandler] Error al actualizar timestamp del trabajo {job_id}: {e}", flush=True)
+        logger.error("Error al actualizar timestamp del trabajo %s: %s", job_id, e)
         conn.rollback()
         return False, f"Error al actualizar timestamp: {str(e)}"
     finally:
@@ -206,7 +223,7 @@ def add_auto_backup_job(job_name, source_path, destination_structure, frequency_
             conn.commit()
             return True, f"Trabajo de respaldo automático '{job_name}' creado exitosamente."
     except Exception as e:
-        print(f"[DBHandler] Error al añadir trabajo automático: {e}", flush=True)
+        logger.error("Error al añadir trabajo automático: %s", e)
         conn.rollback()
         return False, f"Error al guardar el trabajo automático en la base de datos: {str(e)}"
     finally:
@@ -215,14 +232,16 @@ def add_auto_backup_job(job_name, source_path, destination_structure, frequency_
 
 def get_instance_files_for_deletion(instance_id):
     """
-    Obtiene la estructura de la instancia y la lista de rutas relativas de sus archivos.
+    Obtiene la estructura de la instancia y la lista de sus archivos, como
+    diccionarios con 'relative_path', 'hash' y, si se guardaron por trozos,
+    'chunks' ([[hash, tamaño], ...]).
     """
     conn = get_db_connection()
     if conn is None:
         return None, []
 
     structure = None
-    file_paths = []
+    files = []
     try:
         with conn.cursor() as cur:
             # Obtener la estructura de la instancia
@@ -232,19 +251,61 @@ def get_instance_files_for_deletion(instance_id):
                 return None, [] # Instancia no encontrada
             structure = structure_result[0]
 
-            # Obtener las rutas relativas de los archivos
-            cur.execute("SELECT path_within_source FROM BackedUpFiles WHERE backup_instance_id = %s", (instance_id,))
+            # Obtener las rutas relativas y los hashes de los archivos
+            cur.execute("SELECT path_within_source, file_hash FROM BackedUpFiles WHERE backup_instance_id = %s", (instance_id,))
             files_results = cur.fetchall()
-            file_paths = [row[0] for row in files_results]
+            files = [{"relative_path": row[0], "hash": row[1]} for row in files_results]
+
+            # Obtener los trozos de los archivos guardados por trozos
+            cur.execute("""
+                SELECT f.path_within_source, c.chunk_hash, c.size
+                FROM FileChunks c JOIN BackedUpFiles f ON f.id = c.backed_up_file_id
+                WHERE f.backup_instance_id = %s
+                ORDER BY f.id, c.chunk_index
+            """, (instance_id,))
+            files_by_path = {file_meta["relative_path"]: file_meta for file_meta in files}
+            for path, chunk_hash, chunk_size in cur.fetchall():
+                files_by_path[path].setdefault("chunks", []).append([chunk_hash, chunk_size])
         
-        return structure, file_paths
+        return structure, files
     except Exception as e:
-        print(f"[DBHandler] Error al obtener archivos de instancia {instance_id} para eliminación: {e}", flush=True)
+        logger.error("Error al obtener archivos de instancia %s para eliminación: %s", instance_id, e)
         return None, [] # Error durante la consulta
     finally:
         if conn:
             conn.close()
 
+def claim_instance_object_refs(instance_id):
+    """
+    Marca que las referencias de una instancia en el almacén de objetos se van a
+    liberar, para que se liberen una sola vez aunque la eliminación se reintente.
+
+    Returns:
+        set: Rutas relativas de los archivos cuyas referencias debe liberar quien
+             llama (vacío si ya se liberaron o si son copias por ruta), o None si
+             no se pudo actualizar la base de datos.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        return None
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE BackedUpFiles SET object_refs = FALSE WHERE backup_instance_id = %s AND object_refs RETURNING path_within_source",
+                (instance_id,)
+            )
+            claimed_paths = {row[0] for row in cur.fetchall()}
+        conn.commit()
+        return claimed_paths
+    except Exception as e:
+        logger.error("Error al marcar las referencias de la instancia %s para liberarlas: %s", instance_id, e)
+        conn.rollback()
+        return None
+    finally:
+        if conn:
+            conn.close()
+
 def delete_backup_instance_metadata(instance_id):
     """
     Elimina una instancia de respaldo y sus archivos asociados de la base de datos.
@@ -271,7 +332,7 @@ def delete_backup_instance_metadata(instance_id):
                 # Esto no debería ocurrir si la verificación anterior pasó, pero por si acaso.
                 return False, f"No se eliminaron metadatos para el respaldo ID {instance_id} (posiblemente ya no existía)."
     except Exception as e:
-        print(f"[DBHandler] Error al eliminar metadatos del respaldo ID {instance_id}: {e}", flush=True)
+        logger.error("Error al eliminar metadatos del respaldo ID %s: %s", instance_id, e)
         conn.rollback()
         return False, f"Error en la base de datos al eliminar metadatos del respaldo ID {instance_id}: {str(e)}"
     finally:
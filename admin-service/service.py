@@ -1,20 +1,23 @@
 # admin-service/service.py
 import os
-import time
 import json
-from bus_connector import ServiceConnector, transact
-from db_handler import list_backup_instances, list_auto_backup_jobs, update_auto_job_timestamp, add_auto_backup_job, get_instance_files_for_deletion, delete_backup_instance_metadata
+from bus_connector import ServiceWorkerPool, configure_logging, get_logger, log_payload, transact
+from db_handler import list_backup_instances, list_auto_backup_jobs, update_auto_job_timestamp, add_auto_backup_job, get_instance_files_for_deletion, claim_instance_object_refs, delete_backup_instance_metadata
 
 # --- Configuración del servicio ---
 BUS_HOST = os.getenv("BUS_HOST")
-BUS_PORT = 5000
+BUS_PORT = int(os.getenv("BUS_PORT", 5000))
 SERVICE_NAME = os.getenv("SERVICE_NAME")
+# Número de conexiones (trabajadores) que el servicio registra en el bus.
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "1"))
 
-def process_request(data_received):
+logger = get_logger("ServiceLogic")
+
+def process_request(data_received, body=None):
     """
     Contiene la lógica de negocio principal del servicio.
     """
-    print(f"[ServiceLogic] Procesando solicitud: '{data_received}'", flush=True)
+    log_payload(logger, "Procesando solicitud: '%s'", data_received)
     
     command_parts = data_received.split('|', 1)
     command = command_parts[0]
@@ -28,10 +31,10 @@ def process_request(data_received):
                 page_number = int(payload.get("page", 1))
                 if page_number < 1: page_number = 1
             except (json.JSONDecodeError, ValueError, TypeError) as e:
-                print(f"[ServiceLogic] Payload inválido para listar: '{payload_str}'. Usando página 1. Error: {e}", flush=True)
+                logger.warning("Payload inválido para listar: '%s'. Usando página 1. Error: %s", payload_str, e)
                 page_number = 1
         else:
-             print("[ServiceLogic] No se recibió payload para listar. Usando página 1.", flush=True)
+             logger.info("No se recibió payload para listar. Usando página 1.")
         
         return list_backup_instances(page_number=page_number)
     
@@ -44,11 +47,11 @@ def process_request(data_received):
                 if page_number < 1: # Asegurar que el número de página sea positivo
                     page_number = 1
             except (json.JSONDecodeError, ValueError, TypeError) as e:
-                print(f"[ServiceLogic] Payload inválido o faltante para list_auto_jobs: '{payload_str}'. Error: {e}. Usando página 1.", flush=True)
+                logger.warning("Payload inválido o faltante para list_auto_jobs: '%s'. Error: %s. Usando página 1.", payload_str, e)
                 page_number = 1
         else:
             # Si no hay payload, se asume la primera página.
-            print("[ServiceLogic] No se recibió payload para list_auto_jobs. Usando página 1.", flush=True)
+            logger.info("No se recibió payload para list_auto_jobs. Usando página 1.")
         
         jobs_page_data = list_auto_backup_jobs(page_number=page_number)
         
@@ -112,10 +115,11 @@ def process_request(data_received):
             if instance_id is None:
                 return json.dumps({"status": "ERROR", "message": "instance_id es requerido en el payload."})
 
-            print(f"[ServiceLogic] Iniciando proceso de eliminación para instancia ID: {instance_id}", flush=True)
+            logger.info("Iniciando proceso de eliminación para instancia ID: %s", instance_id)
 
             # Obtener información de archivos de la instancia
-            instance_structure, relative_file_paths = get_instance_files_for_deletion(instance_id)
+            instance_structure, instance_files = get_instance_files_for_deletion(instance_id)
+            relative_file_paths = [file_meta["relative_path"] for file_meta in instance_files]
 
             if instance_structure is None: # Implica que la instancia no existe o hubo error de BD
                 return json.dumps({"status": "ERROR", "message": f"No se encontró la instancia de respaldo ID {instance_id} o no se pudieron obtener sus detalles."})
@@ -126,58 +130,66 @@ def process_request(data_received):
             
             # Solicitar eliminación al cloud-service
             if cloud_files_to_delete: # Solo si hay archivos que eliminar en la nube
-                print(f"[ServiceLogic] Solicitando eliminación de {len(cloud_files_to_delete)} archivo(s) al cloud-service...", flush=True)
+                logger.info("Solicitando eliminación de %s archivo(s) al cloud-service...", len(cloud_files_to_delete))
                 cloud_delete_payload = json.dumps({"files": cloud_files_to_delete})
                 r_service_cloud, r_status_cloud, r_content_cloud = transact(BUS_HOST, BUS_PORT, "clcsv", f"delete_files|{cloud_delete_payload}")
 
                 if r_status_cloud != "OK" or (r_content_cloud and r_content_cloud.strip().startswith("Error")):
                     # Si cloud-service devuelve un error en su contenido, incluso con status OK del bus.
                     err_msg = f"Fallo al eliminar archivos de la nube para la instancia ID {instance_id}. Respuesta: {r_content_cloud}"
-                    print(f"[ServiceLogic] {err_msg}", flush=True)
+                    logger.error(err_msg)
                     return json.dumps({"status": "ERROR", "message": err_msg})
-                print(f"[ServiceLogic] Respuesta de eliminación de nube: {r_content_cloud}", flush=True)
+                logger.info("Respuesta de eliminación de nube: %s", r_content_cloud)
             else:
-                print(f"[ServiceLogic] No hay archivos registrados en la BD para esta instancia (ID: {instance_id}) para eliminar de la nube.", flush=True)
+                logger.warning("No hay archivos registrados en la BD para esta instancia (ID: %s) para eliminar de la nube.", instance_id)
 
 
             # Solicitar eliminación de copias locales al backup-service
             if relative_file_paths: # Solo si hay archivos que eliminar localmente
-                print(f"[ServiceLogic] Solicitando eliminación de copias locales al backup-service...", flush=True)
-                local_delete_payload = json.dumps({"structure": instance_structure, "relative_paths": relative_file_paths})
+                # Solo los archivos marcados aquí tienen referencias que liberar: los respaldos
+                # anteriores al almacén de objetos no las tienen, y un reintento no las libera dos veces.
+                claimed_paths = claim_instance_object_refs(instance_id)
+                if claimed_paths is None:
+                    return json.dumps({"status": "ERROR", "message": f"No se pudieron marcar las copias locales de la instancia ID {instance_id} para eliminarlas."})
+                for file_meta in instance_files:
+                    file_meta["object_refs"] = file_meta["relative_path"] in claimed_paths
+
+                logger.info("Solicitando eliminación de copias locales al backup-service...")
+                local_delete_payload = json.dumps({"structure": instance_structure, "files": instance_files})
                 r_service_local, r_status_local, r_content_local = transact(BUS_HOST, BUS_PORT, "bkpsv", f"delete_local_files|{local_delete_payload}")
                 
                 try:
                     local_delete_response = json.loads(r_content_local)
                     if r_status_local != "OK" or local_delete_response.get("status") != "OK":
                         err_msg = f"Fallo al eliminar copias locales para la instancia ID {instance_id}. Respuesta: {local_delete_response.get('message', r_content_local)}"
-                        print(f"[ServiceLogic] {err_msg}", flush=True)
+                        logger.error(err_msg)
 
                         return json.dumps({"status": "ERROR", "message": err_msg + " (Los archivos en la nube podrían haber sido eliminados)."})
-                    print(f"[ServiceLogic] Respuesta de eliminación local: {local_delete_response.get('message')}", flush=True)
+                    logger.info("Respuesta de eliminación local: %s", local_delete_response.get('message'))
                 except json.JSONDecodeError:
                     err_msg = f"Respuesta inválida del backup-service al eliminar copias locales: {r_content_local}"
-                    print(f"[ServiceLogic] {err_msg}", flush=True)
+                    logger.error(err_msg)
                     return json.dumps({"status": "ERROR", "message": err_msg + " (Los archivos en la nube podrían haber sido eliminados)."})
             else:
-                print(f"[ServiceLogic] No hay archivos registrados en la BD para esta instancia (ID: {instance_id}) para eliminar localmente.", flush=True)
+                logger.warning("No hay archivos registrados en la BD para esta instancia (ID: %s) para eliminar localmente.", instance_id)
 
             # Eliminar metadatos de la base de datos
-            print(f"[ServiceLogic] Eliminando metadatos de la instancia ID {instance_id} de la base de datos...", flush=True)
+            logger.info("Eliminando metadatos de la instancia ID %s de la base de datos...", instance_id)
             success_db, message_db = delete_backup_instance_metadata(instance_id)
             if success_db:
                 final_message = f"Respaldo ID {instance_id} y sus copias asociadas procesados para eliminación. DB: {message_db}"
-                print(f"[ServiceLogic] {final_message}", flush=True)
+                logger.info(final_message)
                 return json.dumps({"status": "OK", "message": final_message})
             else:
                 # Las copias físicas podrían estar eliminadas pero los metadatos no.
                 err_msg = f"Crítico: Las copias físicas del respaldo ID {instance_id} pueden haber sido eliminadas, pero falló la eliminación de sus metadatos de la BD: {message_db}"
-                print(f"[ServiceLogic] {err_msg}", flush=True)
+                logger.error(err_msg)
                 return json.dumps({"status": "ERROR", "message": err_msg})
 
         except json.JSONDecodeError:
             return json.dumps({"status": "ERROR", "message": "Payload JSON malformado para delete_backup."})
         except Exception as e:
-            print(f"[ServiceLogic] Error inesperado durante delete_backup para instancia ID {payload.get('instance_id', 'desconocida')}: {e}", flush=True)
+            logger.error("Error inesperado durante delete_backup para instancia ID %s: %s", payload.get('instance_id', 'desconocida'), e)
             import traceback
             traceback.print_exc()
             return json.dumps({"status": "ERROR", "message": f"Error interno del servidor al procesar delete_backup: {str(e)}"})
@@ -189,37 +201,13 @@ def main():
     """
     Punto de entrada principal. Inicia y mantiene el servicio en ejecución.
     """
-    print(f"--- Iniciando lógica de negocio del servicio: {SERVICE_NAME} ---", flush=True)
+    configure_logging(SERVICE_NAME)
+    logger.info("--- Iniciando lógica de negocio del servicio: %s ---", SERVICE_NAME)
     
-    # Bucle infinito principal para garantizar la resiliencia del servicio.
-    # Si la conexión con el bus se pierde, intentará reconectarse.
-    while True:
-        connector = ServiceConnector(BUS_HOST, BUS_PORT, SERVICE_NAME)
-        try:
-            # Establece la conexión y se registra en el bus.
-            connector.connect_and_register()
-            
-            # Bucle secundario para atender múltiples peticiones en una misma conexión.
-            while True:
-                # Esperar un trabajo (llamada bloqueante).
-                data_received = connector.wait_for_transaction()
-                if data_received is None: 
-                    print("[ServiceLogic] El bus cerró la conexión, se intentará reconectar.", flush=True)
-                    break # Salir del bucle interno para forzar la reconexión.
-                
-                # Procesar el trabajo.
-                response_data = process_request(data_received)
-                
-                # Enviar la respuesta.
-                connector.send_response(response_data)
-
-        except Exception as e:
-            print(f"[ServiceLogic] Error: {e}. Reintentando en 5 segundos...", flush=True)
-        finally:
-            # Asegura que la conexión se cierre limpiamente antes de reintentar.
-            connector.close()
-        
-        time.sleep(5)
+    # Se registran SERVICE_WORKERS conexiones con el bus. Cada trabajador espera
+    # un trabajo, lo procesa y envía la respuesta, y si la conexión con el bus
+    # se pierde, intentará reconectarse.
+    ServiceWorkerPool(BUS_HOST, BUS_PORT, SERVICE_NAME, process_request, workers=SERVICE_WORKERS).run()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
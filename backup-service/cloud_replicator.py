@@ -0,0 +1,209 @@
+# backup-service/cloud_replicator.py
+"""
+Replicación asíncrona a la nube.
+
+Con CLOUD_REPLICATION_MODE=async, backup-service confirma un respaldo en cuanto
+las copias primaria y secundaria están en disco y deja la subida a la nube de
+cada archivo al replicador, que la hace en segundo plano con varios hilos,
+reintentando con espera exponencial. La cola persistente es la propia base de
+datos: save_backup_records guarda esos archivos con BackedUpFiles.cloud_status
+"pending" en la misma transacción que el respaldo, y el replicador registra ahí
+cada resultado ("retrying" o "replicated"). En memoria solo se mantiene un
+índice de las tareas ordenado por su próximo intento, que al iniciar el servicio
+se reconstruye desde la base de datos; encolar no escribe en disco.
+
+Todas las instancias de una estructura se suben a la misma ruta en la nube, así
+que las tareas de una misma ruta se procesan de a una, y la tarea de una versión
+que ya tiene otra más nueva en una instancia posterior se descarta ("superseded"):
+un reintento tardío de la versión vieja sobrescribiría la nueva.
+"""
+import heapq
+import itertools
+import threading
+import time
+from bus_connector import get_logger
+from db_handler import get_cloud_status, get_pending_cloud_files, set_cloud_status
+
+logger = get_logger("CloudReplicator")
+
+RETRY_BASE_DELAY = 5.0
+RETRY_MAX_DELAY = 600.0
+
+
+class CloudReplicator:
+    """
+    Cola de subidas a la nube y los hilos que la procesan.
+
+    Cada tarea es un diccionario con 'instance_id', 'relative_path', 'structure',
+    'hash' y, si el archivo se guardó por trozos, 'chunks'.
+    """
+    def __init__(self, upload, workers=2):
+        """
+        Args:
+            upload (callable): Recibe una tarea y devuelve (éxito, respuesta), como upload_to_cloud.
+            workers (int): Subidas simultáneas como máximo.
+        """
+        self.upload = upload
+        self.workers = workers
+        self._condition = threading.Condition()
+        self._heap = [] # (próximo intento, orden de llegada, tarea)
+        self._order = itertools.count()
+        self._queued = set() # (instance_id, relative_path) de las tareas en la cola o en proceso
+        self._busy_paths = {} # Ruta en la nube que se está subiendo -> tareas de esa ruta en espera
+        self._stopped = False
+        self._threads = []
+
+    def queue_length(self):
+        """Cantidad de tareas en la cola (incluidas las que se están procesando)."""
+        with self._condition:
+            return len(self._queued)
+
+    def _push(self, job):
+        """Agrega una tarea al índice; debe llamarse con el lock tomado."""
+        heapq.heappush(self._heap, (job["next_attempt"], next(self._order), job))
+        self._condition.notify()
+
+    def enqueue(self, job):
+        """
+        Agrega una tarea a la cola. El archivo ya debe estar registrado como pendiente
+        en la base de datos, que es la que conserva la tarea si el servicio se detiene.
+        """
+        key = (job["instance_id"], job["relative_path"])
+        with self._condition:
+            if key in self._queued:
+                return
+            self._queued.add(key)
+            self._push(dict(job, attempts=0, next_attempt=0))
+
+    def reconcile(self):
+        """
+        Encola los archivos que la base de datos marca como no replicados (ej. los
+        que quedaron pendientes cuando se detuvo el servicio).
+        """
+        requeued = 0
+        for job in get_pending_cloud_files():
+            if (job["instance_id"], job["relative_path"]) not in self._queued:
+                self.enqueue(job)
+                requeued += 1
+        if requeued:
+            logger.warning("%s archivo(s) pendientes de replicar en la nube se volvieron a encolar.", requeued)
+
+    def _claim(self):
+        """
+        Espera hasta tomar la tarea cuyo próximo intento vence primero, entre las de
+        rutas en la nube que no se están subiendo en otro hilo.
+
+        Returns:
+            dict: La tarea, o None si el replicador se detuvo.
+        """
+        with self._condition:
+            while not self._stopped:
+                if self._heap and self._heap[0][0] <= time.time():
+                    job = heapq.heappop(self._heap)[2]
+                    cloud_path = (job["structure"], job["relative_path"])
+                    if cloud_path in self._busy_paths:
+                        # Vuelve al índice cuando termine la tarea de la misma ruta.
+                        self._busy_paths[cloud_path].append(job)
+                        continue
+                    self._busy_paths[cloud_path] = []
+                    return job
+                timeout = self._heap[0][0] - time.time() if self._heap else None
+                self._condition.wait(timeout)
+        return None
+
+    def _finish(self, job, retry_at=None):
+        """Libera la ruta de una tarea procesada y la vuelve a encolar si debe reintentarse."""
+        with self._condition:
+            for waiting_job in self._busy_paths.pop((job["structure"], job["relative_path"]), []):
+                self._push(waiting_job)
+            if retry_at is None:
+                self._queued.discard((job["instance_id"], job["relative_path"]))
+            else:
+                job["next_attempt"] = retry_at
+                self._push(job)
+
+    def _process(self, job):
+        """
+        Procesa una tarea.
+
+        Returns:
+            float: Momento (time.time()) del próximo intento, o None si la tarea terminó.
+        """
+        status = get_cloud_status(job["instance_id"], job["relative_path"])
+        if status == "superseded":
+            # Una instancia posterior tiene otra versión en la misma ruta de la nube.
+            set_cloud_status(job["instance_id"], job["relative_path"], "superseded")
+            logger.debug("Replicación de '%s' (instancia %s) descartada: hay una versión más nueva.",
+                         job["relative_path"], job["instance_id"])
+            return None
+        if status is None or status == "replicated":
+            # La instancia se eliminó o el archivo ya se replicó: la tarea ya no hace falta.
+            return None
+
+        try:
+            uploaded, r_content = self.upload(job)
+        except Exception as e:
+            uploaded, r_content = False, str(e)
+
+        if uploaded:
+            set_cloud_status(job["instance_id"], job["relative_path"], "replicated")
+            logger.debug("Archivo '%s' de la instancia %s replicado en la nube.", job["relative_path"], job["instance_id"])
+            return None
+
+        job["attempts"] += 1
+        delay = min(RETRY_BASE_DELAY * 2 ** (job["attempts"] - 1), RETRY_MAX_DELAY)
+        set_cloud_status(job["instance_id"], job["relative_path"], "retrying")
+        logger.warning("Fallo al replicar '%s' (instancia %s, intento %s), se reintentará en %.0f s: %s",
+                       job["relative_path"], job["instance_id"], job["attempts"], delay, r_content)
+        return time.time() + delay
+
+    def _worker_loop(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                return
+            retry_at = None
+            try:
+                retry_at = self._process(job)
+            except Exception as e:
+                # Ej. la base de datos no está disponible: la tarea se reintenta más tarde.
+                logger.error("Error al procesar la replicación de '%s' (instancia %s): %s",
+                             job["relative_path"], job["instance_id"], e)
+                retry_at = time.time() + RETRY_BASE_DELAY
+            finally:
+                self._finish(job, retry_at)
+
+    def _reconcile_loop(self):
+        """Reintenta la reconciliación hasta lograrla (ej. si la base de datos aún no está disponible)."""
+        delay = RETRY_BASE_DELAY
+        while True:
+            try:
+                self.reconcile()
+                return
+            except Exception as e:
+                logger.error("No se pudo reconciliar la cola de replicación con la base de datos, se reintentará en %.0f s: %s", delay, e)
+            with self._condition:
+                if self._condition.wait_for(lambda: self._stopped, delay):
+                    return
+            delay = min(delay * 2, RETRY_MAX_DELAY)
+
+    def start(self):
+        """Reconcilia la cola con la base de datos e inicia los hilos del replicador."""
+        try:
+            self.reconcile()
+        except Exception as e:
+            logger.error("No se pudo reconciliar la cola de replicación con la base de datos: %s", e)
+            threading.Thread(target=self._reconcile_loop, name="cloud-replicator-reconcile", daemon=True).start()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"cloud-replicator-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Replicador a la nube iniciado con %s hilo(s); %s tarea(s) en cola.", self.workers, self.queue_length())
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
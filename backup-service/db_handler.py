@@ -2,6 +2,9 @@
 import psycopg
 import os
 from datetime import datetime
+from bus_connector import get_logger
+
+logger = get_logger("DBHandler")
 
 def get_db_connection():
     """Crea y retorna una nueva conexión a la base de datos."""
@@ -9,9 +12,58 @@ def get_db_connection():
         conn_string = f"dbname='{os.getenv('DB_NAME')}' user='{os.getenv('DB_USER')}' host='{os.getenv('DB_HOST')}' password='{os.getenv('DB_PASS')}'"
         return psycopg.connect(conn_string)
     except psycopg.OperationalError as e:
-        print(f"[DBHandler] Error al conectar: {e}")
+        logger.error("Error al conectar: %s", e)
         return None
 
+def get_latest_instance_files(structure, auto_job_id=None):
+    """
+    Obtiene los archivos del respaldo más reciente con la misma estructura (y del
+    mismo trabajo automático, si se indica), para decidir qué archivos cambiaron.
+
+    Returns:
+        dict: Ruta relativa -> {'hash', 'size', 'mtime', 'cloud_status'} y, si el archivo se guardó
+              por trozos, 'chunks' ([[hash, tamaño], ...]). Vacío si no hay un
+              respaldo anterior o si no se pudo consultar la base de datos.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        return {}
+
+    try:
+        with conn.cursor() as cur:
+            query = "SELECT id FROM BackupInstances WHERE user_defined_structure = %s"
+            params = [structure]
+            if auto_job_id is not None:
+                query += " AND auto_job_id = %s"
+                params.append(auto_job_id)
+            query += " ORDER BY timestamp DESC, id DESC LIMIT 1"
+            cur.execute(query, tuple(params))
+            result = cur.fetchone()
+            if not result:
+                return {}
+
+            cur.execute(
+                "SELECT path_within_source, file_hash, size, mtime, cloud_status FROM BackedUpFiles WHERE backup_instance_id = %s",
+                (result[0],)
+            )
+            files = {row[0]: {"hash": row[1], "size": row[2], "mtime": row[3], "cloud_status": row[4]} for row in cur.fetchall()}
+
+            cur.execute("""
+                SELECT f.path_within_source, c.chunk_hash, c.size
+                FROM FileChunks c JOIN BackedUpFiles f ON f.id = c.backed_up_file_id
+                WHERE f.backup_instance_id = %s
+                ORDER BY f.id, c.chunk_index
+            """, (result[0],))
+            for path, chunk_hash, chunk_size in cur.fetchall():
+                files[path].setdefault("chunks", []).append([chunk_hash, chunk_size])
+            return files
+    except Exception as e:
+        logger.error("Error al obtener el respaldo anterior de '%s': %s", structure, e)
+        return {}
+    finally:
+        if conn:
+            conn.close()
+
 def save_backup_records(structure, files_metadata, auto_job_id=None):
     """
     Guarda los registros de un nuevo respaldo en la base de datos.
@@ -22,8 +74,14 @@ def save_backup_records(structure, files_metadata, auto_job_id=None):
     Args:
         structure (str): La estructura de directorios definida por el usuario.
         files_metadata (list): Una lista de diccionarios, donde cada uno
-                               contiene 'relative_path', 'hash' y 'size'.
+                               contiene 'relative_path', 'hash', 'size' y,
+                               opcionalmente, 'mtime', 'chunks' ([[hash, tamaño], ...]),
+                               'cloud_status' (por defecto 'replicated') y el códec de
+                               almacenamiento: 'compression' o, por trozos, 'chunk_compression'.
         auto_job_id (int, optional): El ID del trabajo automático que originó este respaldo.
+
+    Returns:
+        int: El ID de la instancia creada.
     """
     conn = get_db_connection()
     if conn is None:
@@ -42,31 +100,156 @@ def save_backup_records(structure, files_metadata, auto_job_id=None):
                 (datetime.now(), total_size, structure, auto_job_id)
             )
             instance_id = cur.fetchone()[0]
-            print(f"[DBHandler] Creada BackupInstance con ID: {instance_id}, AutoJob ID: {auto_job_id}", flush=True)
+            logger.info("Creada BackupInstance con ID: %s, AutoJob ID: %s", instance_id, auto_job_id)
+
+            # Los IDs de los archivos se reservan de una vez para poder enlazar sus trozos, y las
+            # filas se envían con COPY: el tiempo no depende de ida y vuelta por archivo.
+            cur.execute(
+                "SELECT nextval(pg_get_serial_sequence('BackedUpFiles', 'id')) FROM generate_series(1, %s)",
+                (len(files_metadata),)
+            )
+            file_ids = [row[0] for row in cur.fetchall()]
 
-            for file_meta in files_metadata:
-                print(f"[DBHandler] Insertando registro para: {file_meta['relative_path']}", flush=True)
-                cur.execute(
-                    "INSERT INTO BackedUpFiles (backup_instance_id, path_within_source, size, file_hash) VALUES (%s, %s, %s, %s)",
-                    (
+            # Todos los archivos de un respaldo nuevo tienen referencias en el almacén de objetos.
+            with cur.copy("COPY BackedUpFiles (id, backup_instance_id, path_within_source, size, file_hash, mtime, cloud_status, compression, object_refs) FROM STDIN") as copy:
+                for file_id, file_meta in zip(file_ids, files_metadata):
+                    copy.write_row((
+                        file_id,
                         instance_id,
                         file_meta['relative_path'],
                         file_meta['size'],
-                        file_meta['hash']
-                    )
-                )
+                        file_meta['hash'],
+                        file_meta.get('mtime'),
+                        file_meta.get('cloud_status', 'replicated'),
+                        file_meta['compression'] if 'compression' in file_meta else 'none',
+                        True
+                    ))
+
+            with cur.copy("COPY FileChunks (backed_up_file_id, chunk_index, chunk_hash, size, compression) FROM STDIN") as copy:
+                for file_id, file_meta in zip(file_ids, files_metadata):
+                    chunks = file_meta.get('chunks') or []
+                    codecs = file_meta.get('chunk_compression') or ['none'] * len(chunks)
+                    for index, ((chunk_hash, chunk_size), codec) in enumerate(zip(chunks, codecs)):
+                        copy.write_row((file_id, index, chunk_hash, chunk_size, codec))
             
-            print(f"[DBHandler] Insertados {len(files_metadata)} registros en BackedUpFiles.", flush=True)
+            logger.info("Insertados %s registros en BackedUpFiles.", len(files_metadata))
             
             # Confirmar todos los cambios en la base de datos, si no hay errores.
             conn.commit()
-            return True
+            return instance_id
             
     except Exception as e:
         # Si ocurre cualquier error, revertir todos los cambios de esta transacción.
-        print(f"[DBHandler] Error al guardar registros, revirtiendo transacción: {e}", flush=True)
+        logger.error("Error al guardar registros, revirtiendo transacción: %s", e)
         conn.rollback()
         raise e # Relanzar la excepción para que el servicio principal la maneje.
     finally:
         if conn:
-            conn.close()
\ No newline at end of file
+            conn.close()
+
+def get_cloud_status(instance_id, relative_path):
+    """
+    Obtiene el estado de replicación en la nube de un archivo respaldado.
+
+    Todas las instancias de una estructura se suben a la misma ruta en la nube
+    (<estructura>/<ruta relativa>), así que un archivo aún no replicado del que ya
+    existe una versión en una instancia posterior de la misma estructura se
+    informa como 'superseded': subirlo sobrescribiría la versión más nueva.
+
+    Returns:
+        str: 'pending', 'retrying', 'replicated' o 'superseded', o None si el
+             archivo (o su instancia) ya no existe.
+
+    Raises:
+        Exception: Si no se pudo consultar la base de datos.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        raise Exception("No se pudo conectar a la base de datos para consultar el estado de replicación.")
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT f.cloud_status, EXISTS (
+                    SELECT 1 FROM BackedUpFiles newer JOIN BackupInstances newer_bi ON newer_bi.id = newer.backup_instance_id
+                    WHERE newer_bi.user_defined_structure = bi.user_defined_structure
+                      AND newer.path_within_source = f.path_within_source
+                      AND newer.backup_instance_id > f.backup_instance_id
+                )
+                FROM BackedUpFiles f JOIN BackupInstances bi ON bi.id = f.backup_instance_id
+                WHERE f.backup_instance_id = %s AND f.path_within_source = %s
+            """, (instance_id, relative_path))
+            result = cur.fetchone()
+            if result is None:
+                return None
+            cloud_status, has_newer_version = result
+            return "superseded" if has_newer_version and cloud_status != "replicated" else cloud_status
+    finally:
+        conn.close()
+
+def set_cloud_status(instance_id, relative_path, status):
+    """
+    Actualiza el estado de replicación en la nube de un archivo respaldado.
+
+    Raises:
+        Exception: Si no se pudo actualizar la base de datos.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        raise Exception("No se pudo conectar a la base de datos para actualizar el estado de replicación.")
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE BackedUpFiles SET cloud_status = %s WHERE backup_instance_id = %s AND path_within_source = %s",
+                (status, instance_id, relative_path)
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def get_pending_cloud_files():
+    """
+    Obtiene los archivos respaldados que aún no se replicaron en la nube.
+
+    Returns:
+        list: Diccionarios con 'instance_id', 'relative_path', 'structure', 'hash'
+              y 'chunks' ([[hash, tamaño], ...] o None).
+
+    Raises:
+        Exception: Si no se pudo consultar la base de datos.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        raise Exception("No se pudo conectar a la base de datos para obtener los archivos pendientes de replicar.")
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT f.id, f.backup_instance_id, f.path_within_source, bi.user_defined_structure, f.file_hash
+                FROM BackedUpFiles f JOIN BackupInstances bi ON bi.id = f.backup_instance_id
+                WHERE f.cloud_status IN ('pending', 'retrying')
+                ORDER BY f.id
+            """)
+            files = {row[0]: {"instance_id": row[1], "relative_path": row[2], "structure": row[3], "hash": row[4], "chunks": None}
+                     for row in cur.fetchall()}
+            if not files:
+                return []
+
+            cur.execute("""
+                SELECT c.backed_up_file_id, c.chunk_hash, c.size
+                FROM FileChunks c JOIN BackedUpFiles f ON f.id = c.backed_up_file_id
+                WHERE f.cloud_status IN ('pending', 'retrying')
+                ORDER BY c.backed_up_file_id, c.chunk_index
+            """)
+            for file_id, chunk_hash, chunk_size in cur.fetchall():
+                if file_id in files:
+                    if files[file_id]["chunks"] is None:
+                        files[file_id]["chunks"] = []
+                    files[file_id]["chunks"].append([chunk_hash, chunk_size])
+            return list(files.values())
+    finally:
+        conn.close()
@@ -0,0 +1,220 @@
+# backup-service/object_store.py
+"""
+Almacén de objetos direccionado por contenido para las copias locales.
+
+Cada contenido se guarda una sola vez, con su SHA-256 como nombre
+(objects/ab/abcdef...), junto a un contador de referencias (abcdef....refs)
+con la cantidad de archivos respaldados que lo usan. Si se guardó comprimido,
+el nombre lleva el códec (objects/ab/abcdef....zlib; ver
+common_package/object_storage). Las instancias de
+respaldo solo referencian objetos, así que el espacio ocupado crece con el
+contenido único y no con la cantidad de respaldos.
+
+Todo se escribe primero en un archivo temporal del mismo volumen, se sincroniza
+con el disco (fsync) y recién entonces se renombra a su nombre definitivo, así
+que tras una caída un objeto o contador está completo o no existe.
+"""
+import os
+import tempfile
+import threading
+from bus_connector import get_logger
+from object_storage import OBJECTS_DIR, STORAGE_CODEC_NONE, choose_storage_codec, find_object, object_path, open_objects, storage_compressor
+
+logger = get_logger("ObjectStore")
+
+REFS_SUFFIX = ".refs"
+COPY_BUFFER_SIZE = 1024 * 1024
+
+def fsync_dir(path):
+    """Sincroniza con el disco una carpeta, para que sobreviva a una caída el renombre de un archivo en ella."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ObjectStore:
+    """
+    Almacén de objetos con conteo de referencias en una carpeta (ej. /data/local_copy).
+
+    Es seguro entre los trabajadores (hilos) del servicio, que es el único que
+    escribe en él.
+    """
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self._tmp_dir = os.path.join(base_dir, OBJECTS_DIR, "tmp")
+        self._lock = threading.Lock()
+
+    def path(self, file_hash, codec=STORAGE_CODEC_NONE):
+        return object_path(self.base_dir, file_hash, codec)
+
+    def find(self, file_hash):
+        """
+        Returns:
+            str: Códec con que está guardado el objeto, o None si no está en el almacén.
+        """
+        found = find_object(self.base_dir, file_hash)
+        return found[1] if found else None
+
+    def open_reader(self, file_hashes, hasher=None):
+        """
+        Abre para lectura, ya descomprimido, el contenido de uno o más objetos
+        consecutivos (un archivo completo o los trozos de un archivo).
+
+        Raises:
+            FileNotFoundError: Si algún objeto no está en el almacén.
+        """
+        found = [find_object(self.base_dir, file_hash) for file_hash in file_hashes]
+        if None in found:
+            raise FileNotFoundError(f"Faltan objetos en {self.base_dir}.")
+        return open_objects(found, hasher)
+
+    def temp_file(self):
+        """Abre un archivo temporal en el mismo volumen del almacén, para luego moverlo con put_file."""
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=self._tmp_dir, delete=False)
+
+    def clean_temp(self):
+        """
+        Borra los archivos temporales que quedaron de copias interrumpidas. Solo debe
+        llamarse al iniciar el servicio, antes de atender solicitudes.
+
+        Returns:
+            int: Cantidad de archivos borrados.
+        """
+        if not os.path.isdir(self._tmp_dir):
+            return 0
+        names = os.listdir(self._tmp_dir)
+        for name in names:
+            os.remove(os.path.join(self._tmp_dir, name))
+        if names:
+            logger.warning("Se borraron %s archivo(s) temporales de copias interrumpidas en %s.", len(names), self.base_dir)
+        return len(names)
+
+    def _read_refs(self, file_hash):
+        try:
+            with open(self.path(file_hash) + REFS_SUFFIX) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_refs(self, file_hash, count):
+        refs_path = self.path(file_hash) + REFS_SUFFIX
+        with open(refs_path + ".tmp", "w") as f:
+            f.write(str(count))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(refs_path + ".tmp", refs_path)
+
+    def add_ref(self, file_hash):
+        """
+        Suma una referencia a un objeto ya guardado.
+
+        Returns:
+            str: Códec con que está guardado el objeto, o None si no está en el almacén.
+        """
+        with self._lock:
+            codec = self.find(file_hash)
+            if codec is not None:
+                self._write_refs(file_hash, self._read_refs(file_hash) + 1)
+            return codec
+
+    def put_file(self, temp_path, file_hash, codec=STORAGE_CODEC_NONE):
+        """
+        Guarda un archivo temporal (de temp_file o write_temp) como el objeto
+        file_hash, comprimido con `codec`, y le suma una referencia. Si el objeto ya
+        existía, el archivo temporal se descarta.
+
+        Returns:
+            str: Códec con que quedó guardado el objeto (el del existente, si ya estaba).
+        """
+        with self._lock:
+            stored_codec = self.find(file_hash)
+            if stored_codec is None:
+                stored_codec = codec
+                path = self.path(file_hash, codec)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
+            else:
+                os.remove(temp_path)
+                logger.debug("Objeto %s ya existente en %s, solo se suma una referencia.", file_hash, self.base_dir)
+            self._write_refs(file_hash, self._read_refs(file_hash) + 1)
+            fsync_dir(os.path.dirname(self.path(file_hash)))
+        return stored_codec
+
+    def write_temp(self, stream, compression=STORAGE_CODEC_NONE):
+        """
+        Copia el contenido de un objeto tipo archivo a un archivo temporal del
+        almacén (para luego guardarlo con put_file), por bloques de
+        COPY_BUFFER_SIZE y sincronizado con el disco. Lo comprime con `compression`
+        si su primer bloque se reduce lo suficiente.
+
+        Returns:
+            tuple: (ruta del archivo temporal, códec usado).
+        """
+        temp_file = self.temp_file()
+        try:
+            with temp_file:
+                block = stream.read(COPY_BUFFER_SIZE)
+                codec = choose_storage_codec(block, compression)
+                compressor = storage_compressor(codec)
+                while block:
+                    temp_file.write(compressor.compress(block) if compressor else block)
+                    block = stream.read(COPY_BUFFER_SIZE)
+                if compressor:
+                    temp_file.write(compressor.flush())
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+        except Exception:
+            os.remove(temp_file.name)
+            raise
+        return temp_file.name, codec
+
+    def copy_from(self, source_path, file_hash, codec=STORAGE_CODEC_NONE):
+        """
+        Suma una referencia al objeto file_hash, copiándolo tal cual (guardado con
+        `codec`) desde source_path solo si aún no existe en este almacén.
+
+        Returns:
+            str: Códec con que quedó guardado el objeto.
+        """
+        stored_codec = self.add_ref(file_hash)
+        if stored_codec is not None:
+            return stored_codec
+        with open(source_path, "rb") as source:
+            temp_path, _ = self.write_temp(source)
+        try:
+            return self.put_file(temp_path, file_hash, codec)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def release(self, file_hash):
+        """
+        Quita una referencia al objeto y lo borra cuando ya nadie lo usa.
+
+        Returns:
+            bool: True si el objeto se borró (False si aún tiene referencias o si no estaba en el almacén).
+        """
+        with self._lock:
+            count = self._read_refs(file_hash) - 1
+            if count > 0:
+                self._write_refs(file_hash, count)
+                return False
+            deleted = False
+            codec = self.find(file_hash)
+            if codec is not None:
+                try:
+                    os.remove(self.path(file_hash, codec))
+                    deleted = True
+                except FileNotFoundError:
+                    pass
+            try:
+                os.remove(self.path(file_hash) + REFS_SUFFIX)
+            except FileNotFoundError:
+                pass
+        if deleted:
+            logger.debug("Objeto %s eliminado de %s.", file_hash, self.base_dir)
+        return deleted
@@ -0,0 +1,109 @@
+# backup-service/replication.py
+"""
+Copia en paralelo de un contenido a varios destinos (copia primaria, copia
+secundaria y nube).
+
+El contenido recibido se lee una sola vez: cada bloque se entrega a todos los
+destinos, que lo consumen al mismo tiempo desde hilos de un ThreadPoolExecutor.
+Así la latencia de cada archivo es la del destino más lento y no la suma de
+todos. Las colas entre la lectura y cada destino son acotadas, por lo que la
+memoria usada no depende del tamaño del archivo.
+"""
+import hashlib
+import queue
+from concurrent.futures import wait
+
+# Bloques en tránsito hacia cada destino.
+FEED_QUEUE_SIZE = 8
+FEED_PUT_TIMEOUT = 0.1
+
+
+class ReplicaFeed:
+    """Objeto tipo archivo del que un destino lee los bloques que entrega fan_out."""
+    def __init__(self):
+        self._queue = queue.Queue(FEED_QUEUE_SIZE)
+        self._pending = b""
+        self._eof = False
+        # El destino terminó (bien o con error) y ya no leerá más bloques.
+        self.abandoned = False
+
+    def put(self, block):
+        """
+        Entrega un bloque al destino: b"" indica el fin del contenido y None que la
+        lectura del origen falló. Si el destino ya terminó, el bloque se descarta.
+        """
+        while not self.abandoned:
+            try:
+                self._queue.put(block, timeout=FEED_PUT_TIMEOUT)
+                return
+            except queue.Full:
+                continue
+
+    def read(self, size=-1):
+        parts = [self._pending]
+        length = len(self._pending)
+        while not self._eof and (size < 0 or length < size):
+            block = self._queue.get()
+            if block is None:
+                raise IOError("Se interrumpió la lectura del contenido de origen.")
+            if not block:
+                self._eof = True
+                break
+            parts.append(block)
+            length += len(block)
+
+        data = b"".join(parts)
+        if size < 0:
+            self._pending = b""
+            return data
+        self._pending = data[size:]
+        return data[:size]
+
+def _consume(feed, consumer):
+    try:
+        return consumer(feed)
+    finally:
+        feed.abandoned = True
+
+def fan_out(source, buffer_size, consumers, pool):
+    """
+    Lee un objeto tipo archivo una sola vez, calculando su SHA-256, y entrega su
+    contenido a varios destinos que se ejecutan en paralelo.
+
+    Args:
+        source (io.BufferedIOBase): Contenido a copiar.
+        buffer_size (int): Tamaño de los bloques leídos.
+        consumers (list): Funciones que reciben un objeto tipo archivo con el
+                          contenido y devuelven un resultado.
+        pool (concurrent.futures.Executor): Donde se ejecutan los destinos.
+
+    Returns:
+        tuple: (hash, tamaño en bytes, [(resultado, excepción o None), ...]) con un
+               elemento por destino, en el orden de `consumers`. Se espera a que
+               todos terminen.
+    """
+    feeds = [ReplicaFeed() for _ in consumers]
+    futures = [pool.submit(_consume, feed, consumer) for feed, consumer in zip(feeds, consumers)]
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        for block in iter(lambda: source.read(buffer_size), b""):
+            hasher.update(block)
+            size += len(block)
+            for feed in feeds:
+                feed.put(block)
+    except BaseException:
+        for feed in feeds:
+            feed.put(None)
+        wait(futures)
+        raise
+    for feed in feeds:
+        feed.put(b"")
+
+    outcomes = []
+    for future in futures:
+        try:
+            outcomes.append((future.result(), None))
+        except Exception as e:
+            outcomes.append((None, e))
+    return hasher.hexdigest(), size, outcomes
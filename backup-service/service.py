@@ -1,32 +1,547 @@
 import os
-import time
 import base64
 import json
 import hashlib
+import io
+import threading
+import time
 import uuid
-from bus_connector import ServiceConnector, transact
-from db_handler import save_backup_records
+from concurrent.futures import ThreadPoolExecutor
+from bus_connector import ServiceWorkerPool, configure_logging, get_logger, register_gauge, transact
+from object_storage import STORAGE_CODECS
+from cloud_replicator import CloudReplicator
+from db_handler import get_latest_instance_files, save_backup_records
+from object_store import ObjectStore
+from replication import fan_out
+from tx_journal import TransactionJournal
 
 BUS_HOST = os.getenv("BUS_HOST")
-BUS_PORT = 5000
+BUS_PORT = int(os.getenv("BUS_PORT", 5000))
 SERVICE_NAME = os.getenv("SERVICE_NAME", "bkpsv")
+# Número de conexiones (trabajadores) que el servicio registra en el bus.
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "1"))
+
+logger = get_logger("ServiceLogic")
+
+# Directorios de las copias primaria y secundaria (volúmenes distintos en compose.yaml).
+LOCAL_COPY_DIR = os.getenv("LOCAL_COPY_DIR", "/data/local_copy")
+SECONDARY_COPY_DIR = os.getenv("SECONDARY_COPY_DIR", "/data/secondary_copy")
+# Las copias se guardan una sola vez por contenido (SHA-256), con conteo de referencias.
+primary_store = ObjectStore(LOCAL_COPY_DIR)
+secondary_store = ObjectStore(SECONDARY_COPY_DIR)
+
+# Tamaño de los bloques usados al copiar y hashear archivos recibidos en modo flujo.
+COPY_BUFFER_SIZE = 1024 * 1024
+# Códec con que se comprimen las copias locales ("zlib", "lzma", "bz2" o "none"). El
+# contenido que no se reduce al comprimirlo se guarda sin comprimir.
+STORAGE_COMPRESSION = os.getenv("STORAGE_COMPRESSION", "zlib")
+if STORAGE_COMPRESSION not in STORAGE_CODECS:
+    raise ValueError(f"STORAGE_COMPRESSION inválido: '{STORAGE_COMPRESSION}'. Valores posibles: {', '.join(STORAGE_CODECS)}.")
+
+# Hilos que escriben en paralelo las copias primaria y secundaria y suben a la nube
+# (hasta tres destinos por cada archivo en proceso).
+replication_pool = ThreadPoolExecutor(max_workers=SERVICE_WORKERS * 3, thread_name_prefix=f"{SERVICE_NAME}-replica")
 
-# Diccionario para manejar transacciones activas
+# "sync": cada archivo se sube a la nube antes de confirmarlo (la transacción falla si la
+# subida falla). "async": el respaldo se confirma cuando ambas copias locales están en
+# disco y la subida queda pendiente en la BD, que el replicador procesa aparte.
+CLOUD_REPLICATION_MODE = os.getenv("CLOUD_REPLICATION_MODE", "sync")
+# Subidas simultáneas a la nube del replicador.
+CLOUD_REPLICATION_WORKERS = int(os.getenv("CLOUD_REPLICATION_WORKERS", "2"))
+
+# Diccionario para manejar transacciones activas. Lo modifican los trabajadores y el
+# recolector de transacciones abandonadas: las altas y bajas se hacen con el lock.
 active_transactions = {}
+transactions_lock = threading.Lock()
+register_gauge("active_transactions", lambda: len(active_transactions))
+# Las transacciones en curso se guardan también en disco, para retomarlas si el servicio se reinicia.
+TX_JOURNAL_DIR = os.getenv("TX_JOURNAL_DIR", os.path.join(LOCAL_COPY_DIR, "transactions"))
+journal = TransactionJournal(TX_JOURNAL_DIR, {"primary": primary_store, "secondary": secondary_store})
+
+# Las transacciones sin actividad durante TX_IDLE_TTL segundos (ej. el cliente se cayó
+# después de begin_backup) se revierten en segundo plano cada TX_REAPER_INTERVAL segundos.
+TX_IDLE_TTL = int(os.getenv("TX_IDLE_TTL", "3600"))
+TX_REAPER_INTERVAL = int(os.getenv("TX_REAPER_INTERVAL", "60"))
+# Límites de transacciones abiertas y de bytes recibidos por transacciones aún no confirmadas.
+MAX_OPEN_TRANSACTIONS = int(os.getenv("MAX_OPEN_TRANSACTIONS", "64"))
+MAX_BUFFERED_BYTES = int(os.getenv("MAX_BUFFERED_BYTES", str(50 * 1024 * 1024 * 1024)))
+
+def buffered_bytes():
+    """Bytes recibidos por las transacciones abiertas, que aún no pertenecen a ningún respaldo."""
+    return sum(tx_data["buffered_bytes"] for tx_data in list(active_transactions.values()))
+
+reaped_transactions = {"count": 0, "bytes": 0}
+register_gauge("buffered_bytes", buffered_bytes)
+register_gauge("reaped_transactions", lambda: reaped_transactions["count"])
+register_gauge("reaped_bytes", lambda: reaped_transactions["bytes"])
+
+class Base64Reader:
+    """
+    Objeto tipo archivo que decodifica un texto base64 por bloques a medida que se
+    lee, sin tener el contenido decodificado completo en memoria.
+    """
+    def __init__(self, encoded):
+        self._encoded = encoded
+        self._position = 0
+
+    def read(self, size=-1):
+        # Cada 4 caracteres base64 son 3 bytes: se decodifican grupos completos.
+        length = len(self._encoded) - self._position if size < 0 else max(size // 3, 1) * 4
+        block = self._encoded[self._position:self._position + length]
+        self._position += len(block)
+        return base64.b64decode(block)
 
-def cleanup_temp_files(temp_files_list):
-    """Elimina una lista de archivos temporales."""
-    print(f"[ServiceLogic] Limpiando {len(temp_files_list)} archivos temporales...", flush=True)
-    for f_path in temp_files_list:
+def release_objects(object_refs):
+    """Quita las referencias [(almacén, hash), ...] tomadas por una transacción que se revierte."""
+    logger.info("Liberando %s referencias a objetos...", len(object_refs))
+    for store, file_hash in object_refs:
         try:
-            if os.path.exists(f_path):
-                os.remove(f_path)
-                print(f"  Eliminado: {f_path}", flush=True)
+            store.release(file_hash)
         except Exception as e:
-            print(f"  Error al eliminar {f_path}: {e}", flush=True)
+            logger.error("Error al liberar el objeto %s en %s: %s", file_hash, store.base_dir, e)
+
+def file_objects(file_meta):
+    """Hashes de los objetos que guardan un archivo: sus trozos o, si se guardó completo, su propio hash."""
+    chunks = file_meta.get('chunks')
+    return [chunk_hash for chunk_hash, _ in chunks] if chunks else [file_meta['hash']]
+
+def reference_stored_object(file_hash, object_refs):
+    """
+    Suma una referencia a un objeto que ya está en el almacén primario, copiándolo
+    al secundario si le falta. Las referencias tomadas se agregan a object_refs.
+
+    Returns:
+        bool: False si el objeto no está en el almacén primario.
+    """
+    codec = primary_store.add_ref(file_hash)
+    if codec is None:
+        return False
+    object_refs.append((primary_store, file_hash))
+    secondary_store.copy_from(primary_store.path(file_hash, codec), file_hash, codec)
+    object_refs.append((secondary_store, file_hash))
+    return True
+
+def store_received_content(file_stream, object_refs, cloud_target=None):
+    """
+    Guarda contenido recibido en ambos almacenes (comprimido con STORAGE_COMPRESSION
+    si conviene) y, si se indica, lo sube a la nube sin comprimir. Las tres copias se
+    hacen en paralelo mientras se calcula el hash del contenido. Las referencias
+    tomadas en los almacenes se agregan a object_refs.
+
+    Args:
+        file_stream (io.BufferedIOBase): Contenido recibido.
+        object_refs (list): Referencias tomadas, para liberarlas si se revierte.
+        cloud_target (tuple, optional): (estructura, ruta relativa) en la nube.
+
+    Returns:
+        tuple: (hash, tamaño en bytes, resultado de upload_to_cloud o None).
+    """
+    stores = (primary_store, secondary_store)
+    consumers = [lambda stream, store=store: store.write_temp(stream, STORAGE_COMPRESSION) for store in stores]
+    if cloud_target is not None:
+        consumers.append(lambda stream: upload_to_cloud(*cloud_target, stream))
 
-def process_request(data_received):
-    """Maneja los comandos del flujo transaccional de respaldo."""
+    file_hash, file_size, outcomes = fan_out(file_stream, COPY_BUFFER_SIZE, consumers, replication_pool)
+    try:
+        for _, error in outcomes:
+            if error is not None:
+                raise error
+        for store, ((temp_path, codec), _) in zip(stores, outcomes):
+            store.put_file(temp_path, file_hash, codec)
+            object_refs.append((store, file_hash))
+    finally:
+        # Archivos temporales que no llegaron a guardarse porque otra copia falló.
+        for result, _ in outcomes[:len(stores)]:
+            if result and os.path.exists(result[0]):
+                os.remove(result[0])
+    return file_hash, file_size, outcomes[2][0] if cloud_target is not None else None
+
+def upload_to_cloud(structure, relative_path, file_stream):
+    """
+    Sube un archivo al cloud-service en <estructura>/<ruta relativa>.
+
+    Returns:
+        tuple: (True si la subida fue exitosa, respuesta del cloud-service).
+    """
+    cloud_target_path = os.path.join(structure, relative_path).replace("\\", "/")
+    _, r_status, r_content = transact(BUS_HOST, BUS_PORT, "clcsv", f"upload|{cloud_target_path}", body=file_stream)
+    # El bus puede no devolver OK en r_status
+    return r_status == "OK" and not (r_content and r_content.strip().startswith("Error")), r_content
+
+def upload_files_to_cloud(structure, files, file_stream):
+    """
+    Sube varios archivos al cloud-service en una sola solicitud (comando upload_files).
+
+    Args:
+        structure (str): Estructura del respaldo.
+        files (list): Tuplas (ruta relativa, tamaño en bytes), en el orden del contenido.
+        file_stream (io.BufferedIOBase): Contenidos de los archivos, concatenados.
+
+    Returns:
+        list: Una tupla (True si la subida fue exitosa, respuesta del cloud-service) por archivo.
+    """
+    request = {"files": [{"path": os.path.join(structure, relative_path).replace("\\", "/"), "size": size}
+                         for relative_path, size in files]}
+    _, r_status, r_content = transact(BUS_HOST, BUS_PORT, "clcsv", f"upload_files|{json.dumps(request)}", body=file_stream)
+    try:
+        response = json.loads(r_content) if r_status == "OK" else None
+    except json.JSONDecodeError:
+        response = None # Texto de error del bus o del cloud-service
+    if not isinstance(response, dict) or response.get("status") != "OK" or len(response.get("files", [])) != len(files):
+        return [(False, r_content)] * len(files)
+    return [(result["status"] == "OK", result["message"]) for result in response["files"]]
+
+def replicate_to_cloud(job):
+    """
+    Sube a la nube un archivo de la cola de replicación, leyéndolo (completo o desde
+    sus trozos) del primer almacén que tenga todos sus objetos.
+
+    Returns:
+        tuple: (True si la subida fue exitosa, respuesta del cloud-service).
+    """
+    for store in (primary_store, secondary_store):
+        try:
+            reader = store.open_reader(file_objects(job))
+            break
+        except FileNotFoundError:
+            continue
+    else:
+        return False, f"Los objetos de '{job['relative_path']}' no están en ningún almacén local."
+
+    try:
+        return upload_to_cloud(job["structure"], job["relative_path"], reader)
+    finally:
+        reader.close()
+
+replicator = CloudReplicator(replicate_to_cloud, workers=CLOUD_REPLICATION_WORKERS)
+register_gauge("cloud_queue_length", replicator.queue_length)
+
+def enqueue_cloud_replication(instance_id, structure, processed_files):
+    """
+    Encola la subida a la nube de los archivos de una instancia que aún no están
+    replicados. Solo los agrega a la cola en memoria: ya quedaron como pendientes
+    en la BD al guardar el respaldo.
+    """
+    for file_meta in processed_files:
+        if file_meta.get("cloud_status", "replicated") == "replicated":
+            continue
+        replicator.enqueue({
+            "instance_id": instance_id,
+            "relative_path": file_meta["relative_path"],
+            "structure": structure,
+            "hash": file_meta["hash"],
+            "chunks": file_meta.get("chunks")
+        })
+
+def acquire_transaction(tx_id):
+    """
+    Marca una transacción como en uso por la solicitud que la recibió y renueva su
+    actividad. El recolector no revierte las transacciones en uso.
+
+    Returns:
+        dict: Estado de la transacción, o None si no existe.
+    """
+    if not isinstance(tx_id, str):
+        return None
+    with transactions_lock:
+        tx_data = active_transactions.get(tx_id)
+        if tx_data is not None:
+            tx_data["in_use"] += 1
+            tx_data["last_activity"] = time.monotonic()
+        return tx_data
+
+def release_transaction(tx_data):
+    """Quita la marca de uso puesta por acquire_transaction."""
+    with transactions_lock:
+        tx_data["in_use"] -= 1
+        tx_data["last_activity"] = time.monotonic()
+
+def touch_streamed_transaction(header):
+    """
+    Renueva la actividad de la transacción de una subida en modo flujo cada vez que
+    llega uno de sus trozos, para que una subida lenta pero activa no se revierta.
+
+    Args:
+        header (str): Cabecera del flujo ("comando|{...}").
+    """
+    try:
+        payload = json.loads(header.split('|', 1)[1])
+    except (IndexError, ValueError):
+        return
+    tx_id = payload.get('transaction_id') if isinstance(payload, dict) else None
+    if not isinstance(tx_id, str):
+        return
+    with transactions_lock:
+        tx_data = active_transactions.get(tx_id)
+        if tx_data is not None:
+            tx_data["last_activity"] = time.monotonic()
+
+def reap_idle_transactions():
+    """
+    Revierte las transacciones sin actividad hace más de TX_IDLE_TTL segundos, igual
+    que un end_backup fallido: libera sus referencias a objetos y borra su diario.
+    Las transacciones con una solicitud en curso no se revierten.
+    """
+    now = time.monotonic()
+    with transactions_lock:
+        reaped = [(tx_id, tx_data) for tx_id, tx_data in active_transactions.items()
+                  if tx_data["in_use"] == 0 and now - tx_data["last_activity"] >= TX_IDLE_TTL]
+        for tx_id, _ in reaped:
+            del active_transactions[tx_id]
+
+    for tx_id, tx_data in reaped:
+        logger.warning("Transacción %s abandonada (sin actividad hace %.0f s). Iniciando rollback...",
+                       tx_id, now - tx_data["last_activity"])
+        release_objects(tx_data["object_refs"])
+        journal.remove(tx_id)
+        reaped_transactions["count"] += 1
+        reaped_transactions["bytes"] += tx_data["buffered_bytes"]
+
+def run_transaction_reaper():
+    """Bucle del hilo que revierte periódicamente las transacciones abandonadas."""
+    while True:
+        time.sleep(TX_REAPER_INTERVAL)
+        try:
+            reap_idle_transactions()
+        except Exception as e:
+            logger.error("Error al revertir transacciones abandonadas: %s", e)
+
+def check_buffer_limit(tx_id):
+    """
+    Devuelve la respuesta de error si las transacciones abiertas ya superan
+    MAX_BUFFERED_BYTES, o None. La transacción no se marca como fallida: el
+    cliente puede reintentar más tarde.
+    """
+    total = buffered_bytes()
+    if total < MAX_BUFFERED_BYTES:
+        return None
+    logger.warning("Archivo rechazado para tx %s: las transacciones abiertas ya suman %s bytes.", tx_id, total)
+    return json.dumps({"status": "ERROR", "message": f"Límite de datos en transacciones abiertas alcanzado ({MAX_BUFFERED_BYTES} bytes); reintente más tarde."})
+
+def fail_transaction(tx_id, tx_data):
+    """Marca una transacción como fallida, también en el diario."""
+    tx_data["status"] = "failed"
+    try:
+        journal.failed(tx_id)
+    except Exception as e:
+        logger.error("No se pudo registrar en el diario el fallo de la transacción %s: %s", tx_id, e)
+
+def validate_upload(tx_id, tx_data, relative_path):
+    """
+    Comprueba que la transacción acepte el archivo. Devuelve la respuesta a enviar
+    sin procesarlo (un error, u OK si el archivo ya se procesó: el cliente lo repite
+    al retomar un respaldo), o None si es válido.
+    """
+    if not tx_data:
+        return json.dumps({"status": "ERROR", "message": f"ID de transacción '{tx_id}' no encontrado o inválido."})
+    if tx_data["status"] == "failed":
+        return json.dumps({"status": "ERROR", "message": f"Transacción '{tx_id}' ya está marcada como fallida."})
+    if relative_path not in tx_data["expected_files"]:
+        if any(file_meta["relative_path"] == relative_path for file_meta in tx_data["processed_files_db_meta"]):
+            return json.dumps({"status": "OK", "file_processed": relative_path})
+        fail_transaction(tx_id, tx_data) # Marcar como fallida si se recibe archivo inesperado
+        return json.dumps({"status": "ERROR", "message": f"Archivo '{relative_path}' no esperado en la transacción '{tx_id}'."})
+    return None
+
+def complete_chunked_file(tx_id, tx_data, relative_path):
+    """
+    Termina un archivo recibido por trozos, cuando todos están en los almacenes:
+    lo sube completo a la nube (en modo sync), reconstruyéndolo desde sus trozos,
+    y comprueba que coincida con el hash del archivo.
+    """
+    chunked_file = tx_data["chunked_files"].pop(relative_path)
+    hasher = hashlib.sha256()
+    reader = primary_store.open_reader([chunk_hash for chunk_hash, _ in chunked_file["chunks"]], hasher)
+    try:
+        if CLOUD_REPLICATION_MODE == "sync":
+            uploaded, r_content = upload_to_cloud(tx_data['structure'], relative_path, reader)
+        else:
+            # La subida queda para el replicador; solo se lee el archivo para verificar su hash.
+            for _ in iter(lambda: reader.read(COPY_BUFFER_SIZE), b""):
+                pass
+            uploaded, r_content = True, None
+    finally:
+        reader.close()
+
+    if not uploaded:
+        fail_transaction(tx_id, tx_data)
+        return json.dumps({"status": "ERROR", "message": f"Fallo en la copia a la nube para '{relative_path}': {r_content}"})
+    if hasher.hexdigest() != chunked_file["hash"]:
+        fail_transaction(tx_id, tx_data)
+        return json.dumps({"status": "ERROR", "message": f"El archivo '{relative_path}' reconstruido desde sus trozos no coincide con su hash."})
+
+    file_meta = {
+        "relative_path": relative_path,
+        "hash": chunked_file["hash"],
+        "size": chunked_file["size"],
+        "mtime": tx_data["expected_files"].pop(relative_path),
+        "chunks": chunked_file["chunks"],
+        "cloud_status": "replicated" if CLOUD_REPLICATION_MODE == "sync" else "pending"
+    }
+    tx_data["processed_files_db_meta"].append(file_meta)
+    journal.file_processed(tx_id, file_meta, [])
+    logger.debug("Archivo '%s' procesado por trozos (%s trozos).", relative_path, len(chunked_file["chunks"]))
+    return json.dumps({"status": "OK", "file_processed": relative_path})
+
+def process_file_group(tx_id, tx_data, files, file_stream):
+    """
+    Procesa los archivos de un upload_files: guarda cada uno en ambos almacenes y,
+    en modo sync, los sube juntos a la nube con una sola solicitud al cloud-service.
+    Los archivos procesados se registran en el diario con una sola escritura.
+
+    Un error en un archivo marca la transacción como fallida, como en upload_file.
+
+    Args:
+        tx_id (str): ID de la transacción.
+        tx_data (dict): Estado de la transacción.
+        files (list): [{"relative_path", "size"}, ...], en el orden del contenido.
+        file_stream (io.BufferedIOBase): Contenidos de los archivos, concatenados.
+
+    Returns:
+        list: La respuesta de cada archivo, como la de upload_file, en el mismo orden.
+    """
+    sync_cloud = CLOUD_REPLICATION_MODE == "sync"
+    results = [None] * len(files)
+    stored = [] # (posición, metadatos, referencias) de los archivos ya guardados en los almacenes
+    for i, entry in enumerate(files):
+        relative_path = entry.get('relative_path')
+        size = entry.get('size')
+        # El contenido se lee siempre, para que los archivos siguientes queden alineados.
+        content = file_stream.read(size) if isinstance(size, int) and size >= 0 else None
+        error_response = validate_upload(tx_id, tx_data, relative_path)
+        if not error_response and any(file_meta["relative_path"] == relative_path for _, file_meta, _ in stored):
+            fail_transaction(tx_id, tx_data)
+            error_response = json.dumps({"status": "ERROR", "message": f"Archivo '{relative_path}' repetido en la transacción '{tx_id}'."})
+        if not error_response and (content is None or len(content) != size):
+            fail_transaction(tx_id, tx_data)
+            error_response = json.dumps({"status": "ERROR", "message": f"Contenido incompleto para '{relative_path}' en la transacción '{tx_id}'."})
+        if error_response:
+            results[i] = json.loads(error_response)
+            continue
+
+        object_refs = []
+        try:
+            file_hash, file_size, _ = store_received_content(io.BytesIO(content), object_refs)
+        except Exception as e:
+            fail_transaction(tx_id, tx_data)
+            release_objects(object_refs)
+            results[i] = {"status": "ERROR", "message": f"Error procesando archivo '{relative_path}': {str(e)}"}
+            continue
+        stored.append((i, {
+            "relative_path": relative_path,
+            "hash": file_hash,
+            "size": file_size,
+            "mtime": tx_data["expected_files"][relative_path],
+            "cloud_status": "replicated" if sync_cloud else "pending"
+        }, object_refs))
+
+    if tx_data["status"] == "failed":
+        # Otro archivo del grupo hizo fallar la transacción: no tiene sentido subir los demás.
+        for i, _, object_refs in stored:
+            release_objects(object_refs)
+            results[i] = {"status": "ERROR", "message": f"Transacción '{tx_id}' ya está marcada como fallida."}
+        return results
+
+    cloud_results = [(True, None)] * len(stored)
+    if sync_cloud and stored:
+        # Una sola subida a la nube para todo el grupo, leyendo los archivos ya guardados.
+        reader = primary_store.open_reader([file_meta["hash"] for _, file_meta, _ in stored])
+        try:
+            cloud_results = upload_files_to_cloud(tx_data['structure'],
+                                                  [(file_meta["relative_path"], file_meta["size"]) for _, file_meta, _ in stored], reader)
+        except Exception as e:
+            cloud_results = [(False, str(e))] * len(stored)
+        finally:
+            reader.close()
+
+    processed = []
+    for (i, file_meta, object_refs), (uploaded, r_content) in zip(stored, cloud_results):
+        if uploaded:
+            processed.append((i, file_meta, object_refs))
+            continue
+        fail_transaction(tx_id, tx_data)
+        release_objects(object_refs)
+        results[i] = {"status": "ERROR", "message": f"Fallo en la copia a la nube para '{file_meta['relative_path']}': {r_content}"}
+
+    try:
+        if processed:
+            journal.files_processed(tx_id, [(file_meta, object_refs) for _, file_meta, object_refs in processed])
+    except Exception as e:
+        fail_transaction(tx_id, tx_data)
+        for i, file_meta, object_refs in processed:
+            release_objects(object_refs)
+            results[i] = {"status": "ERROR", "message": f"Error procesando archivo '{file_meta['relative_path']}': {str(e)}"}
+        return results
+
+    for i, file_meta, object_refs in processed:
+        tx_data["processed_files_db_meta"].append(file_meta)
+        tx_data["object_refs"].extend(object_refs)
+        tx_data["buffered_bytes"] += file_meta["size"]
+        del tx_data["expected_files"][file_meta["relative_path"]]
+        results[i] = {"status": "OK", "file_processed": file_meta["relative_path"]}
+    return results
+
+def record_compression(file_meta):
+    """
+    Agrega a los metadatos de un archivo, para guardarlos en la BD, el códec de sus
+    objetos en el almacén primario: 'compression' si se guardó completo o
+    'chunk_compression' (uno por trozo) si se guardó por trozos.
+    """
+    if file_meta.get('chunks'):
+        file_meta['compression'] = None
+        file_meta['chunk_compression'] = [primary_store.find(chunk_hash) for chunk_hash, _ in file_meta['chunks']]
+    else:
+        file_meta['compression'] = primary_store.find(file_meta['hash'])
+
+def is_unchanged(file_meta, previous):
+    """
+    Indica si un archivo de begin_backup es igual al del respaldo anterior: mismo
+    tamaño y mismo hash o, si el cliente no envió el hash, misma fecha de modificación.
+    """
+    if previous is None or file_meta.get('size') is None or file_meta['size'] != previous['size']:
+        return False
+    if file_meta.get('hash'):
+        return file_meta['hash'] == previous['hash']
+    return file_meta.get('mtime') is not None and file_meta['mtime'] == previous['mtime']
+
+def reference_unchanged_file(tx_data, file_meta, previous):
+    """
+    Registra en la transacción un archivo sin cambios, referenciando los objetos
+    del respaldo anterior en ambos almacenes en lugar de recibirlo otra vez.
+
+    Returns:
+        bool: False si algún objeto ya no está en el almacén y hay que subir el archivo.
+    """
+    object_refs = []
+    try:
+        for file_hash in file_objects(previous):
+            if not reference_stored_object(file_hash, object_refs):
+                release_objects(object_refs)
+                return False
+    except Exception:
+        release_objects(object_refs)
+        raise
+
+    tx_data["object_refs"].extend(object_refs)
+    tx_data["processed_files_db_meta"].append({
+        "relative_path": file_meta['relative_path'],
+        "hash": previous['hash'],
+        "size": previous['size'],
+        "mtime": file_meta.get('mtime'),
+        "chunks": previous.get('chunks'),
+        # Si el archivo anterior aún no llegó a la nube, este también queda pendiente.
+        "cloud_status": "replicated" if previous.get('cloud_status', "replicated") == "replicated" else "pending"
+    })
+    return True
+
+def process_request(data_received, body=None):
+    """
+    Maneja los comandos del flujo transaccional de respaldo.
+
+    Args:
+        data_received (str): Comando y payload JSON ("comando|{...}").
+        body (io.BufferedIOBase, optional): Contenido del archivo recibido en modo flujo.
+    """
     try:
         command, json_payload_str = data_received.split('|', 1)
         payload = json.loads(json_payload_str)
@@ -35,177 +550,350 @@ def process_request(data_received):
     except json.JSONDecodeError:
         return json.dumps({"status": "ERROR", "message": "Payload JSON malformado."})
 
+    # Toda solicitud sobre una transacción la mantiene activa y en uso mientras se
+    # procesa, para que el recolector no la revierta a mitad de camino, y toma su
+    # lock: las solicitudes de una misma transacción (ej. una subida repetida al
+    # retomar un respaldo) se procesan de a una.
+    touched_tx = acquire_transaction(payload.get('transaction_id')) if isinstance(payload, dict) else None
+    try:
+        if touched_tx is None:
+            return handle_command(command, payload, body)
+        with touched_tx["lock"]:
+            return handle_command(command, payload, body)
+    finally:
+        if touched_tx is not None:
+            release_transaction(touched_tx)
+
+def handle_command(command, payload, body):
+    """Ejecuta un comando ya separado de su payload por process_request."""
     if command == "begin_backup":
+        object_refs = []
+        tx_id = uuid.uuid4().hex
+        tx_data = {
+            "structure": None,
+            "expected_files": {},  # Ruta relativa -> mtime enviado por el cliente
+            "processed_files_db_meta": [],
+            "object_refs": object_refs,
+            "chunked_files": {},  # Ruta relativa -> archivo que se está recibiendo por trozos
+            "status": "pending",
+            "auto_job_id": None,
+            "buffered_bytes": 0,  # Bytes recibidos (archivos y trozos nuevos)
+            "last_activity": time.monotonic(),
+            "in_use": 1,  # Solicitudes en curso sobre la transacción
+            "lock": threading.Lock()  # Lo toma cada solicitud sobre la transacción (ver process_request)
+        }
+        with transactions_lock:
+            if len(active_transactions) >= MAX_OPEN_TRANSACTIONS:
+                return json.dumps({"status": "ERROR", "message": f"Demasiadas transacciones abiertas ({MAX_OPEN_TRANSACTIONS}); reintente más tarde."})
+            # El lugar se reserva antes de preparar la transacción, para no superar el límite.
+            active_transactions[tx_id] = tx_data
         try:
             structure = payload['structure']
             files_to_backup = payload['files_to_backup']
             auto_job_id = payload.get('auto_job_id')
-            
-            tx_id = uuid.uuid4().hex
-            active_transactions[tx_id] = {
-                "structure": structure,
-                "expected_files": set(f['relative_path'] for f in files_to_backup),
-                "processed_files_db_meta": [],
-                "temp_files_on_disk": [],
-                "status": "pending",
-                "auto_job_id": auto_job_id
-            }
-            print(f"[ServiceLogic] Transacción {tx_id} iniciada para {len(files_to_backup)} archivos. AutoJob ID: {auto_job_id}", flush=True)
-            return json.dumps({"status": "OK", "transaction_id": tx_id})
+            tx_data["structure"] = structure
+            tx_data["auto_job_id"] = auto_job_id
+
+            # Respaldo incremental: los archivos iguales a los del respaldo anterior de la misma
+            # estructura se registran por referencia y no se vuelven a subir.
+            can_compare = any(f.get('hash') or f.get('mtime') is not None for f in files_to_backup)
+            previous_files = get_latest_instance_files(structure, auto_job_id) if can_compare else {}
+            for file_meta in files_to_backup:
+                previous = previous_files.get(file_meta['relative_path'])
+                if is_unchanged(file_meta, previous) and reference_unchanged_file(tx_data, file_meta, previous):
+                    continue
+                tx_data["expected_files"][file_meta['relative_path']] = file_meta.get('mtime')
+
+            journal.begin(tx_id, tx_data)
+            unchanged_count = len(tx_data["processed_files_db_meta"])
+            logger.info("Transacción %s iniciada para %s archivos (%s sin cambios). AutoJob ID: %s",
+                        tx_id, len(files_to_backup), unchanged_count, auto_job_id)
+            return json.dumps({"status": "OK", "transaction_id": tx_id,
+                               "files_to_upload": list(tx_data["expected_files"]), "unchanged_files": unchanged_count})
         except Exception as e:
+            with transactions_lock:
+                active_transactions.pop(tx_id, None)
+            release_objects(object_refs) # Referencias a archivos sin cambios tomadas antes del error
             return json.dumps({"status": "ERROR", "message": f"Error al iniciar respaldo: {str(e)}"})
+        finally:
+            release_transaction(tx_data)
 
     elif command == "upload_file":
         tx_id = payload.get('transaction_id')
         tx_data = active_transactions.get(tx_id)
-
-        if not tx_data:
-            return json.dumps({"status": "ERROR", "message": f"ID de transacción '{tx_id}' no encontrado o inválido."})
-        if tx_data["status"] == "failed":
-            return json.dumps({"status": "ERROR", "message": f"Transacción '{tx_id}' ya está marcada como fallida."})
-
         relative_path = payload['relative_path']
-        if relative_path not in tx_data["expected_files"]:
-             tx_data["status"] = "failed" # Marcar como fallida si se recibe archivo inesperado
-             return json.dumps({"status": "ERROR", "message": f"Archivo '{relative_path}' no esperado en la transacción '{tx_id}'."})
+        error_response = validate_upload(tx_id, tx_data, relative_path)
+        if error_response:
+            return error_response
 
-        file_content_b64 = payload['content_b64']
-        created_files_for_this_upload = []
-        try:
-            file_bytes = base64.b64decode(file_content_b64)
-            file_hash = hashlib.sha256(file_bytes).hexdigest()
-            file_size = len(file_bytes)
-
-            # Asegurar que las rutas usen separadores internos consistentes
-            safe_relative_path = relative_path.replace("\\", "/")
-            base_backup_path = tx_data['structure'].replace("\\", "/")
-            
-            # Crear copias locales
-            # Usar os.path.join para construir rutas de forma segura
-            local_copy_dir = os.path.join("/data/local_copy", base_backup_path, os.path.dirname(safe_relative_path))
-            local_path = os.path.join(local_copy_dir, os.path.basename(safe_relative_path))
-            
-            secondary_copy_dir = os.path.join("/data/secondary_copy", base_backup_path, os.path.dirname(safe_relative_path))
-            secondary_path = os.path.join(secondary_copy_dir, os.path.basename(safe_relative_path))
+        limit_response = check_buffer_limit(tx_id)
+        if limit_response:
+            return limit_response
 
-            os.makedirs(os.path.dirname(local_path), exist_ok=True)
-            with open(local_path, "wb") as f: f.write(file_bytes)
-            created_files_for_this_upload.append(local_path)
+        # El contenido llega como bytes crudos (trama binaria o modo flujo); 'content_b64' se
+        # mantiene por compatibilidad con clientes que lo envían dentro del JSON.
+        file_stream = body if body is not None else Base64Reader(payload['content_b64'])
+        object_refs_for_this_upload = []
+        try:
+            # Copias primaria y secundaria y, en modo sync, subida a la nube, en paralelo.
+            sync_cloud = CLOUD_REPLICATION_MODE == "sync"
+            file_hash, file_size, cloud_result = store_received_content(
+                file_stream, object_refs_for_this_upload,
+                cloud_target=(tx_data['structure'], relative_path) if sync_cloud else None)
+            uploaded, r_content = cloud_result if sync_cloud else (True, None)
 
-            os.makedirs(os.path.dirname(secondary_path), exist_ok=True)
-            with open(secondary_path, "wb") as f: f.write(file_bytes)
-            created_files_for_this_upload.append(secondary_path)
-            
-            # Llamar al servicio de nube
-            cloud_target_path = os.path.join(base_backup_path, safe_relative_path).replace("\\", "/")
-            cloud_payload_str = f"upload|{cloud_target_path}|{file_content_b64}"
-            _, r_status, r_content = transact(BUS_HOST, BUS_PORT, "clcsv", cloud_payload_str)
-            
-            if r_status != "OK" or (r_content and r_content.strip().startswith("Error")): # El bus puede no devolver OK en r_status
+            if not uploaded:
                 # Si la subida a la nube falla, la transacción entera falla.
-                tx_data["status"] = "failed"
-                cleanup_temp_files(created_files_for_this_upload) # Limpiar solo los de este intento
+                fail_transaction(tx_id, tx_data)
+                release_objects(object_refs_for_this_upload) # Liberar solo los de este intento
                 return json.dumps({"status": "ERROR", "message": f"Fallo en la copia a la nube para '{relative_path}': {r_content}"})
 
-            tx_data["processed_files_db_meta"].append({
+            file_meta = {
                 "relative_path": relative_path, # Usar la original que el cliente envió
                 "hash": file_hash,
-                "size": file_size
-            })
-            tx_data["temp_files_on_disk"].extend(created_files_for_this_upload)
-            tx_data["expected_files"].remove(relative_path)
+                "size": file_size,
+                "mtime": tx_data["expected_files"][relative_path],
+                "cloud_status": "replicated" if sync_cloud else "pending"
+            }
+            journal.file_processed(tx_id, file_meta, object_refs_for_this_upload)
+            tx_data["processed_files_db_meta"].append(file_meta)
+            tx_data["object_refs"].extend(object_refs_for_this_upload)
+            tx_data["buffered_bytes"] += file_size
+            del tx_data["expected_files"][relative_path]
             
-            print(f"[ServiceLogic] Archivo '{relative_path}' procesado para tx {tx_id}.", flush=True)
+            logger.debug("Archivo '%s' procesado para tx %s.", relative_path, tx_id)
             return json.dumps({"status": "OK", "file_processed": relative_path})
 
         except Exception as e:
-            tx_data["status"] = "failed"
-            cleanup_temp_files(created_files_for_this_upload) # Limpiar si se crearon antes del error
+            fail_transaction(tx_id, tx_data)
+            release_objects(object_refs_for_this_upload) # Liberar si se tomaron antes del error
             return json.dumps({"status": "ERROR", "message": f"Error procesando archivo '{relative_path}': {str(e)}"})
 
+    elif command == "upload_files":
+        # Espera payload: {"transaction_id", "files": [{"relative_path", "size"}, ...]} y, como cuerpo, los
+        # contenidos de los archivos concatenados en ese orden. Permite subir muchos archivos pequeños
+        # en una sola solicitud; responde con el resultado de cada archivo, en el mismo orden.
+        tx_id = payload.get('transaction_id')
+        tx_data = active_transactions.get(tx_id)
+        files = payload.get('files')
+        if not tx_data:
+            return json.dumps({"status": "ERROR", "message": f"ID de transacción '{tx_id}' no encontrado o inválido."})
+        if tx_data["status"] == "failed":
+            return json.dumps({"status": "ERROR", "message": f"Transacción '{tx_id}' ya está marcada como fallida."})
+        if not isinstance(files, list) or not all(isinstance(file_meta, dict) for file_meta in files):
+            return json.dumps({"status": "ERROR", "message": "Payload incorrecto para upload_files. Se requiere una lista 'files'."})
+
+        limit_response = check_buffer_limit(tx_id)
+        if limit_response:
+            return limit_response
+
+        results = process_file_group(tx_id, tx_data, files, body if body is not None else io.BytesIO())
+        failed_count = sum(1 for result in results if result["status"] != "OK")
+        logger.debug("Grupo de %s archivo(s) procesado para tx %s (%s con error).", len(files), tx_id, failed_count)
+        if failed_count:
+            return json.dumps({"status": "ERROR", "message": f"Fallaron {failed_count} de {len(files)} archivos.", "files": results})
+        return json.dumps({"status": "OK", "files": results})
+
+    elif command == "upload_chunked_file":
+        # Espera payload: {"transaction_id", "relative_path", "hash", "size", "chunks": [[hash, tamaño], ...]}
+        # Responde con los trozos que faltan en el almacén, que se envían luego con upload_chunk.
+        tx_id = payload.get('transaction_id')
+        tx_data = active_transactions.get(tx_id)
+        relative_path = payload.get('relative_path')
+        error_response = validate_upload(tx_id, tx_data, relative_path)
+        if error_response:
+            return error_response
+
+        chunks = payload.get('chunks')
+        chunked_file = tx_data["chunked_files"].get(relative_path)
+        if chunked_file and chunked_file["hash"] == payload.get('hash') and chunked_file["chunks"] == chunks:
+            # El cliente retoma un respaldo interrumpido: solo faltan los trozos aún no recibidos.
+            if not chunked_file["pending"]:
+                return complete_chunked_file(tx_id, tx_data, relative_path)
+            return json.dumps({"status": "OK", "missing_chunks": list(chunked_file["pending"])})
+        if chunked_file or not chunks or sum(size for _, size in chunks) != payload.get('size'):
+            fail_transaction(tx_id, tx_data)
+            return json.dumps({"status": "ERROR", "message": f"Lista de trozos inválida para '{relative_path}' en la transacción '{tx_id}'."})
+
+        try:
+            # Los trozos que ya están guardados solo se referencian; se cuentan las apariciones de
+            # los que faltan porque un mismo trozo puede repetirse dentro del archivo.
+            missing_chunks = {}
+            refs_start = len(tx_data["object_refs"])
+            for chunk_hash, _ in chunks:
+                if chunk_hash in missing_chunks:
+                    missing_chunks[chunk_hash] += 1
+                elif not reference_stored_object(chunk_hash, tx_data["object_refs"]):
+                    missing_chunks[chunk_hash] = 1
+
+            chunked_file = {"hash": payload['hash'], "size": payload['size'], "chunks": chunks, "pending": missing_chunks}
+            journal.chunked_file(tx_id, relative_path, chunked_file, tx_data["object_refs"][refs_start:])
+            tx_data["chunked_files"][relative_path] = chunked_file
+            logger.debug("Archivo '%s' por trozos: faltan %s de %s.", relative_path, len(missing_chunks), len(chunks))
+            if not missing_chunks:
+                return complete_chunked_file(tx_id, tx_data, relative_path)
+            return json.dumps({"status": "OK", "missing_chunks": list(missing_chunks)})
+        except Exception as e:
+            fail_transaction(tx_id, tx_data)
+            return json.dumps({"status": "ERROR", "message": f"Error procesando los trozos de '{relative_path}': {str(e)}"})
+
+    elif command == "upload_chunk":
+        # Espera payload: {"transaction_id", "relative_path", "chunk_hash"} y el contenido del trozo como cuerpo.
+        tx_id = payload.get('transaction_id')
+        tx_data = active_transactions.get(tx_id)
+        relative_path = payload.get('relative_path')
+        chunk_hash = payload.get('chunk_hash')
+        if not tx_data:
+            return json.dumps({"status": "ERROR", "message": f"ID de transacción '{tx_id}' no encontrado o inválido."})
+        if tx_data["status"] == "failed":
+            return json.dumps({"status": "ERROR", "message": f"Transacción '{tx_id}' ya está marcada como fallida."})
+
+        chunked_file = tx_data["chunked_files"].get(relative_path)
+        if not chunked_file or chunk_hash not in chunked_file["pending"]:
+            fail_transaction(tx_id, tx_data)
+            return json.dumps({"status": "ERROR", "message": f"Trozo '{chunk_hash}' de '{relative_path}' no esperado en la transacción '{tx_id}'."})
+
+        limit_response = check_buffer_limit(tx_id)
+        if limit_response:
+            return limit_response
+
+        try:
+            refs_start = len(tx_data["object_refs"])
+            stored_hash, stored_size, _ = store_received_content(body if body is not None else io.BytesIO(), tx_data["object_refs"])
+            if stored_hash != chunk_hash:
+                fail_transaction(tx_id, tx_data)
+                return json.dumps({"status": "ERROR", "message": f"El trozo recibido de '{relative_path}' no coincide con su hash."})
+            for _ in range(chunked_file["pending"][chunk_hash] - 1):
+                reference_stored_object(chunk_hash, tx_data["object_refs"])
+            journal.chunk_stored(tx_id, relative_path, chunk_hash, stored_size, tx_data["object_refs"][refs_start:])
+            del chunked_file["pending"][chunk_hash]
+            tx_data["buffered_bytes"] += stored_size
+
+            if not chunked_file["pending"]:
+                return complete_chunked_file(tx_id, tx_data, relative_path)
+            return json.dumps({"status": "OK", "chunk_stored": chunk_hash})
+        except Exception as e:
+            fail_transaction(tx_id, tx_data)
+            return json.dumps({"status": "ERROR", "message": f"Error procesando un trozo de '{relative_path}': {str(e)}"})
+
+    elif command == "transaction_status":
+        # Espera payload: {"transaction_id"}. Permite al cliente retomar un respaldo interrumpido
+        # (ej. por un reinicio del servicio) subiendo solo los archivos que faltan.
+        tx_id = payload.get('transaction_id')
+        tx_data = active_transactions.get(tx_id)
+        if not tx_data:
+            return json.dumps({"status": "ERROR", "message": f"ID de transacción '{tx_id}' no encontrado o inválido."})
+        return json.dumps({"status": "OK", "transaction_id": tx_id, "state": tx_data["status"],
+                           "files_to_upload": list(tx_data["expected_files"]),
+                           "processed_files": len(tx_data["processed_files_db_meta"])})
+
     elif command == "end_backup":
         tx_id = payload.get('transaction_id')
-        # Pop para remover la transacción, ya sea éxito o fallo, se finaliza.
-        tx_data = active_transactions.pop(tx_id, None) 
+        # Pop para remover la transacción, ya sea éxito o fallo, se finaliza. Esta solicitud ya
+        # tiene el lock de la transacción (no hay otra procesándose), pero si otra espera su turno
+        # no se finaliza: lo que agregue no se confirmaría ni se liberaría.
+        with transactions_lock:
+            tx_data = active_transactions.get(tx_id) if isinstance(tx_id, str) else None
+            if tx_data is not None and tx_data["in_use"] > 1:
+                return json.dumps({"status": "ERROR", "message": f"La transacción '{tx_id}' tiene solicitudes en curso; reintente al terminar."})
+            if tx_data is not None:
+                del active_transactions[tx_id]
 
         if not tx_data:
             return json.dumps({"status": "ERROR", "message": f"ID de transacción '{tx_id}' no encontrado para finalizar."})
 
-        # Verificar si el cliente envió una señal de aborto explícita
-        client_aborted = payload.get("abort", False)
+        try:
+            # Verificar si el cliente envió una señal de aborto explícita
+            client_aborted = payload.get("abort", False)
 
-        if client_aborted:
-            tx_data["status"] = "failed"
-            print(f"[ServiceLogic] Transacción {tx_id} abortada por el cliente.", flush=True)
+            if client_aborted:
+                tx_data["status"] = "failed"
+                logger.warning("Transacción %s abortada por el cliente.", tx_id)
 
 
-        if tx_data["status"] == "failed" or len(tx_data["expected_files"]) > 0:
-            reason = "marcada como fallida" if tx_data["status"] == "failed" else f"faltan {len(tx_data['expected_files'])} archivos por subir"
-            print(f"[ServiceLogic] Transacción {tx_id} falló ({reason}). Iniciando rollback...", flush=True)
-            cleanup_temp_files(tx_data["temp_files_on_disk"])
-            return json.dumps({"status": "ERROR", "message": f"Proceso de respaldo falló y fue revertido. Causa: {reason}."})
+            if tx_data["status"] == "failed" or len(tx_data["expected_files"]) > 0:
+                reason = "marcada como fallida" if tx_data["status"] == "failed" else f"faltan {len(tx_data['expected_files'])} archivos por subir"
+                logger.error("Transacción %s falló (%s). Iniciando rollback...", tx_id, reason)
+                release_objects(tx_data["object_refs"])
+                return json.dumps({"status": "ERROR", "message": f"Proceso de respaldo falló y fue revertido. Causa: {reason}."})
         
-        try:
-            if not tx_data["processed_files_db_meta"]:
-                 # Esto podría pasar si no se subió ningún archivo con éxito pero la tx no se marcó como failed
-                 print(f"[ServiceLogic] Transacción {tx_id} finalizada sin archivos procesados para la BD.", flush=True)
-                 cleanup_temp_files(tx_data["temp_files_on_disk"]) # Limpiar por si acaso
-                 return json.dumps({"status": "OK", "message": "Respaldo finalizado, pero no se procesaron archivos para guardar en BD."})
-
-            save_backup_records(tx_data["structure"], tx_data["processed_files_db_meta"], auto_job_id=tx_data.get("auto_job_id"))
-            # Los archivos temporales ya no son "temporales" si la BD se actualizó, son las copias locales.
-            # No se borran en caso de éxito.
-            print(f"[ServiceLogic] Transacción {tx_id} completada exitosamente.", flush=True)
-            return json.dumps({"status": "OK", "message": f"Respaldo completado exitosamente ({len(tx_data['processed_files_db_meta'])} archivos)."})
-        except Exception as e:
-            print(f"[ServiceLogic] Error al guardar en BD para tx {tx_id}, revirtiendo: {e}", flush=True)
-            cleanup_temp_files(tx_data["temp_files_on_disk"])
-            # Truncar mensaje de error para que no exceda el límite del payload.
-            error_message = str(e)
-            detailed_error = f"Error al guardar en BD, cambios en disco revertidos. Causa: {error_message[:100]}"
-            return json.dumps({"status": "ERROR", "message": detailed_error})
+            try:
+                if not tx_data["processed_files_db_meta"]:
+                     # Esto podría pasar si no se subió ningún archivo con éxito pero la tx no se marcó como failed
+                     logger.info("Transacción %s finalizada sin archivos procesados para la BD.", tx_id)
+                     release_objects(tx_data["object_refs"]) # Liberar por si acaso
+                     return json.dumps({"status": "OK", "message": "Respaldo finalizado, pero no se procesaron archivos para guardar en BD."})
+
+                for file_meta in tx_data["processed_files_db_meta"]:
+                    record_compression(file_meta)
+                instance_id = save_backup_records(tx_data["structure"], tx_data["processed_files_db_meta"], auto_job_id=tx_data.get("auto_job_id"))
+                # Si la BD se actualizó, las referencias a los objetos pasan a ser las de la instancia.
+                # No se liberan en caso de éxito.
+                enqueue_cloud_replication(instance_id, tx_data["structure"], tx_data["processed_files_db_meta"])
+                logger.info("Transacción %s completada exitosamente.", tx_id)
+                return json.dumps({"status": "OK", "message": f"Respaldo completado exitosamente ({len(tx_data['processed_files_db_meta'])} archivos)."})
+            except Exception as e:
+                logger.error("Error al guardar en BD para tx %s, revirtiendo: %s", tx_id, e)
+                release_objects(tx_data["object_refs"])
+                # Truncar mensaje de error para que no exceda el límite del payload.
+                error_message = str(e)
+                detailed_error = f"Error al guardar en BD, cambios en disco revertidos. Causa: {error_message[:100]}"
+                return json.dumps({"status": "ERROR", "message": detailed_error})
+        finally:
+            # La transacción terminó (confirmada o revertida): ya no se puede retomar.
+            journal.remove(tx_id)
         
     elif command == "delete_local_files":
         try:
-            # Espera payload: {"structure": "backup_structure", "relative_paths": ["file1", "file2"]}
+            # Espera payload: {"structure": "backup_structure", "files": [{"relative_path": "file1", "hash": "...", "chunks": [...], "object_refs": true}, ...]}
+            # Solo se liberan las referencias de los archivos con "object_refs" (admin-service las marca
+            # una sola vez por instancia); los demás son copias por ruta de respaldos anteriores al almacén.
             instance_structure = payload.get("structure")
-            relative_paths = payload.get("relative_paths")
+            files = payload.get("files")
 
-            if not instance_structure or not isinstance(relative_paths, list):
-                return json.dumps({"status": "ERROR", "message": "Payload incorrecto para delete_local_files. Se requiere 'structure' y una lista 'relative_paths'."})
+            if not instance_structure or not isinstance(files, list):
+                return json.dumps({"status": "ERROR", "message": "Payload incorrecto para delete_local_files. Se requiere 'structure' y una lista 'files'."})
 
-            base_primary_path = "/data/local_copy"
-            base_secondary_path = "/data/secondary_copy"
-            
+            released_count = 0
             deleted_count = 0
             errors = []
 
-            for rel_path in relative_paths:
-                safe_rel_path = rel_path.replace("\\", "/") # Asegurar separadores
-                
-                path_primary = os.path.join(base_primary_path, instance_structure, safe_rel_path)
-                path_secondary = os.path.join(base_secondary_path, instance_structure, safe_rel_path)
+            for file_meta in files:
+                if not file_meta.get("object_refs"):
+                    # Los respaldos anteriores al almacén de objetos guardan copias por ruta.
+                    safe_rel_path = file_meta["relative_path"].replace("\\", "/") # Asegurar separadores
+                    for base_path in (LOCAL_COPY_DIR, SECONDARY_COPY_DIR):
+                        legacy_path = os.path.join(base_path, instance_structure, safe_rel_path)
+                        if os.path.exists(legacy_path):
+                            try:
+                                os.remove(legacy_path)
+                                logger.debug("Archivo local eliminado: %s", legacy_path)
+                                deleted_count += 1
+                            except Exception as e_del:
+                                err_msg = f"Error al eliminar archivo local '{legacy_path}': {str(e_del)}"
+                                logger.error(err_msg)
+                                errors.append(err_msg)
+                    continue
 
-                for p_to_delete in [path_primary, path_secondary]:
-                    if os.path.exists(p_to_delete):
+                # Quitar las referencias de la instancia a sus objetos (archivo o trozos) en cada almacén.
+                for store in (primary_store, secondary_store):
+                    for file_hash in file_objects(file_meta):
                         try:
-                            os.remove(p_to_delete)
-                            print(f"[ServiceLogic] Archivo local eliminado: {p_to_delete}", flush=True)
-                            deleted_count +=1 # Contar cada archivo físico eliminado
+                            released_count += 1
+                            if store.release(file_hash):
+                                deleted_count += 1 # Contar cada objeto físico eliminado
                         except Exception as e_del:
-                            err_msg = f"Error al eliminar archivo local '{p_to_delete}': {str(e_del)}"
-                            print(f"[ServiceLogic] {err_msg}", flush=True)
+                            err_msg = f"Error al liberar el objeto de '{file_meta['relative_path']}' en '{store.base_dir}': {str(e_del)}"
+                            logger.error(err_msg)
                             errors.append(err_msg)
-                    else:
-                        print(f"[ServiceLogic] Archivo local no encontrado para eliminar (puede ser normal si ya se borró o no existía): {p_to_delete}", flush=True)
 
             if not errors:
-                return json.dumps({"status": "OK", "message": f"Archivos locales procesados para eliminación. {deleted_count} archivos físicos eliminados."})
+                return json.dumps({"status": "OK", "message": f"Archivos locales procesados para eliminación. {released_count} referencias liberadas, {deleted_count} archivos físicos eliminados."})
             else:
                 return json.dumps({"status": "ERROR", "message": f"Se encontraron errores al eliminar archivos locales: {'; '.join(errors)}"})
 
         except Exception as e:
-            print(f"[ServiceLogic] Error inesperado en delete_local_files: {e}", flush=True)
+            logger.error("Error inesperado en delete_local_files: %s", e)
             return json.dumps({"status": "ERROR", "message": f"Error interno del servidor en delete_local_files: {str(e)}"})
     else:
         return json.dumps({"status": "ERROR", "message": f"Comando '{command}' no reconocido."})
@@ -213,28 +901,27 @@ def process_request(data_received):
 def main():
     """
     Punto de entrada principal. Inicia y mantiene el servicio en ejecución.
-    """
-    print(f"--- Iniciando lógica de negocio del servicio: {SERVICE_NAME} ---", flush=True)
-    
-    while True:
-        connector = ServiceConnector(BUS_HOST, BUS_PORT, SERVICE_NAME)
-        try:
-            connector.connect_and_register()
-            while True:
-                data_received = connector.wait_for_transaction()
-                if data_received is None: 
-                    print("[ServiceLogic] El bus cerró la conexión, se intentará reconectar.", flush=True)
-                    break
-                
-                response_data_json = process_request(data_received)
-                connector.send_response(response_data_json)
 
-        except Exception as e:
-            print(f"[ServiceLogic] Error en el bucle principal: {e}. Reintentando en 5 segundos...", flush=True)
-        finally:
-            connector.close()
-        
-        time.sleep(5)
+    El servicio registra SERVICE_WORKERS conexiones en el bus; cada una atiende
+    sus solicitudes en orden y se reconecta por su cuenta si se pierde.
+    """
+    configure_logging(SERVICE_NAME)
+    logger.info("--- Iniciando lógica de negocio del servicio: %s ---", SERVICE_NAME)
+    logger.info("Modo de replicación a la nube: %s", CLOUD_REPLICATION_MODE)
+    # Las copias a medio escribir cuando se detuvo el servicio no se pueden retomar: el
+    # cliente vuelve a enviar esos archivos.
+    for store in (primary_store, secondary_store):
+        store.clean_temp()
+    active_transactions.update(journal.load())
+    if active_transactions:
+        logger.warning("Se recuperaron %s transacción(es) en curso desde el diario.", len(active_transactions))
+    for tx_data in active_transactions.values():
+        tx_data["last_activity"] = time.monotonic()
+    threading.Thread(target=run_transaction_reaper, name="tx-reaper", daemon=True).start()
+    # También en modo sync, para subir lo que haya quedado pendiente de una ejecución en modo async.
+    replicator.start()
+    ServiceWorkerPool(BUS_HOST, BUS_PORT, SERVICE_NAME, process_request, workers=SERVICE_WORKERS,
+                      on_stream_chunk=touch_streamed_transaction).run()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
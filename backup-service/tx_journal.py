@@ -0,0 +1,162 @@
+# backup-service/tx_journal.py
+"""
+Diario de las transacciones de respaldo en curso.
+
+Cada transacción tiene un archivo <id>.jsonl en la carpeta del diario: la
+primera línea es su estado al iniciarse y cada línea siguiente un cambio
+(archivo procesado, lista de trozos recibida, trozo guardado, fallo). Cada línea
+se sincroniza con el disco antes de responder al cliente, así que si el servicio
+se reinicia a mitad de un respaldo, load() reconstruye las transacciones y el
+cliente puede consultar qué archivos faltan y subir solo esos.
+"""
+import json
+import os
+import threading
+from bus_connector import get_logger
+from object_store import fsync_dir
+
+logger = get_logger("TxJournal")
+
+JOURNAL_SUFFIX = ".jsonl"
+
+
+class TransactionJournal:
+    """Guarda y recupera el estado de las transacciones de backup-service."""
+    def __init__(self, journal_dir, stores):
+        """
+        Args:
+            journal_dir (str): Carpeta del diario.
+            stores (dict): Nombre -> ObjectStore, para guardar las referencias a
+                           objetos tomadas por cada transacción.
+        """
+        self.journal_dir = journal_dir
+        self.stores = stores
+        self._store_names = {id(store): name for name, store in stores.items()}
+
+    def _path(self, tx_id):
+        return os.path.join(self.journal_dir, tx_id + JOURNAL_SUFFIX)
+
+    def _encode_refs(self, object_refs):
+        return [[self._store_names[id(store)], file_hash] for store, file_hash in object_refs]
+
+    def _decode_refs(self, encoded_refs):
+        return [(self.stores[name], file_hash) for name, file_hash in encoded_refs]
+
+    def _append(self, tx_id, *records, mode="a"):
+        with open(self._path(tx_id), mode) as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def begin(self, tx_id, tx_data):
+        """Crea el diario de una transacción nueva con su estado inicial."""
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self._append(tx_id, {
+            "op": "begin",
+            "structure": tx_data["structure"],
+            "auto_job_id": tx_data["auto_job_id"],
+            "expected_files": tx_data["expected_files"],
+            "processed_files_db_meta": tx_data["processed_files_db_meta"],
+            "object_refs": self._encode_refs(tx_data["object_refs"])
+        }, mode="w")
+        fsync_dir(self.journal_dir)
+
+    def file_processed(self, tx_id, file_meta, object_refs):
+        """Registra un archivo completo, con las referencias tomadas para él."""
+        self._append(tx_id, {"op": "file", "meta": file_meta, "object_refs": self._encode_refs(object_refs)})
+
+    def files_processed(self, tx_id, processed_files):
+        """Registra varios archivos completos [(metadatos, referencias), ...] con una sola escritura al disco."""
+        self._append(tx_id, *[{"op": "file", "meta": file_meta, "object_refs": self._encode_refs(object_refs)}
+                              for file_meta, object_refs in processed_files])
+
+    def chunked_file(self, tx_id, relative_path, chunked_file, object_refs):
+        """Registra la lista de trozos de un archivo y las referencias a los trozos que ya estaban guardados."""
+        self._append(tx_id, {"op": "chunked", "relative_path": relative_path, "file": chunked_file,
+                             "object_refs": self._encode_refs(object_refs)})
+
+    def chunk_stored(self, tx_id, relative_path, chunk_hash, size, object_refs):
+        """Registra un trozo recibido de un archivo."""
+        self._append(tx_id, {"op": "chunk", "relative_path": relative_path, "chunk_hash": chunk_hash,
+                             "size": size, "object_refs": self._encode_refs(object_refs)})
+
+    def failed(self, tx_id):
+        """Registra que la transacción falló (el cliente solo puede finalizarla para revertirla)."""
+        self._append(tx_id, {"op": "failed"})
+
+    def remove(self, tx_id):
+        """Borra el diario de una transacción finalizada."""
+        try:
+            os.remove(self._path(tx_id))
+        except FileNotFoundError:
+            pass
+
+    def _replay(self, records):
+        tx_data = None
+        for record in records:
+            op = record["op"]
+            if op == "begin":
+                tx_data = {
+                    "structure": record["structure"],
+                    "expected_files": record["expected_files"],
+                    "processed_files_db_meta": record["processed_files_db_meta"],
+                    "object_refs": self._decode_refs(record["object_refs"]),
+                    "chunked_files": {},
+                    "status": "pending",
+                    "auto_job_id": record["auto_job_id"],
+                    "buffered_bytes": 0,
+                    "in_use": 0,
+                    "lock": threading.Lock()
+                }
+                continue
+            if op == "failed":
+                tx_data["status"] = "failed"
+                continue
+
+            tx_data["object_refs"].extend(self._decode_refs(record["object_refs"]))
+            if op == "file":
+                relative_path = record["meta"]["relative_path"]
+                tx_data["expected_files"].pop(relative_path, None)
+                tx_data["chunked_files"].pop(relative_path, None)
+                tx_data["processed_files_db_meta"].append(record["meta"])
+                if record["object_refs"]:
+                    # Archivo recibido completo (los terminados por trozos ya se contaron por trozo).
+                    tx_data["buffered_bytes"] += record["meta"]["size"]
+            elif op == "chunked":
+                tx_data["chunked_files"][record["relative_path"]] = record["file"]
+            elif op == "chunk":
+                tx_data["chunked_files"][record["relative_path"]]["pending"].pop(record["chunk_hash"], None)
+                tx_data["buffered_bytes"] += record["size"]
+        return tx_data
+
+    def load(self):
+        """
+        Reconstruye las transacciones que quedaron en curso.
+
+        Returns:
+            dict: ID de transacción -> estado, como en active_transactions.
+        """
+        transactions = {}
+        if not os.path.isdir(self.journal_dir):
+            return transactions
+
+        for name in os.listdir(self.journal_dir):
+            if not name.endswith(JOURNAL_SUFFIX):
+                continue
+            tx_id = name[:-len(JOURNAL_SUFFIX)]
+            records = []
+            with open(os.path.join(self.journal_dir, name)) as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # Última línea a medio escribir cuando se detuvo el servicio.
+                        break
+            try:
+                tx_data = self._replay(records)
+            except Exception as e:
+                logger.error("No se pudo recuperar la transacción %s desde el diario: %s", tx_id, e)
+                continue
+            if tx_data is not None:
+                transactions[tx_id] = tx_data
+        return transactions
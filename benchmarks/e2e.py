@@ -0,0 +1,380 @@
+# benchmarks/e2e.py
+"""
+Benchmark de punta a punta de respaldo y restauración.
+
+Levanta el sistema local (ver stack.py), genera un árbol sintético de archivos,
+lo respalda con `execute_backup` y lo restaura con `execute_restore`, igual que
+el cliente. Informa archivos/s, MB/s, la latencia de cada salto entre servicios
+(según las métricas de `__stats`) y el pico de memoria de cada servicio, y
+guarda el resultado en JSON para compararlo con ejecuciones anteriores.
+
+Ejemplos:
+    python benchmarks/e2e.py --files 500 --sizes lognormal:32K:1.5 --output e2e.json
+    python benchmarks/e2e.py --files 20 --sizes fixed:16M --restore-source cloud
+    python benchmarks/e2e.py --baseline e2e.json --tolerance 0.15
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from stack import REPO_ROOT, SERVICES, LocalStack
+
+from bus_connector import configure_logging, get_logger, transact
+from bus_connector.metrics import outbound_metrics
+from handlers.backup_handler import execute_backup
+from handlers.restore_handler import execute_restore
+
+logger = get_logger("BenchE2E")
+
+MB = 1000 * 1000
+WRITE_CHUNK_SIZE = 1024 * 1024
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+# Métricas de latencia incluidas en el resumen de cada salto.
+SUMMARY_PERCENTILES = ("mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+
+
+def parse_size(text):
+    """Convierte un tamaño como "512", "64K" o "8M" a bytes."""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([KMG]?)", text.strip().upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f"Tamaño inválido: '{text}'")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+def parse_size_distribution(spec):
+    """
+    Interpreta la distribución de tamaños de archivo.
+
+    Formatos:
+        fixed:<tamaño>                 Todos los archivos del mismo tamaño.
+        uniform:<mínimo>:<máximo>      Uniforme entre dos tamaños.
+        lognormal:<mediana>:<sigma>    Log-normal (muchos archivos pequeños y pocos grandes).
+
+    Returns:
+        callable: Función (random.Random) -> tamaño en bytes.
+    """
+    kind, _, args = spec.partition(":")
+    params = args.split(":") if args else []
+    try:
+        if kind == "fixed" and len(params) == 1:
+            size = parse_size(params[0])
+            return lambda rng: size
+        if kind == "uniform" and len(params) == 2:
+            low, high = parse_size(params[0]), parse_size(params[1])
+            return lambda rng: rng.randint(low, high)
+        if kind == "lognormal" and len(params) == 2:
+            median, sigma = parse_size(params[0]), float(params[1])
+            return lambda rng: max(0, int(rng.lognormvariate(math.log(max(median, 1)), sigma)))
+    except (argparse.ArgumentTypeError, ValueError):
+        pass
+    raise argparse.ArgumentTypeError(f"Distribución de tamaños inválida: '{spec}'")
+
+def generate_tree(root, files, size_of, seed, files_per_dir=100, compressibility=0.0):
+    """
+    Genera un árbol de archivos sintético y reproducible.
+
+    Args:
+        root (str): Carpeta donde se crea el árbol.
+        files (int): Número de archivos.
+        size_of (callable): Distribución de tamaños (ver parse_size_distribution).
+        seed (int): Semilla; la misma semilla genera el mismo árbol.
+        files_per_dir (int): Archivos por subcarpeta.
+        compressibility (float): Fracción (0 a 1) de cada archivo que se rellena con ceros.
+
+    Returns:
+        dict: Ruta relativa -> (tamaño, hash SHA-256) de cada archivo generado.
+    """
+    rng = random.Random(seed)
+    manifest = {}
+    for index in range(files):
+        relative_path = f"dir{index // files_per_dir:04d}/file{index:06d}.bin"
+        full_path = os.path.join(root, relative_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        size = size_of(rng)
+        hasher = hashlib.sha256()
+        with open(full_path, "wb") as f:
+            remaining = size
+            while remaining:
+                chunk_size = min(remaining, WRITE_CHUNK_SIZE)
+                random_size = int(chunk_size * (1 - compressibility))
+                chunk = rng.randbytes(random_size) + bytes(chunk_size - random_size)
+                hasher.update(chunk)
+                f.write(chunk)
+                remaining -= chunk_size
+        manifest[relative_path] = (size, hasher.hexdigest())
+    return manifest
+
+def _hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(WRITE_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def count_mismatches(manifest, restored_root):
+    """Cuenta los archivos restaurados que faltan o cuyo contenido no coincide con el original."""
+    mismatches = 0
+    for relative_path, (_, expected_hash) in manifest.items():
+        path = os.path.join(restored_root, relative_path)
+        if not os.path.isfile(path) or _hash_file(path) != expected_hash:
+            mismatches += 1
+    return mismatches
+
+def find_instance_id(stack, structure):
+    """Busca con `listar` (admin-service) el ID de la instancia más reciente con esa estructura."""
+    _, r_status, r_content = transact(stack.bus_host, stack.bus_port, "admsv", 'listar|{"page": 1}')
+    match = re.search(r"ID de respaldo: (\d+)\n.*\n  Estructura: (.*)\n", r_content) if r_status == "OK" else None
+    if not match or match.group(2) != structure:
+        raise RuntimeError(f"No se encontró la instancia de respaldo de '{structure}': {r_content[:200]}")
+    return int(match.group(1))
+
+@contextlib.contextmanager
+def hidden_local_copies(stack, restore_source):
+    """
+    Oculta las copias locales (el almacén de objetos completo) para forzar la
+    restauración desde la copia secundaria ("secondary") o desde la nube ("cloud").
+    """
+    folders = {"primary": [], "secondary": ["local_copy"], "cloud": ["local_copy", "secondary_copy"]}[restore_source]
+    moved = []
+    try:
+        for folder in folders:
+            path = os.path.join(stack.work_dir, folder, "objects")
+            os.rename(path, f"{path}.hidden")
+            moved.append(path)
+        yield
+    finally:
+        for path in moved:
+            os.rename(f"{path}.hidden", path)
+
+def _throughput(files, total_bytes, seconds):
+    return {
+        "seconds": round(seconds, 3),
+        "files_per_s": round(files / seconds, 2) if seconds else None,
+        "mb_per_s": round(total_bytes / MB / seconds, 2) if seconds else None,
+    }
+
+def run_once(stack, run_index, source_dir, manifest, restore_source):
+    """Respalda y restaura el árbol una vez y devuelve las mediciones."""
+    structure = f"bench/run-{run_index}"
+    files = len(manifest)
+    total_bytes = sum(size for size, _ in manifest.values())
+    client_output = io.StringIO() # La salida del cliente se guarda solo para informar errores.
+
+    started_at = time.perf_counter()
+    with contextlib.redirect_stdout(client_output):
+        backup_ok = execute_backup(stack.bus_host, stack.bus_port, source_dir, structure)
+    backup_seconds = time.perf_counter() - started_at
+    if not backup_ok:
+        raise RuntimeError(f"El respaldo falló:\n{client_output.getvalue()[-2000:]}")
+
+    started_at = time.perf_counter()
+    instance_id = find_instance_id(stack, structure)
+    listar_seconds = time.perf_counter() - started_at
+
+    restored_dir = os.path.join(stack.work_dir, "restored", f"run-{run_index}")
+    started_at = time.perf_counter()
+    with hidden_local_copies(stack, restore_source), contextlib.redirect_stdout(client_output):
+        result = execute_restore(stack.bus_host, stack.bus_port, instance_id, restored_dir)
+    restore_seconds = time.perf_counter() - started_at
+    if result is None:
+        raise RuntimeError(f"La restauración falló:\n{client_output.getvalue()[-2000:]}")
+    restored, failed = result
+    mismatched = count_mismatches(manifest, restored_dir)
+    shutil.rmtree(restored_dir, ignore_errors=True)
+
+    run = {
+        "run": run_index,
+        "instance_id": instance_id,
+        "backup": _throughput(files, total_bytes, backup_seconds),
+        "listar": {"seconds": round(listar_seconds, 3)},
+        "restore": dict(_throughput(files, total_bytes, restore_seconds), restored=restored, failed=failed, mismatched=mismatched),
+    }
+    logger.info("Ejecución %d: respaldo %.2f archivos/s (%.2f MB/s), restauración %.2f archivos/s (%.2f MB/s), %d discrepancia(s).",
+                run_index, run["backup"]["files_per_s"], run["backup"]["mb_per_s"],
+                run["restore"]["files_per_s"], run["restore"]["mb_per_s"], mismatched)
+    return run
+
+def summarize_hops(client_outbound, services):
+    """
+    Resume la latencia de cada salto "origen->destino comando" a partir de las
+    métricas salientes del cliente y de cada servicio.
+    """
+    callers = [("client", client_outbound)]
+    callers += [(SERVICES[name][1], data["outbound"]) for name, data in services.items() if data.get("outbound")]
+    hops = {}
+    for caller, outbound in callers:
+        for key, metrics in outbound.items():
+            service_name, _, command = key.partition(":")
+            if command == "#CAPS":
+                continue # Negociación de compresión, no es un salto de la aplicación.
+            hop = {"count": metrics["count"], "errors": metrics["errors"]}
+            hop.update({name: metrics[name] for name in SUMMARY_PERCENTILES})
+            hops[f"{caller}->{service_name} {command}"] = hop
+    return hops
+
+def collect_service_metrics(stack):
+    """Consulta `__stats` y el pico de memoria de cada servicio."""
+    services = {}
+    for name, service in stack.services.items():
+        stats = stack.service_stats(name) or {}
+        services[name] = {
+            "peak_rss_kb": service.peak_rss_kb(),
+            "inbound": stats.get("inbound", {}),
+            "outbound": stats.get("outbound", {}),
+        }
+    return services
+
+def _median(runs, phase, field):
+    values = [run[phase][field] for run in runs if run[phase].get(field) is not None]
+    return round(statistics.median(values), 2) if values else None
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Compara el resumen con el de una ejecución anterior.
+
+    Returns:
+        list: Descripción de cada métrica que empeoró más que la tolerancia.
+    """
+    regressions = []
+    for key, value in results["summary"].items():
+        previous = baseline.get("summary", {}).get(key)
+        if not previous or value is None:
+            continue
+        # Más es mejor para el rendimiento; menos es mejor para la memoria.
+        change = (value - previous) / previous
+        worse = change < -tolerance if key.endswith("_per_s") else change > tolerance
+        if worse:
+            regressions.append(f"{key}: {previous} -> {value} ({change:+.1%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de punta a punta de respaldo y restauración.")
+    parser.add_argument("--files", type=int, default=200, help="Número de archivos del árbol sintético.")
+    parser.add_argument("--sizes", default="lognormal:32K:1.5", metavar="DIST",
+                        help="Distribución de tamaños: fixed:<t>, uniform:<min>:<max> o lognormal:<mediana>:<sigma>.")
+    parser.add_argument("--files-per-dir", type=int, default=100)
+    parser.add_argument("--compressibility", type=float, default=0.0, help="Fracción de cada archivo rellena con ceros.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=1, help="Repeticiones de respaldo + restauración.")
+    parser.add_argument("--workers", type=int, default=None, help="SERVICE_WORKERS de cada servicio.")
+    parser.add_argument("--restore-source", choices=("primary", "secondary", "cloud"), default="primary",
+                        help="Copia desde la que se restaura (las anteriores se ocultan).")
+    parser.add_argument("--cloud-latency-ms", type=float, default=0.0, help="Latencia simulada por operación en la nube.")
+    parser.add_argument("--cloud-bandwidth", type=parse_size, default=0, help="Ancho de banda simulado de la nube, por segundo (ej. 20M).")
+    parser.add_argument("--db-host", help="Usar una base de datos existente (con init.sql aplicado) en vez de una desechable.")
+    parser.add_argument("--db-user", default="postgres")
+    parser.add_argument("--db-name", default="postgres")
+    parser.add_argument("--db-pass", default=os.getenv("DB_PASS", ""))
+    parser.add_argument("--work-dir", help="Carpeta de trabajo (por defecto, una temporal que se borra al terminar).")
+    parser.add_argument("--output", help="Archivo donde guardar el resultado en JSON (por defecto, la salida estándar).")
+    parser.add_argument("--baseline", help="Resultado JSON anterior con el cual comparar.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Empeoramiento relativo tolerado respecto al baseline.")
+    args = parser.parse_args()
+    try:
+        size_of = parse_size_distribution(args.sizes)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    configure_logging("bench")
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="bench-e2e-")
+    db_env = None
+    if args.db_host:
+        db_env = {"DB_HOST": args.db_host, "DB_USER": args.db_user, "DB_NAME": args.db_name, "DB_PASS": args.db_pass}
+
+    try:
+        source_dir = os.path.join(work_dir, "source")
+        logger.info("Generando %d archivo(s) en %s...", args.files, source_dir)
+        manifest = generate_tree(source_dir, args.files, size_of, args.seed, args.files_per_dir, args.compressibility)
+        total_bytes = sum(size for size, _ in manifest.values())
+
+        stack = LocalStack(work_dir, workers=args.workers, db_env=db_env,
+                           cloud_latency=args.cloud_latency_ms / 1000, cloud_bandwidth=args.cloud_bandwidth)
+        with stack:
+            runs = [run_once(stack, index + 1, source_dir, manifest, args.restore_source) for index in range(args.runs)]
+            services = collect_service_metrics(stack)
+            bus_stats = stack.bus.stats()
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    client_outbound = outbound_metrics.snapshot()
+    results = {
+        "benchmark": "e2e",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {
+            "files": args.files,
+            "total_bytes": total_bytes,
+            "sizes": args.sizes,
+            "compressibility": args.compressibility,
+            "seed": args.seed,
+            "runs": args.runs,
+            "workers": args.workers,
+            "restore_source": args.restore_source,
+            "cloud_latency_ms": args.cloud_latency_ms,
+            "cloud_bandwidth": args.cloud_bandwidth,
+        },
+        "summary": {
+            "backup_files_per_s": _median(runs, "backup", "files_per_s"),
+            "backup_mb_per_s": _median(runs, "backup", "mb_per_s"),
+            "restore_files_per_s": _median(runs, "restore", "files_per_s"),
+            "restore_mb_per_s": _median(runs, "restore", "mb_per_s"),
+            # Pico de memoria del proceso del benchmark (cliente, bus y nube simulada).
+            "harness_peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            **{f"{name}_peak_rss_kb": data["peak_rss_kb"] for name, data in services.items()},
+        },
+        "runs": runs,
+        "hops": summarize_hops(client_outbound, services),
+        "services": services,
+        "client": {"outbound": client_outbound},
+        "bus": bus_stats,
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        logger.info("Resultado guardado en %s.", args.output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            logger.warning("Regresión: %s", regression)
+        if regressions:
+            sys.exit(1)
+
+    mismatched = sum(run["restore"]["mismatched"] for run in runs)
+    if mismatched:
+        logger.error("%d archivo(s) restaurado(s) no coinciden con el original.", mismatched)
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
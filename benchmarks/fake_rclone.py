@@ -0,0 +1,143 @@
+# benchmarks/fake_rclone.py
+"""
+Imitación de la API de control remoto de Rclone (rclone rcd) para pruebas y benchmarks.
+
+Implementa solo las operaciones que usa cloud-service/rclone_handler.py:
+config/create, operations/copyfile, operations/deletefile y sync/copy. Cada remote
+("<nombre>:") es una carpeta dentro de `root_dir`; las rutas sin ":" son
+carpetas locales, como en Rclone. Permite simular la latencia y el ancho de
+banda de un proveedor de nube.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeRclone:
+    """Servidor HTTP que responde como `rclone rcd` guardando los remotes en disco."""
+    def __init__(self, root_dir, host="127.0.0.1", port=0, latency=0.0, bandwidth=0):
+        """Inicializa el servidor.
+
+        Args:
+            root_dir (str): Carpeta donde se guardan los archivos de cada remote.
+            host (str): Dirección donde escuchar.
+            port (int): Puerto donde escuchar (0 elige uno libre).
+            latency (float): Segundos añadidos a cada operación.
+            bandwidth (int): Bytes por segundo simulados al copiar (0 = sin límite).
+        """
+        self.root_dir = root_dir
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.remotes = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Atiende solicitudes en un hilo propio."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-rclone", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _resolve(self, fs, remote):
+        """Convierte un par (fs, ruta) de Rclone en una ruta local."""
+        if fs.endswith(":"):
+            name = fs[:-1]
+            if name not in self.remotes:
+                raise FileNotFoundError(f"didn't find section in config file (\"{name}\")")
+            fs = os.path.join(self.root_dir, name)
+        path = os.path.normpath(os.path.join(fs, remote.lstrip("/")))
+        if not path.startswith(os.path.normpath(fs)):
+            raise PermissionError(f"Ruta fuera del remote: {remote}")
+        return path
+
+    def _simulate_transfer(self, size):
+        delay = self.latency + (size / self.bandwidth if self.bandwidth else 0)
+        if delay:
+            time.sleep(delay)
+
+    def _config_create(self, params):
+        self.remotes[params["name"]] = params.get("type")
+        os.makedirs(os.path.join(self.root_dir, params["name"]), exist_ok=True)
+        return {}
+
+    def _copyfile(self, params):
+        src = self._resolve(params["srcFs"], params["srcRemote"])
+        dst = self._resolve(params["dstFs"], params["dstRemote"])
+        if not os.path.isfile(src):
+            raise FileNotFoundError("object not found")
+        self._simulate_transfer(os.path.getsize(src))
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copyfile(src, dst)
+        return {}
+
+    def _sync_copy(self, params):
+        """Copia todos los archivos de una carpeta (o remote) a otra, manteniendo sus rutas relativas."""
+        src_root = self._resolve(params["srcFs"], "")
+        dst_root = self._resolve(params["dstFs"], "")
+        if not os.path.isdir(src_root):
+            raise FileNotFoundError("directory not found")
+        copies = []
+        for root, _, files in os.walk(src_root):
+            for filename in files:
+                src = os.path.join(root, filename)
+                copies.append((src, os.path.join(dst_root, os.path.relpath(src, src_root))))
+        self._simulate_transfer(sum(os.path.getsize(src) for src, _ in copies))
+        for src, dst in copies:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copyfile(src, dst)
+        return {}
+
+    def _deletefile(self, params):
+        path = self._resolve(params["fs"], params["remote"])
+        self._simulate_transfer(0)
+        os.remove(path)
+        return {}
+
+    def _handler_class(self):
+        rclone = self
+        operations = {
+            "/config/create": rclone._config_create,
+            "/operations/copyfile": rclone._copyfile,
+            "/operations/deletefile": rclone._deletefile,
+            "/sync/copy": rclone._sync_copy,
+        }
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                operation = operations.get(self.path)
+                try:
+                    params = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                    if operation is None:
+                        status, reply = 404, {"error": "couldn't find method", "path": self.path}
+                    else:
+                        status, reply = 200, operation(params)
+                except FileNotFoundError as e:
+                    status, reply = 404, {"error": str(e), "path": self.path}
+                except Exception as e:
+                    status, reply = 500, {"error": str(e), "path": self.path}
+                body = json.dumps(reply).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # Sin logs por solicitud: distorsionarían las mediciones.
+
+        return Handler
@@ -0,0 +1,272 @@
+# benchmarks/load.py
+"""
+Generador de carga concurrente y pruebas de resistencia (soak).
+
+Levanta el sistema local (ver stack.py) y simula N clientes a la vez, cada uno
+repitiendo una mezcla de sesiones: respaldos con `execute_backup`,
+restauraciones con `execute_restore` y navegación por `listar`. Registra, por
+ventana de tiempo, los percentiles de latencia y la tasa de errores de cada
+operación, la espera en cola de cada servicio en el bus, la memoria de cada
+servicio y sus valores instantáneos (ej. transacciones activas de
+backup-service), y al final estima cuánto crece la memoria por minuto.
+
+Ejemplos:
+    python benchmarks/load.py --clients 50 --duration 300 --output load.json
+    python benchmarks/load.py --clients 10 --duration 3600 --window 60 --mix backup=1,restore=1,listar=4
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from stack import SERVICES, LocalStack
+from e2e import find_instance_id, generate_tree, parse_size_distribution
+
+from bus_connector import configure_logging, get_logger, transact
+from bus_connector.metrics import MetricsRegistry
+from handlers.backup_handler import execute_backup
+from handlers.restore_handler import execute_restore
+
+logger = get_logger("BenchLoad")
+
+OPERATIONS = ("backup", "restore", "listar")
+
+
+def parse_mix(text):
+    """Convierte "backup=1,restore=1,listar=2" en pesos por operación."""
+    weights = dict.fromkeys(OPERATIONS, 0.0)
+    for entry in text.split(","):
+        name, _, weight = entry.partition("=")
+        if name.strip() not in weights:
+            raise argparse.ArgumentTypeError(f"Operación desconocida en la mezcla: '{name}'")
+        weights[name.strip()] = float(weight)
+    if not any(weights.values()):
+        raise argparse.ArgumentTypeError("La mezcla debe tener al menos una operación con peso mayor que cero.")
+    return weights
+
+
+class Timeline:
+    """Latencias de cada operación, por ventana de tiempo y en total."""
+    def __init__(self):
+        self.window = MetricsRegistry()
+        self.total = MetricsRegistry()
+
+    def record(self, operation, seconds, error):
+        self.window.record(operation, seconds, error=error)
+        self.total.record(operation, seconds, error=error)
+
+    def close_window(self):
+        """Devuelve las métricas de la ventana actual y empieza una nueva."""
+        return self.window.snapshot(reset=True)
+
+
+class ClientSession(threading.Thread):
+    """Un cliente simulado que repite operaciones elegidas al azar según la mezcla."""
+    def __init__(self, index, stack, source_dir, instance_ids, timeline, stop_event, options):
+        super().__init__(name=f"client-{index:03d}", daemon=True)
+        self.index = index
+        self.stack = stack
+        self.source_dir = source_dir
+        self.instance_ids = instance_ids
+        self.timeline = timeline
+        self.stop_event = stop_event
+        self.options = options
+        self.rng = random.Random(options.seed * 1000 + index)
+        self.backups = 0
+
+    def _backup(self):
+        self.backups += 1
+        structure = f"load/client-{self.index:03d}/{self.backups}"
+        return execute_backup(self.stack.bus_host, self.stack.bus_port, self.source_dir, structure)
+
+    def _restore(self):
+        destination = os.path.join(self.stack.work_dir, "restored", self.name)
+        try:
+            result = execute_restore(self.stack.bus_host, self.stack.bus_port, self.rng.choice(self.instance_ids), destination)
+        finally:
+            shutil.rmtree(destination, ignore_errors=True)
+        return result is not None and result[1] == 0
+
+    def _listar(self):
+        page = self.rng.randint(1, self.options.browse_pages)
+        _, r_status, r_content = transact(self.stack.bus_host, self.stack.bus_port, "admsv", f'listar|{{"page": {page}}}')
+        return r_status == "OK" and not r_content.startswith("Error")
+
+    def run(self):
+        operations = [name for name in OPERATIONS if self.options.mix[name]]
+        weights = [self.options.mix[name] for name in operations]
+        # Arranque escalonado: los clientes se reparten a lo largo del ramp-up.
+        if self.stop_event.wait(self.options.ramp_up * self.index / self.options.clients):
+            return
+
+        while not self.stop_event.is_set():
+            operation = self.rng.choices(operations, weights)[0]
+            started_at = time.perf_counter()
+            try:
+                ok = getattr(self, f"_{operation}")()
+            except Exception as e:
+                logger.error("[%s] Error en '%s': %s", self.name, operation, e)
+                ok = False
+            self.timeline.record(operation, time.perf_counter() - started_at, error=not ok)
+            self.stop_event.wait(self.rng.expovariate(1000 / self.options.think_ms) if self.options.think_ms else 0)
+
+
+def sample_services(stack):
+    """Memoria actual y valores instantáneos (`register_gauge`) de cada servicio."""
+    services = {}
+    for name, service in stack.services.items():
+        stats = stack.service_stats(name) or {}
+        services[name] = {"rss_kb": service.rss_kb(), "gauges": stats.get("gauges", {})}
+    return services
+
+def growth_per_minute(samples):
+    """Pendiente (por minuto) de la recta de mínimos cuadrados de [(segundos, valor), ...]."""
+    points = [(t, value) for t, value in samples if isinstance(value, (int, float))]
+    if len(points) < 2:
+        return None
+    mean_t = sum(t for t, _ in points) / len(points)
+    mean_v = sum(v for _, v in points) / len(points)
+    variance = sum((t - mean_t) ** 2 for t, _ in points)
+    if not variance:
+        return None
+    return round(sum((t - mean_t) * (v - mean_v) for t, v in points) / variance * 60, 2)
+
+def summarize_trend(samples):
+    values = [value for _, value in samples if isinstance(value, (int, float))]
+    if not values:
+        return None
+    return {"first": values[0], "last": values[-1], "max": max(values), "per_minute": growth_per_minute(samples)}
+
+def summarize_operations(snapshot, duration):
+    summary = {}
+    for operation, metrics in snapshot.items():
+        summary[operation] = dict(metrics, error_rate=round(metrics["errors"] / metrics["count"], 4) if metrics["count"] else 0.0,
+                                  ops_per_s=round(metrics["count"] / duration, 3) if duration else None)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga concurrente y pruebas de resistencia del sistema de respaldo.")
+    parser.add_argument("--clients", type=int, default=10, help="Clientes simulados en paralelo.")
+    parser.add_argument("--duration", type=float, default=60, help="Segundos de carga.")
+    parser.add_argument("--window", type=float, default=10, help="Segundos por ventana de medición.")
+    parser.add_argument("--ramp-up", type=float, default=0, help="Segundos en que se van sumando los clientes.")
+    parser.add_argument("--mix", type=parse_mix, default="backup=1,restore=1,listar=2", help="Pesos de cada operación.")
+    parser.add_argument("--think-ms", type=float, default=0, help="Pausa media entre operaciones de un cliente.")
+    parser.add_argument("--browse-pages", type=int, default=5, help="Páginas de `listar` entre las que navegan los clientes.")
+    parser.add_argument("--files", type=int, default=20, help="Archivos del árbol que respalda cada cliente.")
+    parser.add_argument("--sizes", default="lognormal:16K:1.0", metavar="DIST", help="Distribución de tamaños (ver e2e.py).")
+    parser.add_argument("--seed-backups", type=int, default=3, help="Respaldos creados antes de la carga para restaurar.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None, help="SERVICE_WORKERS de cada servicio.")
+    parser.add_argument("--cloud-latency-ms", type=float, default=0.0)
+    parser.add_argument("--db-host", help="Usar una base de datos existente (con init.sql aplicado).")
+    parser.add_argument("--db-user", default="postgres")
+    parser.add_argument("--db-name", default="postgres")
+    parser.add_argument("--db-pass", default=os.getenv("DB_PASS", ""))
+    parser.add_argument("--work-dir", help="Carpeta de trabajo (por defecto, una temporal que se borra al terminar).")
+    parser.add_argument("--output", help="Archivo donde guardar el resultado en JSON (por defecto, la salida estándar).")
+    args = parser.parse_args()
+    try:
+        size_of = parse_size_distribution(args.sizes)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    configure_logging("load")
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="bench-load-")
+    db_env = None
+    if args.db_host:
+        db_env = {"DB_HOST": args.db_host, "DB_USER": args.db_user, "DB_NAME": args.db_name, "DB_PASS": args.db_pass}
+
+    timeline = Timeline()
+    windows = []
+    stop_event = threading.Event()
+    try:
+        source_dir = os.path.join(work_dir, "source")
+        generate_tree(source_dir, args.files, size_of, args.seed)
+
+        with LocalStack(work_dir, workers=args.workers, db_env=db_env, cloud_latency=args.cloud_latency_ms / 1000) as stack, \
+                open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            instance_ids = []
+            for index in range(args.seed_backups if args.mix["restore"] else 0):
+                structure = f"load/seed/{index + 1}"
+                if not execute_backup(stack.bus_host, stack.bus_port, source_dir, structure):
+                    raise RuntimeError("No se pudieron crear los respaldos iniciales.")
+                instance_ids.append(find_instance_id(stack, structure))
+            stack.bus.stats(reset=True)
+
+            logger.info("Iniciando %d cliente(s) durante %.0f s...", args.clients, args.duration)
+            sessions = [ClientSession(index, stack, source_dir, instance_ids, timeline, stop_event, args) for index in range(args.clients)]
+            started_at = time.monotonic()
+            for session in sessions:
+                session.start()
+
+            while True:
+                elapsed = time.monotonic() - started_at
+                if elapsed >= args.duration:
+                    break
+                time.sleep(min(args.window, args.duration - elapsed))
+                window = {
+                    "t": round(time.monotonic() - started_at, 1),
+                    "operations": timeline.close_window(),
+                    "bus": stack.bus.stats(reset=True),
+                    "services": sample_services(stack),
+                }
+                windows.append(window)
+                logger.info("t=%.0fs %s", window["t"], ", ".join(
+                    f"{name}: {m['count']} ({m['errors']} err, p95 {m['p95_ms']:.0f} ms)" for name, m in window["operations"].items()))
+
+            stop_event.set()
+            for session in sessions:
+                session.join()
+            duration = time.monotonic() - started_at
+    finally:
+        stop_event.set()
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    memory = {}
+    gauges = {}
+    for name in SERVICES:
+        memory[name] = summarize_trend([(w["t"], w["services"][name]["rss_kb"]) for w in windows])
+        for gauge in (windows[-1]["services"][name]["gauges"] if windows else {}):
+            gauges[f"{name}.{gauge}"] = summarize_trend([(w["t"], w["services"][name]["gauges"].get(gauge)) for w in windows])
+
+    results = {
+        "benchmark": "load",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "clients": args.clients,
+            "duration": args.duration,
+            "window": args.window,
+            "ramp_up": args.ramp_up,
+            "mix": args.mix,
+            "think_ms": args.think_ms,
+            "files": args.files,
+            "sizes": args.sizes,
+            "workers": args.workers,
+            "cloud_latency_ms": args.cloud_latency_ms,
+        },
+        "summary": {
+            "duration": round(duration, 1),
+            "operations": summarize_operations(timeline.total.snapshot(), duration),
+            "memory_kb": memory,
+            "gauges": gauges,
+        },
+        "windows": windows,
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        logger.info("Resultado guardado en %s.", args.output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
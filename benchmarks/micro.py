@@ -0,0 +1,354 @@
+# benchmarks/micro.py
+"""
+Microbenchmarks de las rutas críticas por archivo.
+
+Mide por separado el costo de CPU de:
+  - el armado y la lectura de tramas del bus (_encode_message, _send_message,
+    _FrameReader.read_frame, tramas binarias y compresión por trama),
+  - base64 (el contenido "content_b64" de los clientes antiguos),
+  - SHA-256 (la copia con hash de backup-service y verify_hash/verify_stream_hash
+    de restore-service),
+  - json.dumps/loads de los payloads grandes (begin_backup y el plan de restauración),
+  - la división de archivos grandes en trozos definidos por contenido (iter_chunks).
+
+Para cada caso informa operaciones por segundo, MB/s y la memoria que reserva
+cada operación (pico y retenida, con tracemalloc). Solo usa la biblioteca estándar
+y el bus_connector del repositorio.
+
+Ejemplos:
+    python benchmarks/micro.py
+    python benchmarks/micro.py --filter sha256 --output micro.json
+    python benchmarks/micro.py --baseline micro.json --tolerance 0.10
+"""
+import argparse
+import base64
+import gc
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import sys
+import time
+import tracemalloc
+
+from stack import REPO_ROOT
+
+from bus_connector import configure_logging, get_logger, iter_chunks
+from bus_connector.compression import (
+    COMPRESSION_CODECS,
+    ZFRAME_PREFIX_BYTES,
+    _ACCEPTED_BYTES,
+    _CODECS,
+    _compress_frame,
+    _decompress_frame,
+)
+from bus_connector.connector import (
+    MAX_PAYLOAD_SIZE,
+    STREAM_CHUNK_SIZE,
+    _binary_capacity,
+    _binary_frame,
+    _encode_message,
+    _FrameReader,
+    _send_message,
+    _split_binary_frame,
+)
+
+logger = get_logger("BenchMicro")
+
+MB = 1000 * 1000
+COPY_BUFFER_SIZE = 1024 * 1024  # Igual que COPY_BUFFER_SIZE de backup-service.
+ALLOCATION_SAMPLES = 3
+
+
+class Case:
+    """Un caso de benchmark: una función sin argumentos y los bytes que procesa por llamada."""
+    def __init__(self, name, func, size=None, setup=None, teardown=None):
+        self.name = name
+        self.func = func
+        self.size = size
+        self.setup = setup
+        self.teardown = teardown
+
+
+def _payload(size, seed=0):
+    """Bytes pseudoaleatorios reproducibles (incompresibles)."""
+    return random.Random(seed).randbytes(size)
+
+def _file_list(count):
+    return [{"relative_path": f"documentos/proyecto-{i // 100:03d}/archivo-{i:06d}.txt"} for i in range(count)]
+
+def _restore_plan(count):
+    files = [{"relative_path": f"documentos/proyecto-{i // 100:03d}/archivo-{i:06d}.txt",
+              "hash": hashlib.sha256(str(i).encode()).hexdigest(), "size": 1000 + i} for i in range(count)]
+    return {"status": "OK", "instance_structure": "backups/documentos", "files": files}
+
+def _load_restore_service():
+    """
+    Importa las funciones de hash de restore-service. Requiere las dependencias del
+    servicio (psycopg); si no están, esos casos se omiten.
+    """
+    path = os.path.join(REPO_ROOT, "restore-service", "service.py")
+    sys.path.insert(0, os.path.dirname(path))
+    try:
+        spec = importlib.util.spec_from_file_location("restore_service", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    except ImportError as e:
+        logger.warning("Se omiten los casos de restore-service (%s).", e)
+        return None
+    finally:
+        sys.path.remove(os.path.dirname(path))
+
+
+# --- CASOS ---
+
+def framing_cases():
+    cases = []
+    for size in (1024, 32 * 1024, MAX_PAYLOAD_SIZE - 5):
+        data = _payload(size)
+        cases.append(Case(f"framing.encode_message.{size}", lambda data=data: _encode_message("bkpsv", data), size))
+
+    # Envío y lectura por un socketpair: incluye las llamadas al sistema, como en el bus.
+    for size in (1024, 32 * 1024, MAX_PAYLOAD_SIZE - 5):
+        data = _payload(size)
+        state = {}
+
+        def setup(state=state):
+            state["a"], state["b"] = socket.socketpair()
+            state["a"].setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1024 * 1024)
+            state["reader"] = _FrameReader(state["b"])
+
+        def roundtrip(state=state, data=data):
+            _send_message(state["a"], "bkpsv", data)
+            state["reader"].read_frame()
+
+        def teardown(state=state):
+            state["a"].close()
+            state["b"].close()
+
+        cases.append(Case(f"framing.send_read_frame.{size}", roundtrip, size, setup, teardown))
+
+    raw = _payload(_binary_capacity("bkpsv", 'upload_file|{"transaction_id": "x", "relative_path": "a/b.txt"}'))
+    header = 'upload_file|{"transaction_id": "x", "relative_path": "a/b.txt"}'
+    frame = memoryview(_binary_frame(header, raw))
+    cases.append(Case("framing.binary_frame", lambda: _binary_frame(header, raw), len(raw)))
+    cases.append(Case("framing.split_binary_frame", lambda: _split_binary_frame(frame), len(raw)))
+
+    # Compresión por trama con texto JSON compresible y con bytes incompresibles:
+    # cada códec por separado y, si BUS_COMPRESSION configura alguno, _compress_frame
+    # completo (muestra inicial incluida) con el códec que usaría. Con el valor por
+    # defecto ("none") _compress_frame no comprime, así que esos casos se omiten:
+    # exportar BUS_COMPRESSION=zlib (o lzma) para medirlos.
+    text = json.dumps(_file_list(1200)).encode("utf-8")[:STREAM_CHUNK_SIZE]
+    if not COMPRESSION_CODECS:
+        logger.info("BUS_COMPRESSION no configura ningún códec: se omiten los casos framing.compress_frame.*.")
+    for label, data in (("json", text), ("random", _payload(STREAM_CHUNK_SIZE))):
+        if COMPRESSION_CODECS:
+            cases.append(Case(f"framing.compress_frame.{COMPRESSION_CODECS[0]}.{label}",
+                              lambda data=data: _compress_frame(data, COMPRESSION_CODECS, MAX_PAYLOAD_SIZE), len(data)))
+        for codec, (compress, _) in _CODECS.items():
+            wrapped = memoryview(b"%b%b|%b|%b" % (ZFRAME_PREFIX_BYTES, codec.encode("ascii"), _ACCEPTED_BYTES, compress(data)))
+            cases.append(Case(f"framing.compress.{codec}.{label}", lambda data=data, compress=compress: compress(data), len(data)))
+            cases.append(Case(f"framing.decompress_frame.{codec}.{label}",
+                              lambda wrapped=wrapped: _decompress_frame(wrapped, MAX_PAYLOAD_SIZE), len(data)))
+    return cases
+
+def base64_cases():
+    cases = []
+    for size in (64 * 1024, 1024 * 1024):
+        data = _payload(size)
+        encoded = base64.b64encode(data)
+        cases.append(Case(f"base64.b64encode.{size}", lambda data=data: base64.b64encode(data), size))
+        cases.append(Case(f"base64.b64decode.{size}", lambda encoded=encoded: base64.b64decode(encoded), size))
+    return cases
+
+def sha256_cases():
+    cases = []
+    for size in (4 * 1024, 1024 * 1024, 16 * 1024 * 1024):
+        data = _payload(size)
+        cases.append(Case(f"sha256.digest.{size}", lambda data=data: hashlib.sha256(data).hexdigest(), size))
+
+    # Bucle de backup-service: leer por bloques, hashear y escribir la copia local.
+    size = 16 * 1024 * 1024
+    data = _payload(size)
+    sink_path = os.path.join(os.getenv("TMPDIR", "/tmp"), f"bench-micro-{os.getpid()}.bin")
+
+    def backup_copy_loop():
+        source = io.BytesIO(data)
+        hasher = hashlib.sha256()
+        with open(sink_path, "wb") as f:
+            for chunk in iter(lambda: source.read(COPY_BUFFER_SIZE), b""):
+                hasher.update(chunk)
+                f.write(chunk)
+        return hasher.hexdigest()
+
+    def remove_sink():
+        if os.path.exists(sink_path):
+            os.remove(sink_path)
+
+    cases.append(Case(f"sha256.backup_copy_loop.{size}", backup_copy_loop, size, teardown=remove_sink))
+
+    restore_service = _load_restore_service()
+    if restore_service is not None:
+        expected = hashlib.sha256(data).hexdigest()
+        cases.append(Case(f"sha256.restore.verify_hash.{size}", lambda: restore_service.verify_hash(data, expected), size))
+        cases.append(Case(f"sha256.restore.verify_stream_hash.{size}",
+                          lambda: restore_service.verify_stream_hash(io.BytesIO(data), expected), size))
+    return cases
+
+def json_cases():
+    cases = []
+    for count in (1000, 10000):
+        begin = {"structure": "backups/documentos", "files_to_backup": _file_list(count)}
+        plan = _restore_plan(count)
+        for label, payload in (("begin_backup", begin), ("restore_plan", plan)):
+            text = json.dumps(payload)
+            cases.append(Case(f"json.dumps.{label}.{count}", lambda payload=payload: json.dumps(payload), len(text)))
+            cases.append(Case(f"json.loads.{label}.{count}", lambda text=text: json.loads(text), len(text)))
+    return cases
+
+def chunking_cases():
+    size = 32 * 1024 * 1024
+    data = _payload(size)
+    # Como en el cliente: dividir en trozos y calcular el hash de cada uno.
+    return [
+        Case(f"chunking.iter_chunks.{size}", lambda: sum(1 for _ in iter_chunks(io.BytesIO(data))), size),
+        Case(f"chunking.iter_chunks_sha256.{size}",
+             lambda: [hashlib.sha256(chunk).hexdigest() for chunk in iter_chunks(io.BytesIO(data))], size),
+    ]
+
+SUITES = {"framing": framing_cases, "base64": base64_cases, "sha256": sha256_cases, "json": json_cases, "chunking": chunking_cases}
+
+
+# --- MEDICIÓN ---
+
+def _calibrate(func, min_time):
+    """Número de llamadas por repetición para que cada repetición dure al menos `min_time`."""
+    number = 1
+    while True:
+        started_at = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started_at
+        if elapsed >= min_time:
+            return number
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+
+def _measure_allocations(func):
+    """Pico de memoria reservada durante una llamada y memoria que sigue reservada al liberar su resultado."""
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(ALLOCATION_SAMPLES):
+            gc.collect()
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            result = func()
+            _, peak = tracemalloc.get_traced_memory()
+            del result
+            current, _ = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(current - before)
+    finally:
+        tracemalloc.stop()
+    return min(peaks), min(retained)
+
+def run_case(case, repeat, min_time):
+    if case.setup:
+        case.setup()
+    try:
+        case.func() # Calentamiento.
+        number = _calibrate(case.func, min_time)
+        timings = []
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for _ in range(repeat):
+                started_at = time.perf_counter()
+                for _ in range(number):
+                    case.func()
+                timings.append((time.perf_counter() - started_at) / number)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        peak_bytes, retained_bytes = _measure_allocations(case.func)
+    finally:
+        if case.teardown:
+            case.teardown()
+
+    best, median = min(timings), statistics.median(timings)
+    result = {
+        "ops_per_s": round(1 / median, 2),
+        "best_ops_per_s": round(1 / best, 2),
+        "us_per_op": round(median * 1e6, 3),
+        "stdev_pct": round(statistics.pstdev(timings) / median * 100, 2),
+        "calls_per_repeat": number,
+        "alloc_peak_bytes": peak_bytes,
+        "alloc_retained_bytes": retained_bytes,
+    }
+    if case.size:
+        result["bytes_per_op"] = case.size
+        result["mb_per_s"] = round(case.size / median / MB, 2)
+    return result
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Devuelve los casos cuyo rendimiento (ops/s) empeoró más que la tolerancia."""
+    regressions = []
+    for name, result in results["cases"].items():
+        previous = baseline.get("cases", {}).get(name)
+        if not previous:
+            continue
+        change = (result["ops_per_s"] - previous["ops_per_s"]) / previous["ops_per_s"]
+        if change < -tolerance:
+            regressions.append(f"{name}: {previous['ops_per_s']} -> {result['ops_per_s']} ops/s ({change:+.1%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks de tramas, base64, SHA-256 y JSON.")
+    parser.add_argument("--filter", action="append", default=[], help="Ejecutar solo los casos que contengan este texto (repetible).")
+    parser.add_argument("--repeat", type=int, default=5, help="Repeticiones por caso.")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Segundos mínimos por repetición.")
+    parser.add_argument("--output", help="Archivo donde guardar el resultado en JSON.")
+    parser.add_argument("--baseline", help="Resultado JSON anterior con el cual comparar.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Empeoramiento relativo tolerado respecto al baseline.")
+    args = parser.parse_args()
+
+    configure_logging("micro")
+    cases = [case for suite in SUITES.values() for case in suite()]
+    if args.filter:
+        cases = [case for case in cases if any(text in case.name for text in args.filter)]
+
+    results = {
+        "benchmark": "micro",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {"repeat": args.repeat, "min_time": args.min_time},
+        "cases": {},
+    }
+    for case in cases:
+        result = run_case(case, args.repeat, args.min_time)
+        results["cases"][case.name] = result
+        logger.info("%-45s %12.1f ops/s %10s MB/s  pico %9d B  retenido %8d B", case.name, result["ops_per_s"],
+                    result.get("mb_per_s", "-"), result["alloc_peak_bytes"], result["alloc_retained_bytes"])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(json.dumps(results, indent=2) + "\n")
+        logger.info("Resultado guardado en %s.", args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            logger.warning("Regresión: %s", regression)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
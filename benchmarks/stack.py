@@ -0,0 +1,265 @@
+# benchmarks/stack.py
+"""
+Levanta el sistema completo en la máquina local, sin Docker, para benchmarks y
+pruebas de carga: el bus local (bus_connector.LocalBus), una imitación de la API
+de Rclone (fake_rclone.py), una base de datos PostgreSQL desechable y los cuatro
+servicios como procesos independientes.
+
+La base de datos se crea con initdb/pg_ctl (buscados en el PATH o en PG_BIN) y
+solo escucha en un socket Unix dentro de la carpeta de trabajo. También se puede
+usar una base de datos existente a la que ya se le aplicó init.sql.
+
+Los servicios requieren las dependencias de sus requirements.txt (psycopg, requests).
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMON_PACKAGE_DIR = os.path.join(REPO_ROOT, "common_package")
+CLIENT_DIR = os.path.join(REPO_ROOT, "client")
+
+# El harness usa el bus_connector del repositorio y los handlers del cliente.
+for path in (COMMON_PACKAGE_DIR, CLIENT_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from bus_connector import LocalBus, get_logger, transact
+from bus_connector.metrics import STATS_COMMAND
+from fake_rclone import FakeRclone
+
+logger = get_logger("BenchStack")
+
+# Servicio -> (carpeta del código, nombre en el bus).
+SERVICES = {
+    "backup-service": ("backup-service", "bkpsv"),
+    "admin-service": ("admin-service", "admsv"),
+    "cloud-service": ("cloud-service", "clcsv"),
+    "restore-service": ("restore-service", "rstrv"),
+}
+SERVICE_START_TIMEOUT = 30
+CLOUD_PROVIDER = "mega"
+
+
+def _peak_rss_kb(pid):
+    """Lee el pico de memoria residente (VmHWM, en KiB) de un proceso en Linux."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def _current_rss_kb(pid):
+    """Lee la memoria residente actual (VmRSS, en KiB) de un proceso en Linux."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class ThrowawayPostgres:
+    """Clúster de PostgreSQL temporal, inicializado con init.sql y borrado al detenerlo."""
+    def __init__(self, work_dir):
+        self.data_dir = os.path.join(work_dir, "pgdata")
+        # La ruta del socket tiene un largo máximo (~107 bytes), por eso va en /tmp.
+        self.socket_dir = tempfile.mkdtemp(prefix="pgsock-")
+        self.log_path = os.path.join(work_dir, "postgres.log")
+        self._bin_dir = os.getenv("PG_BIN") or os.path.dirname(shutil.which("initdb") or shutil.which("pg_ctl") or "")
+        self._started = False
+
+    def _bin(self, name):
+        path = os.path.join(self._bin_dir, name)
+        if not self._bin_dir or not os.path.exists(path):
+            raise RuntimeError(f"No se encontró '{name}'. Instale PostgreSQL, defina PG_BIN o use --db-host.")
+        return path
+
+    def start(self):
+        subprocess.run([self._bin("initdb"), "-D", self.data_dir, "-U", "postgres", "--auth=trust", "-E", "UTF8"],
+                       check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([self._bin("pg_ctl"), "-D", self.data_dir, "-l", self.log_path, "-w",
+                        "-o", f"-k {self.socket_dir} -c listen_addresses=''", "start"],
+                       check=True, stdout=subprocess.DEVNULL)
+        self._started = True
+        subprocess.run([self._bin("psql"), "-h", self.socket_dir, "-U", "postgres", "-d", "postgres",
+                        "-q", "-v", "ON_ERROR_STOP=1", "-f", os.path.join(REPO_ROOT, "init.sql")],
+                       check=True, stdout=subprocess.DEVNULL)
+        logger.info("PostgreSQL desechable iniciado en %s.", self.socket_dir)
+
+    def env(self):
+        """Variables de entorno de conexión que leen los db_handler de los servicios."""
+        return {"DB_HOST": self.socket_dir, "DB_USER": "postgres", "DB_NAME": "postgres", "DB_PASS": ""}
+
+    def stop(self):
+        if self._started:
+            subprocess.run([self._bin("pg_ctl"), "-D", self.data_dir, "-m", "fast", "-w", "stop"],
+                           check=False, stdout=subprocess.DEVNULL)
+            self._started = False
+        shutil.rmtree(self.socket_dir, ignore_errors=True)
+
+
+class ServiceProcess:
+    """Un servicio del repositorio ejecutado como proceso, con su log en la carpeta de trabajo."""
+    def __init__(self, name, env, log_dir):
+        self.name = name
+        self.code_dir, self.bus_name = SERVICES[name]
+        self.workers = int(env.get("SERVICE_WORKERS", 1))
+        self.env = env
+        self.log_path = os.path.join(log_dir, f"{name}.log")
+        self.process = None
+        self._log_file = None
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def start(self):
+        self._log_file = open(self.log_path, "wb")
+        self.process = subprocess.Popen([sys.executable, "service.py"], cwd=os.path.join(REPO_ROOT, self.code_dir),
+                                        env=self.env, stdout=self._log_file, stderr=subprocess.STDOUT)
+
+    def peak_rss_kb(self):
+        return _peak_rss_kb(self.pid)
+
+    def rss_kb(self):
+        return _current_rss_kb(self.pid)
+
+    def log_tail(self, lines=20):
+        with open(self.log_path, "rb") as f:
+            return b"".join(f.readlines()[-lines:]).decode("utf-8", errors="replace")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self._log_file is not None:
+            self._log_file.close()
+
+
+class LocalStack:
+    """
+    El sistema completo ejecutándose en local.
+
+    Uso:
+        with LocalStack(work_dir, workers=4) as stack:
+            execute_backup(stack.bus_host, stack.bus_port, ...)
+    """
+    def __init__(self, work_dir, workers=None, db_env=None, cloud_latency=0.0, cloud_bandwidth=0, log_level="WARNING"):
+        """Prepara el sistema sin iniciarlo.
+
+        Args:
+            work_dir (str): Carpeta de trabajo (copias, datos de Rclone, BD y logs).
+            workers (int, optional): SERVICE_WORKERS de cada servicio (por defecto, el de cada servicio).
+            db_env (dict, optional): Variables DB_* de una base de datos existente; si se
+                                     omite, se crea una desechable.
+            cloud_latency (float): Segundos de latencia simulada por operación en la nube.
+            cloud_bandwidth (int): Bytes por segundo simulados en la nube (0 = sin límite).
+            log_level (str): LOG_LEVEL de los servicios.
+        """
+        self.work_dir = os.path.abspath(work_dir)
+        self.workers = workers
+        self.log_level = log_level
+        self.bus = LocalBus(port=0)
+        self.bus_host = "127.0.0.1"
+        self.rclone = FakeRclone(os.path.join(self.work_dir, "cloud"), latency=cloud_latency, bandwidth=cloud_bandwidth)
+        self.database = None if db_env else ThrowawayPostgres(self.work_dir)
+        self._db_env = db_env
+        self.services = {}
+
+    @property
+    def bus_port(self):
+        return self.bus.port
+
+    def _service_env(self, name):
+        env = dict(os.environ)
+        env.update(self._db_env or self.database.env())
+        env.update({
+            "PYTHONPATH": COMMON_PACKAGE_DIR,
+            "BUS_HOST": self.bus_host,
+            "BUS_PORT": str(self.bus_port),
+            "SERVICE_NAME": SERVICES[name][1],
+            "LOG_LEVEL": self.log_level,
+            "LOCAL_COPY_DIR": os.path.join(self.work_dir, "local_copy"),
+            "SECONDARY_COPY_DIR": os.path.join(self.work_dir, "secondary_copy"),
+            "PRIMARY_SOURCE_BASE": os.path.join(self.work_dir, "local_copy"),
+            "SECONDARY_SOURCE_BASE": os.path.join(self.work_dir, "secondary_copy"),
+            "RCLONE_API_URL": self.rclone.url,
+            "RCLONE_DATA_DIR": os.path.join(self.work_dir, "rclone_data"),
+            "ACTIVE_PROVIDER_FILE": os.path.join(self.work_dir, "active_provider.info"),
+        })
+        if self.workers:
+            env["SERVICE_WORKERS"] = str(self.workers)
+        return env
+
+    def start(self):
+        for folder in ("local_copy", "secondary_copy", "rclone_data", "cloud", "logs"):
+            os.makedirs(os.path.join(self.work_dir, folder), exist_ok=True)
+        self.bus.start_in_thread()
+        self.rclone.start()
+        if self.database is not None:
+            self.database.start()
+
+        for name in SERVICES:
+            service = ServiceProcess(name, self._service_env(name), os.path.join(self.work_dir, "logs"))
+            service.start()
+            self.services[name] = service
+        for service in self.services.values():
+            self._wait_until_registered(service)
+
+        # Igual que la opción "Configurar proveedor de nube" del cliente.
+        _, r_status, r_content = transact(self.bus_host, self.bus_port, "clcsv", f"config|{CLOUD_PROVIDER}|bench|bench")
+        if r_status != "OK" or r_content.startswith("Error"):
+            raise RuntimeError(f"No se pudo configurar el proveedor de nube: {r_content}")
+        logger.info("Sistema local iniciado (bus en el puerto %s).", self.bus_port)
+        return self
+
+    def _wait_until_registered(self, service):
+        """Espera a que todos los trabajadores del servicio se registren en el bus."""
+        deadline = time.monotonic() + SERVICE_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if service.process.poll() is not None:
+                raise RuntimeError(f"El servicio '{service.name}' terminó al iniciar:\n{service.log_tail()}")
+            registered = self.bus.stats().get(service.bus_name, {}).get("workers", 0)
+            if service.workers <= registered:
+                return
+            time.sleep(0.1)
+        raise RuntimeError(f"El servicio '{service.name}' no se registró en el bus a tiempo:\n{service.log_tail()}")
+
+    def service_stats(self, name):
+        """Consulta las métricas (comando __stats) de un servicio."""
+        _, r_status, r_content = transact(self.bus_host, self.bus_port, SERVICES[name][1], STATS_COMMAND)
+        if r_status != "OK":
+            return None
+        return json.loads(r_content)
+
+    def stop(self):
+        for service in self.services.values():
+            service.stop()
+        self.rclone.stop()
+        self.bus.stop_thread()
+        if self.database is not None:
+            self.database.stop()
+
+    def __enter__(self):
+        try:
+            return self.start()
+        except BaseException:
+            self.stop()
+            raise
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -1,7 +1,237 @@
 import os
-import base64
+import io
 import json
-from bus_connector import transact
+import time
+import hashlib
+from bus_connector import iter_chunks, transact
+
+# Los archivos de hasta este tamaño se suben agrupados con upload_files, para no
+# pagar una ida y vuelta por el bus (y otra de backup-service a la nube) por cada
+# archivo pequeño. La lista de archivos de cada grupo viaja en la cabecera del
+# mensaje, que debe caber en una sola trama del bus (MAX_PAYLOAD_SIZE).
+BATCH_FILE_MAX_SIZE = 256 * 1024
+BATCH_MAX_FILES = 256
+BATCH_MAX_BYTES = 4 * 1024 * 1024
+BATCH_MAX_HEADER_BYTES = 64 * 1024
+# Los archivos desde este tamaño se suben por trozos definidos por contenido: solo
+# se transfieren los trozos que backup-service todavía no tiene guardados.
+CHUNKED_FILE_MIN_SIZE = 8 * 1024 * 1024
+# Si la subida se interrumpe (ej. backup-service se reinició), se consulta a la
+# transacción qué archivos faltan y se reintenta solo con esos. Las consultas se
+# espacian con espera exponencial (de RESUME_INITIAL_DELAY_SECONDS hasta
+# RESUME_MAX_DELAY_SECONDS) durante a lo sumo BACKUP_RESUME_WINDOW_MINUTES minutos
+# desde la primera interrupción; si no se pudo retomar, la transacción se aborta.
+RESUME_WINDOW_MINUTES = float(os.getenv("BACKUP_RESUME_WINDOW_MINUTES", "10"))
+RESUME_INITIAL_DELAY_SECONDS = 5
+RESUME_MAX_DELAY_SECONDS = 60
+
+def _file_metadata(full_path, relative_path):
+    """
+    Tamaño y fecha de modificación de un archivo, para que backup-service omita los
+    que no cambiaron desde el respaldo anterior. No se calcula el hash: un respaldo
+    sin cambios no lee el contenido de ningún archivo, y el de los archivos que se
+    suben lo calcula backup-service al recibirlos (o el cliente al dividirlos en trozos).
+    """
+    stat = os.stat(full_path)
+    return {"relative_path": relative_path, "size": stat.st_size, "mtime": stat.st_mtime}
+
+def _upload_succeeded(relative_path, r_status, r_content):
+    """Valida la respuesta de backup-service a la subida de un archivo."""
+    try:
+        response = json.loads(r_content)
+    except json.JSONDecodeError:
+        # El bus responde con texto plano si no pudo entregar la solicitud.
+        print(f"[BackupExecutor] Error al subir archivo '{relative_path}': {r_content}")
+        return False
+    if r_status != "OK" or response.get("status") != "OK":
+        print(f"[BackupExecutor] Error al subir archivo '{relative_path}': {response.get('message', r_content)}")
+        return False
+    return True
+
+def _upload_group(bus_host, bus_port, target_service, transaction_id, group):
+    """
+    Sube un grupo de archivos pequeños en una sola solicitud upload_files.
+
+    Args:
+        group (list): Tuplas (ruta_relativa, contenido).
+
+    Returns:
+        bool: True si todos los archivos del grupo se subieron correctamente.
+    """
+    print(f"  Subiendo grupo de {len(group)} archivo(s)...")
+    upload_payload = {
+        "transaction_id": transaction_id,
+        "files": [{"relative_path": relative_path, "size": len(content)} for relative_path, content in group]
+    }
+    r_service, r_status, r_content = transact(bus_host, bus_port, target_service, f"upload_files|{json.dumps(upload_payload)}",
+                                              body=io.BytesIO(b"".join(content for _, content in group)))
+    try:
+        response = json.loads(r_content)
+    except json.JSONDecodeError:
+        print(f"[BackupExecutor] Error al subir grupo de archivos: {r_content}")
+        return False
+    if r_status != "OK" or "files" not in response:
+        print(f"[BackupExecutor] Error al subir grupo de archivos: {response.get('message', r_content)}")
+        return False
+
+    all_uploaded = True
+    for (relative_path, _), file_response in zip(group, response["files"]):
+        if file_response.get("status") != "OK":
+            print(f"[BackupExecutor] Error al subir archivo '{relative_path}': {file_response.get('message')}")
+            all_uploaded = False
+    return all_uploaded
+
+def _upload_chunked_file(bus_host, bus_port, target_service, transaction_id, full_path, file_meta):
+    """
+    Sube un archivo grande por trozos: envía la lista de trozos y luego solo los
+    que backup-service indica que le faltan.
+
+    Returns:
+        bool: True si el archivo se subió correctamente.
+    """
+    relative_path = file_meta["relative_path"]
+    chunks = []
+    offsets = {}
+    offset = 0
+    # El hash del archivo completo se calcula en la misma lectura que divide los trozos.
+    file_hasher = hashlib.sha256()
+    with open(full_path, "rb") as f:
+        for chunk in iter_chunks(f):
+            file_hasher.update(chunk)
+            chunk_hash = hashlib.sha256(chunk).hexdigest()
+            chunks.append([chunk_hash, len(chunk)])
+            offsets.setdefault(chunk_hash, offset)
+            offset += len(chunk)
+
+    chunked_payload = {"transaction_id": transaction_id, "relative_path": relative_path,
+                       "hash": file_hasher.hexdigest(), "size": offset, "chunks": chunks}
+    r_service, r_status, r_content = transact(bus_host, bus_port, target_service, f"upload_chunked_file|{json.dumps(chunked_payload)}")
+    if not _upload_succeeded(relative_path, r_status, r_content):
+        return False
+    missing_chunks = json.loads(r_content).get("missing_chunks", [])
+    print(f"  Subiendo: {relative_path} ({len(missing_chunks)} de {len(chunks)} trozo(s) nuevos)...")
+
+    sizes = dict(chunks)
+    with open(full_path, "rb") as f:
+        for chunk_hash in missing_chunks:
+            f.seek(offsets[chunk_hash])
+            chunk_payload = {"transaction_id": transaction_id, "relative_path": relative_path, "chunk_hash": chunk_hash}
+            r_service, r_status, r_content = transact(bus_host, bus_port, target_service, f"upload_chunk|{json.dumps(chunk_payload)}",
+                                                      body=io.BytesIO(f.read(sizes[chunk_hash])))
+            if not _upload_succeeded(relative_path, r_status, r_content):
+                return False
+    return True
+
+def _upload_files(bus_host, bus_port, target_service, transaction_id, files_to_process_paths, relative_paths, files_metadata, files_to_upload):
+    """
+    Sube a la transacción los archivos de files_to_upload: los grandes por trozos,
+    los pequeños en grupos (upload_files) y el resto de a uno en modo flujo.
+
+    Returns:
+        bool: True si todos los archivos se subieron correctamente.
+    """
+    pending_batch = []
+    pending_batch_bytes = 0
+    pending_batch_header_bytes = 0
+    for full_path in files_to_process_paths:
+        relative_path = relative_paths[full_path]
+        if relative_path not in files_to_upload:
+            continue
+
+        upload_payload = {
+            "transaction_id": transaction_id,
+            "relative_path": relative_path
+        }
+        message_to_send = f"upload_file|{json.dumps(upload_payload)}"
+
+        file_size = os.path.getsize(full_path)
+        if file_size >= CHUNKED_FILE_MIN_SIZE:
+            if not _upload_chunked_file(bus_host, bus_port, target_service, transaction_id, full_path, files_metadata[full_path]):
+                return False
+            continue
+        if file_size <= BATCH_FILE_MAX_SIZE:
+            # Entrada aproximada del archivo en la cabecera de upload_files.
+            header_bytes = len(json.dumps({"relative_path": relative_path, "size": file_size}).encode('utf-8')) + 2
+            if pending_batch and pending_batch_header_bytes + header_bytes > BATCH_MAX_HEADER_BYTES:
+                if not _upload_group(bus_host, bus_port, target_service, transaction_id, pending_batch):
+                    return False
+                pending_batch = []
+                pending_batch_bytes = 0
+                pending_batch_header_bytes = 0
+            with open(full_path, "rb") as f:
+                pending_batch.append((relative_path, f.read()))
+            pending_batch_bytes += file_size
+            pending_batch_header_bytes += header_bytes
+            if len(pending_batch) >= BATCH_MAX_FILES or pending_batch_bytes >= BATCH_MAX_BYTES:
+                if not _upload_group(bus_host, bus_port, target_service, transaction_id, pending_batch):
+                    return False
+                pending_batch = []
+                pending_batch_bytes = 0
+                pending_batch_header_bytes = 0
+            continue
+
+        # El contenido viaja como cuerpo binario en modo flujo, sin límite de tamaño.
+        print(f"  Subiendo: {relative_path}...")
+        with open(full_path, "rb") as f:
+            r_service, r_status, r_content = transact(bus_host, bus_port, target_service, message_to_send, body=f)
+        if not _upload_succeeded(relative_path, r_status, r_content):
+            return False
+
+    if pending_batch and not _upload_group(bus_host, bus_port, target_service, transaction_id, pending_batch):
+        return False
+    return True
+
+def _resume_delays(window_seconds):
+    """Genera las esperas entre consultas, con espera exponencial, hasta agotar la ventana."""
+    deadline = time.monotonic() + window_seconds
+    delay = RESUME_INITIAL_DELAY_SECONDS
+    while (remaining := deadline - time.monotonic()) > 0:
+        yield min(delay, remaining)
+        delay = min(delay * 2, RESUME_MAX_DELAY_SECONDS)
+
+def _resume_transaction(bus_host, bus_port, target_service, transaction_id, delays):
+    """
+    Consulta a backup-service el estado de una transacción cuya subida se
+    interrumpió, esperando antes de cada consulta. Si el servicio no responde
+    (ej. se está reiniciando), vuelve a consultar hasta que se agoten las esperas.
+
+    Args:
+        delays (iterator): Esperas entre consultas, compartidas por todas las
+                           interrupciones del respaldo (ver _resume_delays).
+
+    Returns:
+        set: Rutas relativas que aún faltan subir, o None si la transacción no se
+             puede retomar (no existe, está marcada como fallida o se agotó la ventana).
+    """
+    for delay in delays:
+        print(f"[BackupExecutor] Reintentando en {delay:.0f} s: consultando el estado de la transacción {transaction_id}...")
+        time.sleep(delay)
+        r_service, r_status, r_content = transact(bus_host, bus_port, target_service,
+                                                  f"transaction_status|{json.dumps({'transaction_id': transaction_id})}")
+        try:
+            response = json.loads(r_content)
+        except json.JSONDecodeError:
+            print(f"[BackupExecutor] No se pudo consultar la transacción: {r_content}")
+            continue
+        if r_status != "OK" or response.get("status") != "OK" or response.get("state") == "failed":
+            print(f"[BackupExecutor] La transacción no se puede retomar: {response.get('message', response.get('state'))}")
+            return None
+        files_to_upload = set(response.get("files_to_upload", []))
+        print(f"[BackupExecutor] Retomando respaldo: {response.get('processed_files', 0)} archivo(s) ya procesados, faltan {len(files_to_upload)}.")
+        return files_to_upload
+
+    print(f"[BackupExecutor] No se pudo retomar la transacción {transaction_id} en {RESUME_WINDOW_MINUTES:g} minuto(s).")
+    return None
+
+def _abort_transaction(bus_host, bus_port, target_service, transaction_id):
+    """Pide a backup-service que revierta la transacción, para no esperar a que expire."""
+    try:
+        print("[BackupExecutor] Intentando notificar al servicio sobre el aborto...")
+        abort_payload = {"transaction_id": transaction_id, "abort": True}
+        message_to_send = f"end_backup|{json.dumps(abort_payload)}"
+        transact(bus_host, bus_port, target_service, message_to_send)
+    except Exception as abort_e:
+        print(f"[BackupExecutor] Error al intentar notificar aborto: {abort_e}")
 
 def execute_backup(bus_host, bus_port, source_path, structure, auto_job_id=None):
     """
@@ -42,10 +272,14 @@ def execute_backup(bus_host, bus_port, source_path, structure, auto_job_id=None)
         # Inicio del respaldo
         print(f"[BackupExecutor] Iniciando transacción de respaldo para {len(files_to_process_paths)} archivo(s)...")
         files_metadata_for_begin = []
+        relative_paths = {}
+        files_metadata = {}
         for full_path in files_to_process_paths:
             relative_path = os.path.relpath(full_path, base_path_for_relative)
             relative_path = relative_path.replace(os.sep, '/')
-            files_metadata_for_begin.append({"relative_path": relative_path})
+            relative_paths[full_path] = relative_path
+            files_metadata[full_path] = _file_metadata(full_path, relative_path)
+            files_metadata_for_begin.append(files_metadata[full_path])
 
         begin_payload = {"structure": structure, "files_to_backup": files_metadata_for_begin}
         if auto_job_id is not None:
@@ -66,37 +300,20 @@ def execute_backup(bus_host, bus_port, source_path, structure, auto_job_id=None)
             return False
         print(f"[BackupExecutor] Transacción iniciada con ID: {transaction_id}")
 
-        # Subir archivos
-        print(f"[BackupExecutor] Subiendo {len(files_to_process_paths)} archivo(s)...")
-        for full_path in files_to_process_paths:
-            relative_path = os.path.relpath(full_path, base_path_for_relative)
-            relative_path = relative_path.replace(os.sep, '/')
-            
-            with open(full_path, "rb") as f:
-                file_bytes = f.read()
-            content_b64 = base64.b64encode(file_bytes).decode('utf-8')
-            
-            upload_payload = {
-                "transaction_id": transaction_id,
-                "relative_path": relative_path,
-                "content_b64": content_b64
-            }
-            message_to_send = f"upload_file|{json.dumps(upload_payload)}"
-
-            if len(message_to_send.encode('utf-8')) > (99999 - len(target_service)):
-                 print(f"[BackupExecutor] Error: El archivo '{relative_path}' es demasiado grande.")
-                 if transaction_id:
-                    end_payload = {"transaction_id": transaction_id, "abort": True}
-                    message_to_send = f"end_backup|{json.dumps(end_payload)}"
-                    transact(bus_host, bus_port, target_service, message_to_send)
-                 return False
-
-            print(f"  Subiendo: {relative_path}...")
-            r_service, r_status, r_content = transact(bus_host, bus_port, target_service, message_to_send)
-            response = json.loads(r_content)
-
-            if r_status != "OK" or response.get("status") != "OK":
-                print(f"[BackupExecutor] Error al subir archivo '{relative_path}': {response.get('message', r_content)}")
+        # Subir solo los archivos que cambiaron desde el respaldo anterior
+        files_to_upload = set(response.get("files_to_upload", relative_paths.values()))
+        unchanged_files = response.get("unchanged_files", 0)
+        if unchanged_files:
+            print(f"[BackupExecutor] {unchanged_files} archivo(s) sin cambios desde el respaldo anterior.")
+        print(f"[BackupExecutor] Subiendo {len(files_to_upload)} archivo(s)...")
+        resume_delays = None
+        while not _upload_files(bus_host, bus_port, target_service, transaction_id, files_to_process_paths,
+                                relative_paths, files_metadata, files_to_upload):
+            if resume_delays is None:
+                resume_delays = _resume_delays(RESUME_WINDOW_MINUTES * 60)
+            files_to_upload = _resume_transaction(bus_host, bus_port, target_service, transaction_id, resume_delays)
+            if files_to_upload is None:
+                _abort_transaction(bus_host, bus_port, target_service, transaction_id)
                 return False
 
         # Finalización del respaldo
@@ -117,13 +334,7 @@ def execute_backup(bus_host, bus_port, source_path, structure, auto_job_id=None)
     except Exception as e:
         print(f"[BackupExecutor] Ocurrió un error durante el proceso de respaldo: {e}")
         if transaction_id and target_service:
-            try:
-                print("[BackupExecutor] Intentando notificar al servicio sobre el aborto...")
-                abort_payload = {"transaction_id": transaction_id, "abort": True}
-                message_to_send = f"end_backup|{json.dumps(abort_payload)}"
-                transact(bus_host, bus_port, target_service, message_to_send)
-            except Exception as abort_e:
-                print(f"[BackupExecutor] Error al intentar notificar aborto: {abort_e}")
+            _abort_transaction(bus_host, bus_port, target_service, transaction_id)
         return False
 
 def handle_create_backup(bus_host, bus_port):
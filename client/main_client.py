@@ -6,7 +6,7 @@ from handlers.restore_handler import handle_restore_backup
 
 # --- Configuración del cliente ---
 BUS_HOST = os.getenv("BUS_HOST", "localhost")
-BUS_PORT = 5000
+BUS_PORT = int(os.getenv("BUS_PORT", 5000))
 
 def show_menu():
     """Imprime el menú principal de opciones y retorna la elección del usuario."""
@@ -3,10 +3,28 @@ import os
 import time
 import json
 from datetime import datetime, timedelta
-from bus_connector import transact
+from bus_connector import transact, transact_batch
 
 LOG_DIR = "/app/logs"
 SCHEDULER_LOG_FILE = os.path.join(LOG_DIR, "scheduler.log")
+# Páginas de trabajos automáticos que se piden al admin-service en cada lote.
+JOB_PAGES_PER_BATCH = 5
+
+def fetch_job_pages(bus_host, bus_port, admin_service_name, first_page):
+    """
+    Pide varias páginas de trabajos automáticos en un solo lote.
+
+    Returns:
+        list: Tuplas (nombre_servicio, estado, contenido), una por página. Si el
+              lote falla, una sola tupla con el error.
+    """
+    pages = range(first_page, first_page + JOB_PAGES_PER_BATCH)
+    print(f"[SchedulerScript] Solicitando páginas {pages[0]} a {pages[-1]} de trabajos automáticos...", flush=True)
+    requests = [f"list_auto_jobs|{json.dumps({'page': page})}" for page in pages]
+    r_service, r_status, r_contents = transact_batch(bus_host, bus_port, admin_service_name, requests)
+    if r_status != "OK":
+        return [(r_service, r_status, r_contents)]
+    return [(r_service, r_status, r_content) for r_content in r_contents]
 
 def scheduler_loop(bus_host, bus_port):
     # Importar execute_backup aquí para evitar problemas de importación circular
@@ -31,13 +49,12 @@ def scheduler_loop(bus_host, bus_port):
                 try:
                     print(f"\n[SchedulerScript] {datetime.now()}: Verificando trabajos de respaldo automático...", flush=True)
                     
+                    # Las páginas se piden en lotes y se procesan una a una, en orden.
+                    pending_pages = []
                     while True:
-                        page_payload_dict = {"page": current_page}
-                        page_payload_json = json.dumps(page_payload_dict)
-                        message_to_send = f"list_auto_jobs|{page_payload_json}"
-                        
-                        print(f"[SchedulerScript] Solicitando página {current_page} de trabajos automáticos...", flush=True)
-                        r_service, r_status, r_content = transact(bus_host, bus_port, admin_service_name, message_to_send)
+                        if not pending_pages:
+                            pending_pages = fetch_job_pages(bus_host, bus_port, admin_service_name, current_page)
+                        r_service, r_status, r_content = pending_pages.pop(0)
 
                         if r_status == "OK":
                             try:
@@ -1,13 +1,25 @@
 # cloud-service/rclone_handler.py
 import requests
 import os
+import io
 import base64
+import shutil
+import tempfile
+from bus_connector import get_logger
+
+logger = get_logger("RcloneHandler")
+
+# API de Rclone (rclone rcd, iniciada por start.sh) y carpeta local que comparte con el servicio.
+RCLONE_API_URL = os.getenv("RCLONE_API_URL", "http://localhost:5572")
+RCLONE_DATA_DIR = os.getenv("RCLONE_DATA_DIR", "/data")
+# Tamaño de los bloques usados al copiar a disco el contenido recibido.
+COPY_BUFFER_SIZE = 1024 * 1024
 
 def create_remote(provider, user_creds, pass_creds):
     """
     Usa la API de Rclone para crear una nueva configuración de nube.
     """
-    api_endpoint = "http://localhost:5572/config/create"
+    api_endpoint = f"{RCLONE_API_URL}/config/create"
     
     # Lee las credenciales de la API desde el entorno
     api_user = os.getenv("RCLONE_API_USER")
@@ -35,32 +47,47 @@ def create_remote(provider, user_creds, pass_creds):
         return False, f"Error al comunicarse con la API de Rclone: {e.response.text if e.response else e}"
 
 def upload_file(remote_name, cloud_path, file_content_b64):
+    """
+    Sube un archivo a la nube a partir de su contenido en Base64.
+
+    Se mantiene por compatibilidad; decodifica el contenido y delega en
+    upload_file_from_stream.
+    """
+    try:
+        file_bytes = base64.b64decode(file_content_b64)
+    except Exception as e:
+        return False, f"Error durante la subida del archivo: {e}"
+    return upload_file_from_stream(remote_name, cloud_path, io.BytesIO(file_bytes))
+
+def upload_file_from_stream(remote_name, cloud_path, file_stream):
     """
     Sube un archivo a la nube usando la API de Rclone.
 
     Para hacer esto, primero se guarda el archivo temporalmente en el
     contenedor, luego se le pide a Rclone que lo copie, y finalmente
-    se borra el archivo temporal.
+    se borra el archivo temporal. El contenido se copia por bloques desde
+    el objeto tipo archivo recibido, sin cargarlo completo en memoria.
     """
-    api_endpoint = "http://localhost:5572/operations/copyfile"
+    api_endpoint = f"{RCLONE_API_URL}/operations/copyfile"
     api_user = os.getenv("RCLONE_API_USER")
     api_pass = os.getenv("RCLONE_API_PASS")
     
     # Extraer solo el nombre del archivo de la ruta completa en la nube
     filename = os.path.basename(cloud_path)
-    # Ruta temporal donde se guarda el archivo dentro del contenedor
-    temp_local_path = f"/data/{filename}"
+    # Ruta temporal donde se guarda el archivo dentro del contenedor. Se usa un nombre
+    # único porque varios trabajadores pueden subir archivos homónimos a la vez.
+    temp_filename = f"temp_upload_{filename}_{os.urandom(4).hex()}"
+    temp_local_path = os.path.join(RCLONE_DATA_DIR, temp_filename)
 
     try:
-        # Decodificar Base64 y guardar el archivo temporalmente
-        file_bytes = base64.b64decode(file_content_b64)
+        # Guardar el archivo temporalmente
         with open(temp_local_path, "wb") as f:
-            f.write(file_bytes)
+            shutil.copyfileobj(file_stream, f)
 
         # Construir el payload para la API de Rclone
         payload = {
-            "srcFs": "/data",           # El sistema de archivos de origen es la carpeta /data
-            "srcRemote": filename,      # El nombre del archivo a copiar desde /data
+            "srcFs": RCLONE_DATA_DIR,    # El sistema de archivos de origen es la carpeta compartida
+            "srcRemote": temp_filename, # El nombre del archivo a copiar desde esa carpeta
             "dstFs": f"{remote_name}:", # El remote de destino (ej: "mega_remote:")
             "dstRemote": cloud_path     # La ruta completa de destino en la nube
         }
@@ -78,62 +105,142 @@ def upload_file(remote_name, cloud_path, file_content_b64):
         if os.path.exists(temp_local_path):
             os.remove(temp_local_path)
 
-def download_file_content_as_base64(remote_name, cloud_path):
+def _copy_exact(source, target, size):
+    """Copia exactamente `size` bytes de un objeto tipo archivo a otro, por bloques."""
+    remaining = size
+    while remaining:
+        block = source.read(min(remaining, COPY_BUFFER_SIZE))
+        if not block:
+            raise EOFError(f"faltan {remaining} bytes del contenido")
+        target.write(block)
+        remaining -= len(block)
+
+def upload_files_from_stream(remote_name, files, file_stream):
+    """
+    Sube varios archivos a la nube con una sola copia de Rclone.
+
+    Los archivos se dejan en una carpeta temporal con la misma estructura de
+    carpetas que tendrán en la nube y se copian juntos con sync/copy, así que
+    las carpetas de destino se crean una sola vez para todo el grupo. Si esa
+    copia falla, se reintenta archivo por archivo para saber cuáles fallaron.
+
+    Args:
+        remote_name (str): Remote de destino (ej. "mega_remote").
+        files (list): Tuplas (ruta en la nube, tamaño en bytes), en el orden del contenido.
+        file_stream (io.BufferedIOBase): Contenidos de los archivos, concatenados.
+
+    Returns:
+        list: Una tupla (éxito, mensaje) por archivo, en el mismo orden.
+    """
+    api_user = os.getenv("RCLONE_API_USER")
+    api_pass = os.getenv("RCLONE_API_PASS")
+    staging_dir = tempfile.mkdtemp(prefix="temp_upload_group_", dir=RCLONE_DATA_DIR)
+    results = [None] * len(files)
+
+    try:
+        staged = []
+        for i, (cloud_path, size) in enumerate(files):
+            local_path = os.path.normpath(os.path.join(staging_dir, cloud_path.lstrip("/")))
+            try:
+                if not local_path.startswith(staging_dir + os.sep):
+                    # Se consume igual su contenido para no desalinear los archivos siguientes.
+                    _copy_exact(file_stream, io.BytesIO(), size)
+                    raise ValueError("la ruta sale de la carpeta de destino")
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                with open(local_path, "wb") as f:
+                    _copy_exact(file_stream, f, size)
+                staged.append(i)
+            except Exception as e:
+                results[i] = (False, f"Error durante la subida del archivo '{cloud_path}': {e}")
+                if isinstance(e, EOFError):
+                    break # Contenido incompleto: los archivos siguientes tampoco llegaron.
+        for i in range(len(files)):
+            if results[i] is None and i not in staged:
+                results[i] = (False, f"Error durante la subida del archivo '{files[i][0]}': falta su contenido.")
+
+        if not staged:
+            return results
+
+        payload = {"srcFs": staging_dir, "dstFs": f"{remote_name}:"}
+        try:
+            response = requests.post(f"{RCLONE_API_URL}/sync/copy", auth=(api_user, api_pass), json=payload)
+            response.raise_for_status()
+            for i in staged:
+                results[i] = (True, f"Archivo '{os.path.basename(files[i][0])}' subido exitosamente a '{files[i][0]}'.")
+            return results
+        except requests.exceptions.RequestException as e:
+            logger.warning("Fallo la copia agrupada de %s archivo(s), se reintenta de a uno: %s", len(staged), e)
+
+        copy_endpoint = f"{RCLONE_API_URL}/operations/copyfile"
+        for i in staged:
+            cloud_path = files[i][0]
+            payload = {"srcFs": staging_dir, "srcRemote": cloud_path.lstrip("/"), "dstFs": f"{remote_name}:", "dstRemote": cloud_path}
+            try:
+                response = requests.post(copy_endpoint, auth=(api_user, api_pass), json=payload)
+                response.raise_for_status()
+                results[i] = (True, f"Archivo '{os.path.basename(cloud_path)}' subido exitosamente a '{cloud_path}'.")
+            except Exception as e:
+                results[i] = (False, f"Error durante la subida del archivo '{cloud_path}': {e}")
+        return results
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+def download_file_as_stream(remote_name, cloud_path):
     """
-    Descarga un archivo desde la nube y devuelve su contenido como Base64.
+    Descarga un archivo desde la nube y devuelve un objeto tipo archivo para leerlo.
     Lo hace copiando el archivo a una ubicación temporal en el contenedor del cloud-service,
-    leyéndolo, y luego eliminándolo.
+    abriéndolo, y luego eliminando su entrada del directorio. El archivo abierto sigue
+    siendo legible hasta que quien lo recibe lo cierra, sin cargarlo completo en memoria.
     """
     api_user = os.getenv("RCLONE_API_USER")
     api_pass = os.getenv("RCLONE_API_PASS")
     
-    # Usar un nombre de archivo temporal único para evitar colisiones si hay descargas concurrentes
-    # (aunque este servicio es de un solo hilo por ahora)
+    # Usar un nombre de archivo temporal único para evitar colisiones entre descargas
+    # concurrentes de distintos trabajadores
     temp_filename = f"temp_download_{os.path.basename(cloud_path)}_{os.urandom(4).hex()}"
-    temp_local_download_path = f"/data/{temp_filename}" # /data es el volumen de rclone_data
+    temp_local_download_path = os.path.join(RCLONE_DATA_DIR, temp_filename) # Volumen de rclone_data
 
     copy_payload = {
         "srcFs": f"{remote_name}:", # ej: "mega_remote:"
         "srcRemote": cloud_path,    # ej: "backups/documentos/file.txt"
-        "dstFs": "/data/",          # Directorio local dentro del contenedor de cloud-service
-        "dstRemote": temp_filename  # Nombre del archivo en /data
+        "dstFs": RCLONE_DATA_DIR,    # Directorio local dentro del contenedor de cloud-service
+        "dstRemote": temp_filename  # Nombre del archivo en esa carpeta
     }
-    copy_endpoint = "http://localhost:5572/operations/copyfile"
+    copy_endpoint = f"{RCLONE_API_URL}/operations/copyfile"
     
     try:
-        print(f"[RcloneHandler] Copiando desde nube: {remote_name}:{cloud_path} a local {temp_local_download_path}", flush=True)
+        logger.debug("Copiando desde nube: %s:%s a local %s", remote_name, cloud_path, temp_local_download_path)
         response = requests.post(copy_endpoint, auth=(api_user, api_pass), json=copy_payload)
         response.raise_for_status() 
 
         if os.path.exists(temp_local_download_path):
-            with open(temp_local_download_path, "rb") as f:
-                file_bytes = f.read()
-            print(f"[RcloneHandler] Archivo leído desde {temp_local_download_path}, tamaño: {len(file_bytes)} bytes", flush=True)
-            return True, base64.b64encode(file_bytes).decode('utf-8')
+            file_handle = open(temp_local_download_path, "rb")
+            logger.debug("Archivo abierto desde %s, tamaño: %s bytes", temp_local_download_path, os.path.getsize(temp_local_download_path))
+            return True, file_handle
         else:
-            print(f"[RcloneHandler] Error: Archivo no encontrado en {temp_local_download_path} después de la copia.", flush=True)
+            logger.error("Error: Archivo no encontrado en %s después de la copia.", temp_local_download_path)
             return False, "Error: El archivo no se pudo copiar desde la nube al área temporal."
 
     except requests.exceptions.RequestException as e:
         error_text = e.response.text if e.response else str(e)
-        print(f"[RcloneHandler] Error de API Rclone al descargar: {error_text}", flush=True)
+        logger.error("Error de API Rclone al descargar: %s", error_text)
         return False, f"Error de API Rclone al descargar: {error_text}"
     except Exception as e:
-        print(f"[RcloneHandler] Error inesperado durante descarga de nube: {e}", flush=True)
+        logger.error("Error inesperado durante descarga de nube: %s", e)
         return False, f"Error inesperado durante la descarga desde la nube: {str(e)}"
     finally:
         if os.path.exists(temp_local_download_path):
             try:
                 os.remove(temp_local_download_path)
-                print(f"[RcloneHandler] Archivo temporal {temp_local_download_path} eliminado.", flush=True)
+                logger.debug("Archivo temporal %s eliminado.", temp_local_download_path)
             except Exception as e_del:
-                print(f"[RcloneHandler] Error al eliminar archivo temporal {temp_local_download_path}: {e_del}", flush=True)
+                logger.error("Error al eliminar archivo temporal %s: %s", temp_local_download_path, e_del)
 
 def delete_file_from_remote(remote_name, cloud_path):
     """
     Elimina un archivo específico de la nube usando la API de Rclone.
     """
-    api_endpoint = "http://localhost:5572/operations/deletefile"
+    api_endpoint = f"{RCLONE_API_URL}/operations/deletefile"
     api_user = os.getenv("RCLONE_API_USER")
     api_pass = os.getenv("RCLONE_API_PASS")
 
@@ -143,22 +250,22 @@ def delete_file_from_remote(remote_name, cloud_path):
     }
     
     try:
-        print(f"[RcloneHandler] Solicitando eliminación de nube: {remote_name}:{cloud_path}", flush=True)
+        logger.info("Solicitando eliminación de nube: %s:%s", remote_name, cloud_path)
         response = requests.post(api_endpoint, auth=(api_user, api_pass), json=payload)
         response.raise_for_status() # Lanza excepción para errores HTTP 4xx/5xx
         # Rclone devuelve un cuerpo vacío en éxito para deletefile
-        print(f"[RcloneHandler] Archivo '{cloud_path}' eliminado exitosamente de '{remote_name}'.", flush=True)
+        logger.info("Archivo '%s' eliminado exitosamente de '%s'.", cloud_path, remote_name)
         return True, f"Archivo '{cloud_path}' eliminado exitosamente de '{remote_name}'."
     except requests.exceptions.HTTPError as e:
         # Intentar obtener más detalles del error de Rclone si es posible
         error_details = e.response.text
-        print(f"[RcloneHandler] Error HTTP de API Rclone al eliminar '{cloud_path}': {e.response.status_code} - {error_details}", flush=True)
+        logger.error("Error HTTP de API Rclone al eliminar '%s': %s - %s", cloud_path, e.response.status_code, error_details)
 
         # Se asume que un error HTTP significa que no se pudo confirmar la eliminación.
         return False, f"Error de API Rclone al eliminar '{cloud_path}': {e.response.status_code} - {error_details}"
     except requests.exceptions.RequestException as e:
-        print(f"[RcloneHandler] Error de comunicación con API Rclone al eliminar '{cloud_path}': {e}", flush=True)
+        logger.error("Error de comunicación con API Rclone al eliminar '%s': %s", cloud_path, e)
         return False, f"Error de comunicación con API Rclone al eliminar '{cloud_path}': {str(e)}"
     except Exception as e:
-        print(f"[RcloneHandler] Error inesperado durante eliminación de nube para '{cloud_path}': {e}", flush=True)
+        logger.error("Error inesperado durante eliminación de nube para '%s': %s", cloud_path, e)
         return False, f"Error inesperado durante eliminación de nube para '{cloud_path}': {str(e)}"
\ No newline at end of file
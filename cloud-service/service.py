@@ -1,15 +1,19 @@
 # cloud-service/service.py
+import io
 import os
-import time
 import json
-from bus_connector import ServiceConnector
-from rclone_handler import create_remote, upload_file, download_file_content_as_base64, delete_file_from_remote
+from bus_connector import ServiceWorkerPool, configure_logging, get_logger
+from rclone_handler import create_remote, upload_file, upload_file_from_stream, upload_files_from_stream, download_file_as_stream, delete_file_from_remote
 
 # --- Configuración del servicio ---
 BUS_HOST = os.getenv("BUS_HOST")
-BUS_PORT = 5000
+BUS_PORT = int(os.getenv("BUS_PORT", 5000))
 SERVICE_NAME = os.getenv("SERVICE_NAME")
-ACTIVE_PROVIDER_FILE = "/config/active_provider.info" # Ruta a un archivo para guardar el proveedor activo.
+# Número de conexiones (trabajadores) que el servicio registra en el bus.
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "1"))
+ACTIVE_PROVIDER_FILE = os.getenv("ACTIVE_PROVIDER_FILE", "/config/active_provider.info") # Ruta a un archivo para guardar el proveedor activo.
+
+logger = get_logger("ServiceLogic")
 
 def set_active_provider(provider_name):
     """Guarda el nombre del proveedor activo en un archivo."""
@@ -24,8 +28,13 @@ def get_active_provider():
     except FileNotFoundError:
         return None
 
-def process_request(data_received):
-    """Procesa las solicitudes para el servicio de nube."""
+def process_request(data_received, body=None):
+    """
+    Procesa las solicitudes para el servicio de nube.
+
+    Devuelve la respuesta como texto o, para las descargas, una tupla
+    (respuesta, cuerpo_binario) que se envía en modo flujo.
+    """
     parts = data_received.split('|')
     command = parts[0]
     
@@ -34,7 +43,7 @@ def process_request(data_received):
             # Extracción de los datos: config|provider|user|pass
             _, provider, user, password = parts
             
-            print(f"[ServiceLogic] Creando configuración de Rclone para '{provider}'...", flush=True)
+            logger.info("Creando configuración de Rclone para '%s'...", provider)
             success, message = create_remote(provider, user, password)
             
             if success:
@@ -55,14 +64,50 @@ def process_request(data_received):
             # Se construye el nombre del remote.
             remote_name = f"{provider}_remote"
             
-            _, cloud_path, file_content_b64 = parts
-            print(f"[ServiceLogic] Subiendo archivo a '{remote_name}:{cloud_path}'...", flush=True)
-            success, message = upload_file(remote_name, cloud_path, file_content_b64)
+            if body is not None:
+                # Espera: upload|cloud_path, con el contenido como cuerpo binario del flujo.
+                _, cloud_path = parts
+                logger.debug("Subiendo archivo a '%s:%s'...", remote_name, cloud_path)
+                success, message = upload_file_from_stream(remote_name, cloud_path, body)
+            else:
+                _, cloud_path, file_content_b64 = parts
+                logger.debug("Subiendo archivo a '%s:%s'...", remote_name, cloud_path)
+                success, message = upload_file(remote_name, cloud_path, file_content_b64)
             return message
 
         except ValueError:
             return "Error: Formato de comando de subida incorrecto."
     
+    elif command == "upload_files":
+        try:
+            # Espera: upload_files|{"files": [{"path": ruta en la nube, "size": bytes}, ...]}, con los
+            # contenidos de los archivos concatenados en ese orden como cuerpo binario.
+            # Responde en JSON con el resultado de cada archivo, en el mismo orden.
+            _, json_payload_str = data_received.split('|', 1)
+            payload = json.loads(json_payload_str)
+            files = payload.get("files")
+            if not isinstance(files, list):
+                return "Error: El payload para upload_files debe contener una lista de 'files'."
+
+            provider = get_active_provider()
+            if not provider:
+                return "Error: No hay ningún proveedor de nube configurado. Por favor, configúrelo primero."
+
+            remote_name = f"{provider}_remote"
+            logger.debug("Subiendo grupo de %s archivo(s) a '%s'...", len(files), remote_name)
+            results = upload_files_from_stream(remote_name, [(f["path"], f["size"]) for f in files],
+                                               body if body is not None else io.BytesIO())
+            return json.dumps({"status": "OK", "files": [
+                {"status": "OK" if success else "ERROR", "message": message} for success, message in results
+            ]})
+        except json.JSONDecodeError:
+            return "Error: Payload JSON malformado para upload_files."
+        except (KeyError, TypeError, ValueError):
+            return "Error: Formato de comando de upload_files incorrecto."
+        except Exception as e:
+            logger.error("Error inesperado procesando upload_files: %s", e)
+            return f"Error: Error interno del servidor procesando upload_files: {str(e)}"
+
     elif command == "download":
         try:
             # Espera: download|cloud_path_on_remote
@@ -72,20 +117,19 @@ def process_request(data_received):
                 return "Error: No hay proveedor de nube configurado."
             
             remote_name = f"{provider}_remote"
-            print(f"[ServiceLogic] Solicitud de descarga para '{remote_name}:{cloud_file_path}'...", flush=True)
+            logger.debug("Solicitud de descarga para '%s:%s'...", remote_name, cloud_file_path)
             
-            success, content_or_error_msg = download_file_content_as_base64(remote_name, cloud_file_path)
+            success, content_or_error_msg = download_file_as_stream(remote_name, cloud_file_path)
             
             if success:
-                # content_or_error_msg es el contenido en base64
-                # El bus espera una cadena. El cliente que recibe debe saber que es base64.
-                return content_or_error_msg 
+                # content_or_error_msg es el archivo abierto; se envía como cuerpo binario en modo flujo.
+                return "OK", content_or_error_msg
             else:
                 return f"Error: {content_or_error_msg}"
         except ValueError:
             return "Error: Formato de comando de descarga incorrecto."
         except Exception as e:
-            print(f"[ServiceLogic] Error inesperado procesando descarga: {e}", flush=True)
+            logger.error("Error inesperado procesando descarga: %s", e)
             return f"Error: Error interno del servidor procesando descarga: {str(e)}"
 
     elif command == "delete_files":
@@ -107,7 +151,7 @@ def process_request(data_received):
             errors = []
 
             for cloud_file_path in files_to_delete:
-                print(f"[ServiceLogic] Solicitud de eliminación para '{remote_name}:{cloud_file_path}'...", flush=True)
+                logger.info("Solicitud de eliminación para '%s:%s'...", remote_name, cloud_file_path)
                 success, message = delete_file_from_remote(remote_name, cloud_file_path)
                 if not success:
                     all_successful = False
@@ -123,30 +167,16 @@ def process_request(data_received):
         except ValueError:
             return "Error: Formato de comando de delete_files incorrecto."
         except Exception as e:
-            print(f"[ServiceLogic] Error inesperado procesando delete_files: {e}", flush=True)
+            logger.error("Error inesperado procesando delete_files: %s", e)
             return f"Error: Error interno del servidor procesando delete_files: {str(e)}"
     else:
         return f"Comando '{command}' no reconocido."
 
 def main():
     """Punto de entrada principal que inicia y mantiene el servicio."""
-    print(f"--- Iniciando lógica de negocio del servicio: {SERVICE_NAME} ---", flush=True)
-    while True:
-        connector = ServiceConnector(BUS_HOST, BUS_PORT, SERVICE_NAME)
-        try:
-            connector.connect_and_register()
-            while True:
-                data_received = connector.wait_for_transaction()
-                if data_received is None:
-                    print("[ServiceLogic] El bus cerró la conexión.", flush=True)
-                    break
-                response_data = process_request(data_received)
-                connector.send_response(response_data)
-        except Exception as e:
-            print(f"[ServiceLogic] Error: {e}. Reintentando en 5 segundos...", flush=True)
-        finally:
-            connector.close()
-        time.sleep(5)
+    configure_logging(SERVICE_NAME)
+    logger.info("--- Iniciando lógica de negocio del servicio: %s ---", SERVICE_NAME)
+    ServiceWorkerPool(BUS_HOST, BUS_PORT, SERVICE_NAME, process_request, workers=SERVICE_WORKERS).run()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,2 +1,9 @@
 # common_package/bus_connector/__init__.py
-from .connector import ServiceConnector, transact
\ No newline at end of file
+from .connector import ServiceConnector, TransactPool, get_pool, transact
+from .async_connector import AsyncServiceConnector, transact as async_transact
+from .batch import transact_batch
+from .chunking import ChunkedFileReader, iter_chunks
+from .local_bus import LocalBus
+from .logs import configure_logging, get_logger, log_payload
+from .metrics import register_gauge
+from .workers import ServiceWorkerPool
\ No newline at end of file
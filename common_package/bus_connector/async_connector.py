@@ -0,0 +1,251 @@
+# common_package/bus_connector/async_connector.py
+import asyncio
+import time
+import uuid
+
+from .compression import CAPS_PREFIX_BYTES, _caps_frame, _compress_frame, _negotiated, _parse_caps_reply
+from .connector import (
+    BINARY_PREFIX_BYTES,
+    BUS_STATUS_SIZE,
+    MAX_PAYLOAD_SIZE,
+    STREAM_MODE_BODY,
+    STREAM_PREFIX,
+    STREAM_PULL_PREFIX,
+    _ByteCounter,
+    _StreamEndpoint,
+    _decode_response,
+    _download_target,
+    _encode_message,
+    _expect_stream_ack,
+    _finish_download,
+    _is_stream_frame,
+    _iter_body_chunks,
+    _parse_pulled_chunk,
+    _parse_response,
+    _prepare_request,
+    _record_outbound,
+    _starts_with,
+    _stream_chunk_frame,
+    _stream_open_frame,
+    _unwrap_response,
+    logger,
+    transact_logger,
+)
+from .logs import log_payload
+
+
+# --- FUNCIONES DE PROTOCOLO DE BAJO NIVEL (PRIVADAS) ---
+
+async def _read_frame(reader):
+    """
+    Lee un payload completo desde un asyncio.StreamReader.
+
+    Usa el mismo formato de longitud de 5 dígitos que la versión síncrona.
+
+    Returns:
+        memoryview: El payload crudo.
+    """
+    try:
+        raw_msg_len = await reader.readexactly(5)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("La conexión fue cerrada por el otro extremo.")
+    try:
+        msg_len = int(raw_msg_len)
+    except ValueError:
+        raise ValueError(f"Trama corrupta: se esperaba una longitud de 5 dígitos, pero se recibió '{raw_msg_len.decode(errors='ignore')}'")
+
+    try:
+        return memoryview(await reader.readexactly(msg_len))
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("La conexión se cerró inesperadamente.")
+
+async def _send_message(writer, service, data, peer_codecs=None):
+    """Formatea un mensaje según el protocolo y lo envía por el StreamWriter."""
+    writer.write(_encode_message(service, _compress_frame(data, peer_codecs, MAX_PAYLOAD_SIZE - BUS_STATUS_SIZE - len(service))))
+    await writer.drain()
+
+async def _exchange_raw(reader, writer, service_name, data, peer_codecs=None):
+    """Envía una trama y devuelve el payload crudo de su respuesta."""
+    await _send_message(writer, service_name, data, peer_codecs)
+    return _unwrap_response(await _read_frame(reader))
+
+async def _exchange(reader, writer, service_name, data, peer_codecs=None):
+    """Envía una trama y devuelve (nombre_servicio, estado, contenido) de su respuesta."""
+    return _decode_response(await _exchange_raw(reader, writer, service_name, data, peer_codecs))
+
+async def _negotiate_compression(reader, writer, key, service_name):
+    """Versión asíncrona de connector._negotiate_compression."""
+    found, peer_codecs = _negotiated.get(key)
+    if found:
+        return peer_codecs
+    _, r_status, r_content = await _exchange(reader, writer, service_name, _caps_frame())
+    peer_codecs = _parse_caps_reply(r_status, r_content)
+    if r_status == "OK":
+        _negotiated.set(key, peer_codecs)
+    return peer_codecs
+
+async def _upload_stream(reader, writer, service_name, header, body, mode, peer_codecs=None):
+    """Versión asíncrona de connector._upload_stream."""
+    stream_id = uuid.uuid4().hex
+    open_frame = _stream_open_frame(service_name, stream_id, mode, header)
+    _expect_stream_ack(await _exchange(reader, writer, service_name, open_frame, peer_codecs), stream_id, "open")
+
+    seq = 0
+    for chunk in _iter_body_chunks(body):
+        response = await _exchange(reader, writer, service_name, _stream_chunk_frame(stream_id, seq, chunk), peer_codecs)
+        _expect_stream_ack(response, stream_id, seq)
+        seq += 1
+
+    return await _exchange_raw(reader, writer, service_name, f"{STREAM_PREFIX}{stream_id}|end|{seq}", peer_codecs)
+
+async def _download_stream(reader, writer, service_name, open_content, sink, peer_codecs=None):
+    """Versión asíncrona de connector._download_stream."""
+    stream_id, mode, header, target = _download_target(open_content, sink)
+
+    seq = 0
+    while True:
+        payload = await _exchange_raw(reader, writer, service_name, f"{STREAM_PULL_PREFIX}{stream_id}|{seq}", peer_codecs)
+        chunk = _parse_pulled_chunk(payload, stream_id, seq)
+        if chunk is None:
+            break
+        target.write(chunk)
+        seq += 1
+
+    return _finish_download(mode, header, target)
+
+
+# --- INTERFACES DE ALTO NIVEL PARA SERVICIOS Y CLIENTES ---
+
+class AsyncServiceConnector(_StreamEndpoint):
+    """
+    Versión asyncio de ServiceConnector.
+
+    Expone la misma interfaz (con corrutinas) y el mismo protocolo, incluido
+    el modo flujo, para que un servicio pueda esperar sus llamadas a otros
+    servicios sin bloquear el bucle de eventos.
+    """
+    def __init__(self, host, port, service_name):
+        """Inicializa el conector del servicio.
+
+        Args:
+            host (str): La dirección del host del bus.
+            port (int): El puerto del bus.
+            service_name (str): El nombre de este servicio.
+        """
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.service_name = service_name
+        self._reader = None
+        self._writer = None
+
+    async def connect_and_register(self):
+        """Realiza la conexión con el bus y registra el servicio con 'sinit'."""
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        logger.info("Conectado al bus en %s:%s", self.host, self.port)
+
+        # El primer paso después de conectar es siempre registrarse.
+        await _send_message(self._writer, "sinit", self.service_name)
+        sinit_response = str(await _read_frame(self._reader), 'utf-8')
+
+        logger.debug("<- Respuesta de registro: %s", sinit_response)
+
+        # Valida que el bus haya confirmado el registro.
+        if not sinit_response or "OK" not in sinit_response:
+            raise ConnectionError("Fallo en el registro del servicio.")
+        logger.info("Servicio '%s' registrado.", self.service_name)
+
+    async def wait_for_transaction(self):
+        """
+        Espera una transacción y devuelve solo sus "Datos".
+
+        Igual que ServiceConnector.wait_for_transaction: las tramas de control
+        del modo flujo se responden internamente y el cuerpo binario, si lo hay,
+        queda en `self.request_body`.
+        """
+        self._abandon_request()
+        self._release_request_body()
+        logger.debug("Esperando transacción para '%s'...", self.service_name)
+        while True:
+            frame = await _read_frame(self._reader)
+
+            data = self._unwrap_request(frame[5:])
+            if _starts_with(data, CAPS_PREFIX_BYTES):
+                await _send_message(self._writer, self.service_name, _caps_frame(), self._reply_codecs)
+                continue
+            if _is_stream_frame(data):
+                control_reply, message = self._handle_stream_frame(data)
+                if control_reply is not None:
+                    await _send_message(self._writer, self.service_name, control_reply, self._reply_codecs)
+                    continue
+                log_payload(logger, "<- Mensaje en flujo reensamblado: %s", message)
+                return message
+
+            if _starts_with(data, BINARY_PREFIX_BYTES):
+                message = self._handle_binary_frame(data)
+                log_payload(logger, "<- Trama binaria recibida: %s", message)
+                return message
+
+            message = str(data, 'utf-8')
+            log_payload(logger, "<- Payload recibido: %s", message)
+            stats = self._stats_reply(message, self.service_name)
+            if stats is not None:
+                await _send_message(self._writer, self.service_name, stats, self._reply_codecs)
+                continue
+            self._begin_request(message, len(data))
+            return message
+
+    async def send_response(self, response_data, body=None):
+        """Envía la respuesta de vuelta al bus (en modo flujo si es necesario)."""
+        response = self._prepare_response(self.service_name, response_data, body)
+        await _send_message(self._writer, self.service_name, response, self._reply_codecs)
+
+    async def close(self):
+        """Cierra la conexión si está abierta."""
+        self._close_streams()
+        if self._writer:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+            self._writer = None
+            self._reader = None
+            logger.info("Conexión cerrada.")
+
+
+async def transact(host, port, service_name, data_payload, body=None, sink=None):
+    """
+    Versión asyncio de `transact`.
+
+    Recibe los mismos argumentos y devuelve la misma tupla
+    (nombre_servicio, estado, contenido). Varias llamadas pueden ejecutarse
+    en paralelo con asyncio.gather, cada una sobre su propia conexión.
+    """
+    writer = None
+    started_at = time.monotonic()
+    body, sink = _ByteCounter.wrap(body), _ByteCounter.wrap(sink)
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+
+        peer_codecs = await _negotiate_compression(reader, writer, (host, port, service_name), service_name)
+        single_frame, stream_body, mode = _prepare_request(service_name, data_payload, body)
+        if single_frame is not None:
+            payload = await _exchange_raw(reader, writer, service_name, single_frame, peer_codecs)
+        else:
+            header = data_payload if mode == STREAM_MODE_BODY else ""
+            payload = await _upload_stream(reader, writer, service_name, header, stream_body, mode, peer_codecs)
+        r_service, r_status, r_content = _parse_response(payload, sink)
+
+        # Si la respuesta viene en modo flujo, recoger el resto de las tramas.
+        if r_status == "OK" and r_content.startswith(STREAM_PREFIX):
+            r_content = await _download_stream(reader, writer, service_name, r_content, sink, peer_codecs)
+
+        return _record_outbound(service_name, data_payload, started_at, (r_service, r_status, r_content), body, sink)
+
+    except Exception as e:
+        transact_logger.error("Ocurrió un error: %s", e)
+        return _record_outbound(service_name, data_payload, started_at, ("ERROR", "NK", str(e)), body, sink)
+    finally:
+        if writer is not None:
+            writer.close()
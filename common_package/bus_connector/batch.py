@@ -0,0 +1,220 @@
+# common_package/bus_connector/batch.py
+import io
+import json
+import shutil
+import tempfile
+import time
+
+from .connector import STREAM_SPOOL_MAX_SIZE, get_pool
+from .logs import _Payload, get_logger
+from .metrics import command_name, inbound_metrics, is_error_response
+
+logger = get_logger("Batch")
+
+# --- LOTES DE SOLICITUDES ---
+# Un lote agrupa varias subsolicitudes en un único mensaje para ahorrar idas y
+# vueltas por el bus. Viaja como un mensaje con cuerpo binario:
+#     datos:  "#BTCH|<largo_índice>"
+#     cuerpo: <cuerpos de cada subsolicitud, concatenados><índice JSON>
+# El índice es una lista [{"data": "comando|{...}", "size": <bytes del cuerpo o null>}, ...]
+# y va al final para poder escribir los cuerpos a medida que se leen. La respuesta
+# usa el mismo formato, con una entrada por subsolicitud y en el mismo orden.
+# Como es un cuerpo binario, un lote pequeño viaja en una sola trama y uno
+# grande en modo flujo, sin límite de tamaño.
+BATCH_PREFIX = "#BTCH|"
+BATCH_COPY_BUFFER_SIZE = 1024 * 1024
+# Respuesta de un servicio que no atiende los lotes (no usa ServiceWorkerPool): no
+# reconoce "#BTCH" como comando. Solo ante ella se reenvían las solicitudes una a una;
+# cualquier otro error se informa, ya que el servicio pudo haber procesado parte del lote.
+BATCH_UNSUPPORTED_REPLY = f"Comando '{BATCH_PREFIX[:-1]}' no reconocido."
+
+
+class _BatchItemReader:
+    """
+    Lee solo el tramo del cuerpo de un lote que corresponde a una subsolicitud,
+    sin copiarlo a memoria. Los lectores de un mismo lote comparten el cuerpo,
+    así que deben usarse de a uno.
+    """
+    def __init__(self, body, offset, size):
+        self._body = body
+        self._offset = offset
+        self.size = size
+        self._position = 0
+
+    def read(self, size=-1):
+        remaining = self.size - self._position
+        if size is not None and 0 <= size < remaining:
+            remaining = size
+        if remaining <= 0:
+            return b""
+        self._body.seek(self._offset + self._position)
+        data = self._body.read(remaining)
+        self._position += len(data)
+        return data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self.size}[whence]
+        self._position = min(max(base + offset, 0), self.size)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        """El cuerpo del lote lo cierra quien lo recibió."""
+
+
+def _pack_batch(items):
+    """
+    Empaqueta una lista de mensajes en el formato de lote.
+
+    Args:
+        items (list): Cada elemento es un texto o una tupla (texto, cuerpo), donde
+                      el cuerpo es bytes o un objeto tipo archivo binario.
+
+    Returns:
+        tuple: (datos "#BTCH|<largo_índice>", cuerpo del lote listo para leer desde el inicio).
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_MAX_SIZE)
+    index = []
+    for item in items:
+        text, item_body = item if isinstance(item, tuple) else (item, None)
+        size = None
+        if item_body is not None:
+            start = spool.tell()
+            if isinstance(item_body, (bytes, bytearray, memoryview)):
+                spool.write(item_body)
+            else:
+                shutil.copyfileobj(item_body, spool, BATCH_COPY_BUFFER_SIZE)
+            size = spool.tell() - start
+        index.append({"data": text, "size": size})
+
+    index_bytes = json.dumps(index).encode('utf-8')
+    spool.write(index_bytes)
+    spool.seek(0)
+    return f"{BATCH_PREFIX}{len(index_bytes)}", spool
+
+def _unpack_batch(header, body):
+    """
+    Desempaqueta un lote recibido.
+
+    Args:
+        header (str): Datos del mensaje ("#BTCH|<largo_índice>").
+        body (io.BufferedIOBase): Cuerpo del lote (debe admitir seek).
+
+    Returns:
+        list: Tuplas (texto, _BatchItemReader con el cuerpo o None), en el orden del lote.
+    """
+    index_size = int(header[len(BATCH_PREFIX):])
+    body.seek(-index_size, io.SEEK_END)
+    index = json.loads(body.read(index_size))
+
+    items = []
+    offset = 0
+    for entry in index:
+        size = entry.get("size")
+        items.append((entry["data"], _BatchItemReader(body, offset, size) if size is not None else None))
+        offset += size or 0
+    return items
+
+def _is_batch(data):
+    """Indica si un mensaje recibido por un servicio es un lote."""
+    return data.startswith(BATCH_PREFIX)
+
+def _dispatch_batch(handler, data, body):
+    """
+    Ejecuta cada subsolicitud de un lote con el manejador del servicio.
+
+    Las subsolicitudes se procesan en orden, una a la vez. Un error en una de
+    ellas se informa en su respuesta sin detener las demás.
+
+    Args:
+        handler (callable): Manejador del servicio, con la misma firma que en ServiceWorkerPool.
+        data (str): Datos del mensaje ("#BTCH|<largo_índice>").
+        body (io.BufferedIOBase): Cuerpo del lote.
+
+    Returns:
+        tuple: (datos, cuerpo) de la respuesta, también en formato de lote.
+    """
+    if body is None:
+        return "Error: El lote no incluye su índice."
+
+    responses = []
+    for text, item_body in _unpack_batch(data, body):
+        started_at = time.monotonic()
+        try:
+            response = handler(text, item_body)
+        except Exception as e:
+            logger.error("Error al procesar la subsolicitud '%s': %s", _Payload(text), e)
+            response = f"Error: {e}"
+
+        if isinstance(response, tuple):
+            response_text, response_file = response
+            try:
+                response_body = response_file.read()
+            finally:
+                response_file.close()
+            responses.append((response_text, response_body))
+        else:
+            response_text, response_body = response, b""
+            responses.append(response)
+
+        # Cada subsolicitud se mide también por separado, bajo su propio comando.
+        bytes_in = len(text) + (item_body.size if item_body is not None else 0)
+        inbound_metrics.record(command_name(text), time.monotonic() - started_at, bytes_in,
+                               len(response_text) + len(response_body), is_error_response(response_text))
+
+    logger.debug("Lote de %d subsolicitud(es) procesado.", len(responses))
+    return _pack_batch(responses)
+
+def transact_batch(host, port, service_name, requests):
+    """
+    Envía varias solicitudes a un servicio en un solo mensaje del bus.
+
+    Args:
+        host (str): La dirección del host del bus.
+        port (int): El puerto del bus.
+        service_name (str): El servicio de destino de todas las solicitudes.
+        requests (list): Cada elemento es el texto de una solicitud, o una tupla
+                         (texto, cuerpo) si la solicitud lleva un cuerpo binario
+                         (bytes u objeto tipo archivo), como en `transact`.
+
+    Returns:
+        tuple: (nombre_servicio, estado, respuestas). `respuestas` es una lista con
+               una respuesta por solicitud y en el mismo orden: el texto, o una tupla
+               (texto, bytes) si el servicio respondió con un cuerpo binario. Si
+               falla el envío o el servicio responde al lote con un error, el estado
+               es distinto de "OK" y el tercer elemento es el mensaje de error. Las
+               solicitudes solo se reenvían por separado si el servicio no admite
+               lotes (BATCH_UNSUPPORTED_REPLY).
+    """
+    pool = get_pool(host, port)
+    data, body = _pack_batch(requests)
+    sink = tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_MAX_SIZE)
+    try:
+        r_service, r_status, r_content = pool.transact(service_name, data, body=body, sink=sink)
+        if r_status != "OK":
+            return r_service, r_status, r_content
+
+        if _is_batch(r_content):
+            responses = _unpack_batch(r_content, sink)
+            return r_service, r_status, [text if item_body is None else (text, item_body.read()) for text, item_body in responses]
+
+        if BATCH_UNSUPPORTED_REPLY not in r_content:
+            logger.error("Respuesta inesperada de '%s' a un lote: %s", service_name, _Payload(r_content))
+            return r_service, "NK", r_content
+
+        # Un servicio sin soporte de lotes no reconoce el mensaje: se envían las
+        # solicitudes una a una, reutilizando los cuerpos ya empaquetados.
+        logger.warning("El servicio '%s' no admite lotes, se envían las solicitudes por separado.", service_name)
+        responses = []
+        for text, item_body in _unpack_batch(data, body):
+            item_sink = io.BytesIO()
+            r_service, r_status, r_content = pool.transact(service_name, text, body=item_body, sink=item_sink)
+            if r_status != "OK":
+                return r_service, r_status, r_content
+            responses.append(r_content if not item_sink.getbuffer().nbytes else (r_content, item_sink.getvalue()))
+        return r_service, r_status, responses
+    finally:
+        body.close()
+        sink.close()
@@ -0,0 +1,152 @@
+# common_package/bus_connector/chunking.py
+import hashlib
+
+# --- DIVISIÓN DE ARCHIVOS EN TROZOS DEFINIDOS POR CONTENIDO ---
+# Los archivos grandes se dividen en trozos cuyos límites dependen del contenido
+# y no de la posición (al estilo de FastCDC): insertar o agregar unas líneas a un
+# archivo solo cambia los trozos que las contienen, y el resto se reconoce por su
+# hash y no se vuelve a transferir ni a guardar.
+#
+# El hash de cada posición depende de los últimos ~25 bytes (ventana deslizante):
+# cada byte se sustituye por un valor pseudoaleatorio (_TABLE) y se combinan con
+# XOR copias desplazadas del bloque completo, representado como un entero. Así el
+# cálculo se hace con operaciones sobre bloques enteros (en C) y no byte a byte en
+# Python, que sería ~10 veces más lento.
+#
+# Hay un límite de trozo donde el hash tiene 16 bits en cero seguidos de los bits
+# de CHUNK_MASK_SMALL (antes de CHUNK_AVG_SIZE) o de CHUNK_MASK_LARGE (después),
+# como en el "chunking normalizado" de FastCDC, que concentra los tamaños cerca del
+# promedio. Ningún trozo mide menos de CHUNK_MIN_SIZE ni más de CHUNK_MAX_SIZE.
+# Cambiar estos valores o la tabla cambia los límites y anula la deduplicación con
+# los trozos ya guardados.
+CHUNK_MIN_SIZE = 256 * 1024
+CHUNK_AVG_SIZE = 1024 * 1024
+CHUNK_MAX_SIZE = 4 * 1024 * 1024
+CHUNK_MASK_SMALL = 0x3F  # 16 + 6 bits: probabilidad 2^-22 por posición
+CHUNK_MASK_LARGE = 0x03  # 16 + 2 bits: probabilidad 2^-18 por posición
+CHUNK_READ_SIZE = 4 * 1024 * 1024
+
+_TABLE = b"".join(hashlib.sha256(bytes([value])).digest()[:1] for value in range(256))
+# Desplazamientos (en bits) que se duplican: XOR de 16 copias desplazadas 0, 13, ..., 195 bits.
+_WINDOW_SHIFTS = (13, 26, 52, 104)
+_WINDOW_EXTRA_BYTES = (sum(_WINDOW_SHIFTS) + 7) // 8
+_WINDOW_HISTORY = 32
+_CUT_MARK = b"\x00\x00"
+
+
+def _window_hashes(block, history):
+    """
+    Calcula un byte de hash por cada posición del bloque, a partir de la ventana
+    de bytes que termina en ella. `history` son los bytes anteriores al bloque,
+    para que el resultado no dependa de cómo se leyó el archivo.
+    """
+    data = history + block
+    value = int.from_bytes(data.translate(_TABLE), "little")
+    for shift in _WINDOW_SHIFTS:
+        value ^= value << shift
+    return value.to_bytes(len(data) + _WINDOW_EXTRA_BYTES, "little")[len(history):len(data)]
+
+def _find_cut(hashes, start, end, mask):
+    """Busca el primer límite de trozo en hashes[start:end]; devuelve su posición o -1."""
+    index = hashes.find(_CUT_MARK, start, end)
+    while index != -1 and index + 2 < end:
+        if not hashes[index + 2] & mask:
+            return index + 3
+        index = hashes.find(_CUT_MARK, index + 1, end)
+    return -1
+
+def _cut_point(hashes, size):
+    """Tamaño del siguiente trozo, dados los hashes de los `size` bytes pendientes."""
+    limit = min(size, CHUNK_MAX_SIZE)
+    if limit <= CHUNK_MIN_SIZE:
+        return limit
+    normal = min(CHUNK_AVG_SIZE, limit)
+    cut = _find_cut(hashes, CHUNK_MIN_SIZE, normal, CHUNK_MASK_SMALL)
+    if cut == -1:
+        cut = _find_cut(hashes, max(CHUNK_MIN_SIZE, normal - 2), limit, CHUNK_MASK_LARGE)
+    return limit if cut == -1 else cut
+
+def iter_chunks(stream, read_size=CHUNK_READ_SIZE):
+    """
+    Divide el contenido de un objeto tipo archivo en trozos definidos por contenido.
+
+    Usa memoria acotada: a lo sumo CHUNK_MAX_SIZE + read_size bytes pendientes.
+
+    Args:
+        stream (io.BufferedIOBase): Archivo abierto en modo binario.
+        read_size (int): Bytes leídos por vez.
+
+    Yields:
+        bytes: Cada trozo, en orden.
+    """
+    pending = bytearray()
+    hashes = bytearray()
+    history = b""
+    eof = False
+    while True:
+        while not eof and len(pending) < CHUNK_MAX_SIZE:
+            block = stream.read(read_size)
+            if not block:
+                eof = True
+                break
+            hashes += _window_hashes(block, history)
+            pending += block
+            history = block[-_WINDOW_HISTORY:]
+        if not pending:
+            return
+        cut = _cut_point(hashes, len(pending))
+        yield bytes(pending[:cut])
+        del pending[:cut]
+        del hashes[:cut]
+
+
+class ChunkedFileReader:
+    """
+    Lee como un único archivo una secuencia de archivos (ej. los trozos de un
+    archivo guardados como objetos), abriéndolos de a uno.
+    """
+    def __init__(self, paths, hasher=None, opener=None):
+        """
+        Args:
+            paths (list): Rutas de los trozos, en orden.
+            hasher (optional): Objeto de hashlib que se actualiza con los bytes leídos.
+            opener (callable, optional): Abre cada elemento de `paths` para lectura
+                binaria (por defecto, open(ruta, "rb")).
+        """
+        self.paths = paths
+        self.hasher = hasher
+        self.opener = opener or (lambda path: open(path, "rb"))
+        self._index = 0
+        self._current = None
+
+    def read(self, size=-1):
+        parts = []
+        while size != 0 and self._index < len(self.paths):
+            if self._current is None:
+                self._current = self.opener(self.paths[self._index])
+            data = self._current.read(size)
+            if not data or size < 0:
+                self._current.close()
+                self._current = None
+                self._index += 1
+            if data:
+                parts.append(data)
+                if size > 0:
+                    size -= len(data)
+        data = b"".join(parts)
+        if self.hasher is not None:
+            self.hasher.update(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        """Solo admite volver al inicio."""
+        if offset != 0 or whence != 0:
+            raise ValueError("ChunkedFileReader solo admite seek(0).")
+        self.close()
+        self._index = 0
+        return 0
+
+    def close(self):
+        if self._current is not None:
+            self._current.close()
+            self._current = None
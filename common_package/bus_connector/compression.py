@@ -0,0 +1,170 @@
+# common_package/bus_connector/compression.py
+import functools
+import lzma
+import os
+import threading
+import time
+import zlib
+
+# --- COMPRESIÓN NEGOCIADA DE TRAMAS ---
+# Cada trama puede viajar comprimida dentro de un envoltorio que indica el códec
+# usado y los códecs que el emisor sabe descomprimir:
+#     "#ZFRM|<códec>|<acepta>|<datos>"     (códec: "zlib", "lzma" o "raw")
+# La compresión se negocia para que los pares sin soporte sigan funcionando:
+#   - Antes de envolver tramas hacia un servicio, el cliente le pregunta sus
+#     capacidades: "#CAPS|zlib,lzma" -> "#CAPS|<códecs que el servicio acepta>".
+#     Un servicio antiguo responde otra cosa y el cliente sigue sin compresión.
+#     El resultado se recuerda por servicio durante NEGOTIATION_TTL segundos.
+#   - El servicio solo envuelve su respuesta si la solicitud llegó envuelta, y
+#     solo la comprime con un códec que la solicitud declaró aceptar.
+# BUS_COMPRESSION define los códecs con los que se comprime, en orden de
+# preferencia. Por defecto es "none" (desactivada): la mayor parte del tráfico son
+# contenidos de archivos, en general ya comprimidos, y cada salto del bus
+# volvería a pagar la compresión. Los datos menores a BUS_COMPRESSION_MIN_SIZE
+# viajan sin comprimir, igual que aquellos cuya muestra inicial
+# (COMPRESSION_SAMPLE_SIZE bytes) no se reduce al menos a COMPRESSION_SAMPLE_RATIO.
+CAPS_PREFIX = "#CAPS|"
+CAPS_PREFIX_BYTES = CAPS_PREFIX.encode('ascii')
+ZFRAME_PREFIX_BYTES = b"#ZFRM|"
+ZFRAME_FIELDS_MAX_SIZE = 32
+CODEC_RAW = "raw"
+ZLIB_LEVEL = 6
+# Preset bajo: el preset por defecto (6) reserva ~97 MB por llamada.
+LZMA_PRESET = 1
+COMPRESSION_SAMPLE_SIZE = 4096
+COMPRESSION_SAMPLE_RATIO = 0.9
+NEGOTIATION_TTL = 300
+
+# Compresor y descompresor incremental de cada códec soportado.
+_CODECS = {
+    "zlib": (lambda data: zlib.compress(data, ZLIB_LEVEL), zlib.decompressobj),
+    "lzma": (functools.partial(lzma.compress, preset=LZMA_PRESET), lzma.LZMADecompressor),
+}
+
+COMPRESSION_CODECS = tuple(
+    codec.strip() for codec in os.getenv("BUS_COMPRESSION", "none").split(',') if codec.strip() in _CODECS
+)
+COMPRESSION_MIN_SIZE = int(os.getenv("BUS_COMPRESSION_MIN_SIZE", 1024))
+
+# Códecs que este extremo acepta recibir. Si la compresión está desactivada no
+# se anuncia ninguno, y los pares se comunican sin envoltorio.
+_ACCEPTED = ",".join(_CODECS) if COMPRESSION_CODECS else ""
+_ACCEPTED_BYTES = _ACCEPTED.encode('ascii')
+
+
+def _sample_compresses(codec, raw):
+    """
+    Indica si conviene comprimir unos datos, comprimiendo solo su muestra inicial,
+    para no pagar la compresión completa de datos incompresibles (ej. trozos de
+    archivos ya comprimidos).
+    """
+    if len(raw) <= COMPRESSION_SAMPLE_SIZE * 2:
+        return True
+    sample = raw[:COMPRESSION_SAMPLE_SIZE]
+    return len(_CODECS[codec][0](sample)) <= len(sample) * COMPRESSION_SAMPLE_RATIO
+
+def _compress_frame(data, peer_codecs, limit):
+    """
+    Envuelve los datos de una trama, comprimiéndolos si conviene.
+
+    Args:
+        data (str | bytes): Datos de la trama.
+        peer_codecs (tuple | None): Códecs que acepta el otro extremo, o None si no
+                                    soporta el envoltorio (los datos se devuelven tal cual).
+        limit (int): Tamaño máximo de los datos de la trama.
+
+    Returns:
+        str | bytes: Los datos listos para enviar.
+    """
+    if peer_codecs is None:
+        return data
+    raw = data.encode('utf-8') if isinstance(data, str) else data
+
+    if len(raw) >= COMPRESSION_MIN_SIZE:
+        codec = next((codec for codec in COMPRESSION_CODECS if codec in peer_codecs), None)
+        if codec is not None and _sample_compresses(codec, raw):
+            packed = _CODECS[codec][0](raw)
+            if len(packed) < len(raw):
+                return b"%b%b|%b|%b" % (ZFRAME_PREFIX_BYTES, codec.encode('ascii'), _ACCEPTED_BYTES, packed)
+
+    wrapped = b"%braw|%b|%b" % (ZFRAME_PREFIX_BYTES, _ACCEPTED_BYTES, raw)
+    # Si el envoltorio no cabe, la trama viaja sin él; el otro extremo la entiende igual.
+    return wrapped if len(wrapped) <= limit else data
+
+def _decompress_frame(view, limit):
+    """
+    Quita el envoltorio de compresión de los datos de una trama, si lo tiene.
+
+    Args:
+        view (memoryview): Datos de la trama, sin el nombre del servicio.
+        limit (int): Tamaño máximo aceptado para los datos descomprimidos.
+
+    Returns:
+        tuple: (datos como memoryview, códecs que acepta el emisor o None si la
+               trama no venía envuelta).
+    """
+    if view[:len(ZFRAME_PREFIX_BYTES)] != ZFRAME_PREFIX_BYTES:
+        return view, None
+
+    fields = bytes(view[:ZFRAME_FIELDS_MAX_SIZE]).split(b'|', 3)[:3]
+    offset = sum(len(field) + 1 for field in fields)
+    codec, accepted = fields[1].decode('ascii'), fields[2].decode('ascii')
+    peer_codecs = tuple(name for name in accepted.split(',') if name in _CODECS)
+
+    if codec == CODEC_RAW:
+        return view[offset:], peer_codecs
+    if codec not in _CODECS:
+        raise ValueError(f"Trama comprimida con un códec desconocido: '{codec}'.")
+
+    # Una trama sin comprimir nunca supera el límite del protocolo, por lo que se
+    # descarta cualquier contenido que se expanda más allá (bomba de descompresión).
+    decompressor = _CODECS[codec][1]()
+    data = decompressor.decompress(view[offset:], limit + 1)
+    if len(data) > limit:
+        raise ValueError(f"La trama comprimida excede el tamaño máximo al descomprimirse ({limit} bytes).")
+    return memoryview(data), peer_codecs
+
+def _caps_frame():
+    """
+    Construye la trama de capacidades: la consulta del cliente y la respuesta del
+    servicio tienen la misma forma y anuncian los códecs que cada uno acepta.
+    """
+    return f"{CAPS_PREFIX}{_ACCEPTED}"
+
+def _parse_caps_reply(status, content):
+    """
+    Interpreta la respuesta a una consulta de capacidades.
+
+    Returns:
+        tuple | None: Códecs que acepta el servicio, o None si no soporta compresión.
+    """
+    if status != "OK" or not content.startswith(CAPS_PREFIX):
+        return None
+    peer_codecs = tuple(name for name in content[len(CAPS_PREFIX):].split(',') if name in _CODECS)
+    return peer_codecs or None
+
+
+class _NegotiationCache:
+    """Recuerda, por (host, puerto, servicio), el resultado de la negociación."""
+    def __init__(self, ttl=NEGOTIATION_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns:
+            tuple: (encontrado, códecs). `encontrado` es False si hay que negociar.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            return False, None
+        return True, entry[0]
+
+    def set(self, key, peer_codecs):
+        with self._lock:
+            self._entries[key] = (peer_codecs, time.monotonic())
+
+
+_negotiated = _NegotiationCache()
@@ -1,49 +1,178 @@
 # common_package/bus_connector/connector.py
 import socket
+import base64
+import binascii
+import collections
+import io
+import select
+import tempfile
+import threading
+import time
+import uuid
 
-# Define un tamaño de búfer estándar para las lecturas de socket.
-BUFFER_SIZE = 1024
+from .compression import (
+    CAPS_PREFIX_BYTES,
+    ZFRAME_PREFIX_BYTES,
+    _caps_frame,
+    _compress_frame,
+    _decompress_frame,
+    _negotiated,
+    _parse_caps_reply,
+)
+from .logs import get_logger, log_payload
+from .metrics import STATS_COMMAND, command_name, inbound_metrics, is_error_response, outbound_metrics, stats_report
+
+logger = get_logger("BusConnector")
+transact_logger = get_logger("Transact")
+
+# Tamaño inicial y máximo del búfer de lectura de tramas. El búfer crece según el
+# tamaño de las tramas recibidas, hasta poder contener una trama completa.
+READ_BUFFER_INITIAL_SIZE = 16 * 1024
+READ_BUFFER_MAX_SIZE = 128 * 1024
+
+# El protocolo define un largo de 5 dígitos, por lo que el payload (Servi + Datos)
+# no puede exceder 99999 bytes.
+MAX_PAYLOAD_SIZE = 99999
+# El bus antepone el estado ("OK"/"NK") a la respuesta de un servicio antes de
+# entregarla al cliente, por lo que las tramas propias dejan ese espacio libre.
+BUS_STATUS_SIZE = 2
+
+# --- CONFIGURACIÓN DEL MODO DE TRANSFERENCIA POR FLUJO (STREAM) ---
+# Un mensaje lógico que no cabe en una trama se divide en una secuencia de
+# tramas numeradas. Cada trama es una transacción independiente en el bus:
+#   Envío (cliente -> servicio):
+#     "#STRM|<id>|open|<modo>|<cabecera>"  -> "#SACK|<id>|open"
+#     "#STRB|<id>|<seq>|<trozo>"            -> "#SACK|<id>|<seq>"
+#     "#STRM|<id>|end|<total_trozos>"       -> respuesta real del servicio
+#   Recepción (servicio -> cliente), cuando la respuesta no cabe en una trama:
+#     respuesta: "#STRM|<id>|open|<modo>|<cabecera>"
+#     "#PULL|<id>|<seq>" -> "#STRB|<id>|<seq>|<trozo>" ... "#STRM|<id>|end|<total_trozos>"
+# Modo "T": el cuerpo es la continuación del propio mensaje de texto.
+# Modo "B": el cuerpo es un contenido binario que viaja junto a una cabecera corta.
+# Los trozos "#STRB" llevan bytes crudos; todavía se aceptan trozos "#STRM|<id>|<seq>|<base64>".
+STREAM_PREFIX = "#STRM|"
+STREAM_BINARY_PREFIX = "#STRB|"
+STREAM_ACK_PREFIX = "#SACK|"
+STREAM_PULL_PREFIX = "#PULL|"
+STREAM_PREFIX_BYTES = STREAM_PREFIX.encode('ascii')
+STREAM_BINARY_PREFIX_BYTES = STREAM_BINARY_PREFIX.encode('ascii')
+STREAM_PULL_PREFIX_BYTES = STREAM_PULL_PREFIX.encode('ascii')
+STREAM_FIELDS_MAX_SIZE = 64  # Largo máximo de los campos de control al inicio de una trama del flujo.
+STREAM_MODE_TEXT = "T"
+STREAM_MODE_BODY = "B"
+STREAM_CHUNK_SIZE = 96 * 1024  # Bytes crudos por trama.
+STREAM_SPOOL_MAX_SIZE = 4 * 1024 * 1024  # Sobre este tamaño el cuerpo recibido se vuelca a disco.
+STREAM_IDLE_TIMEOUT = 600  # Segundos sin actividad antes de descartar un flujo abandonado.
+
+# --- TRAMAS BINARIAS ---
+# Una trama binaria transporta bytes crudos junto a una cabecera de texto corta
+# (normalmente "comando|{json}"), sin codificar el contenido en base64:
+#     "#BINF|<largo_cabecera>|<cabecera><bytes crudos>"
+# Se usa cuando un cuerpo binario cabe completo en una trama; si no, se envía en modo flujo.
+BINARY_PREFIX = "#BINF|"
+BINARY_PREFIX_BYTES = BINARY_PREFIX.encode('ascii')
+
+# --- CONFIGURACIÓN DEL POOL DE CONEXIONES DE CLIENTE ---
+POOL_MAX_IDLE_CONNECTIONS = 8  # Conexiones inactivas que se conservan por bus.
+POOL_IDLE_TIMEOUT = 30  # Segundos que una conexión puede quedar inactiva antes de cerrarse.
 
 
 # --- FUNCIONES DE PROTOCOLO DE BAJO NIVEL (PRIVADAS) ---
 
-def _read_payload_from_socket(sock):
+class _FrameReader:
+    """
+    Lector de tramas con búfer preasignado sobre un socket.
+
+    Usa `recv_into` sobre un `bytearray` reutilizable, por lo que una trama
+    completa suele llegar en una o dos llamadas al sistema. Los bytes que ya
+    pertenecen a la trama siguiente se conservan en el búfer para la próxima
+    lectura. Las tramas se entregan como `memoryview` sin copiar; solo se
+    decodifican a texto cuando quien llama lo pide.
     """
-    Lee un payload completo desde el socket.
+    def __init__(self, sock, initial_size=READ_BUFFER_INITIAL_SIZE):
+        self.sock = sock
+        self._buffer = bytearray(initial_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0 # Inicio de los datos aún no consumidos.
+        self._end = 0   # Fin de los datos válidos en el búfer.
 
-    Esta es la función central y unificada para la recepción. Lee los 5 bytes
-    de longitud y luego recolecta los datos hasta recibir el mensaje completo.
-    No interpreta el contenido, solo devuelve el payload crudo.
+    def _ensure_available(self, needed):
+        """Lee desde el socket hasta tener al menos `needed` bytes sin consumir."""
+        available = self._end - self._start
+        if available >= needed:
+            return
+
+        if len(self._buffer) - self._start < needed:
+            # No hay espacio suficiente tras el inicio: mover los datos pendientes
+            # al comienzo de un búfer (nuevo si hace falta crecer). Se usa un búfer
+            # nuevo para no invalidar las vistas entregadas previamente.
+            size = len(self._buffer)
+            if needed > size:
+                size = min(max(needed, size * 2), max(needed, READ_BUFFER_MAX_SIZE))
+            pending = bytes(self._view[self._start:self._end])
+            self._buffer = bytearray(size)
+            self._view = memoryview(self._buffer)
+            self._view[:available] = pending
+            self._start, self._end = 0, available
+
+        while self._end - self._start < needed:
+            received = self.sock.recv_into(self._view[self._end:])
+            if not received:
+                if self._end == self._start:
+                    raise ConnectionError("La conexión fue cerrada por el otro extremo.")
+                raise ConnectionError("La conexión se cerró inesperadamente.")
+            self._end += received
+
+    def read_frame(self):
+        """
+        Lee un payload completo desde el socket.
+
+        Lee los 5 bytes de longitud y luego los datos hasta completar el mensaje.
+        No interpreta el contenido.
+
+        Returns:
+            memoryview: El payload crudo. Solo es válido hasta la siguiente lectura.
+        """
+        self._ensure_available(5)
+        raw_msg_len = bytes(self._view[self._start:self._start + 5])
+        try:
+            msg_len = int(raw_msg_len)
+        except ValueError:
+            raise ValueError(f"Trama corrupta: se esperaba una longitud de 5 dígitos, pero se recibió '{raw_msg_len.decode(errors='ignore')}'")
+        self._start += 5
+
+        self._ensure_available(msg_len)
+        frame = self._view[self._start:self._start + msg_len]
+        self._start += msg_len
+        if self._start == self._end:
+            self._start = self._end = 0
+        return frame
+
+    def read_text(self):
+        """Lee un payload completo y lo devuelve decodificado como texto UTF-8."""
+        return str(self.read_frame(), 'utf-8')
+
+def _encode_message(service, data):
+    """
+    Formatea un mensaje según el protocolo ("LLLLLServiDatos") como bytes.
 
     Args:
-        sock (socket.socket): El socket conectado desde el cual leer.
+        service (str): El nombre del servicio (5 caracteres).
+        data (str | bytes): El contenido de los datos a enviar. Las tramas
+                            binarias se entregan ya como bytes.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    message_data = f"{service:5s}".encode('utf-8') + data
 
-    Returns:
-        str | None: El payload completo como una cadena de texto, o None si
-                    la conexión se cierra.
-    """
-    try:
-        # Leer los 5 bytes que definen la longitud del payload.
-        raw_msg_len = sock.recv(5)
-        if not raw_msg_len: 
-            raise ConnectionError("La conexión fue cerrada por el otro extremo.")
-        msg_len = int(raw_msg_len)
-        
-        # Recolectar los trozos (chunks) del mensaje hasta completar el largo esperado.
-        chunks = []
-        bytes_received = 0
-        while bytes_received < msg_len:
-            chunk = sock.recv(min(msg_len - bytes_received, BUFFER_SIZE))
-            if not chunk: raise ConnectionError("La conexión se cerró inesperadamente.")
-            chunks.append(chunk)
-            bytes_received += len(chunk)
-        
-        return b''.join(chunks).decode('utf-8')
-
-    except ValueError:
-        raise ValueError(f"Trama corrupta: se esperaba una longitud de 5 dígitos, pero se recibió '{raw_msg_len.decode(errors='ignore')}'")
-
-def _send_message(sock, service, data):
+    # Verificación de longitud del mensaje. Los mensajes más grandes deben
+    # enviarse en modo flujo (ver _upload_stream y ServiceConnector.send_response).
+    if len(message_data) > MAX_PAYLOAD_SIZE:
+        raise ValueError(f"El mensaje es demasiado grande para enviar ({len(message_data)} bytes). El límite del payload es {MAX_PAYLOAD_SIZE} bytes.")
+
+    return b"%05d%b" % (len(message_data), message_data)
+
+def _send_message(sock, service, data, peer_codecs=None):
     """
     Formatea un mensaje según el protocolo y lo envía a través del socket.
 
@@ -53,129 +182,879 @@ def _send_message(sock, service, data):
     Args:
         sock (socket.socket): El socket conectado al cual enviar el mensaje.
         service (str): El nombre del servicio (5 caracteres).
-        data (str): El contenido de los datos a enviar.
+        data (str | bytes): El contenido de los datos a enviar.
+        peer_codecs (tuple, optional): Códecs de compresión que acepta el otro
+            extremo. Si es None, la trama se envía sin envoltorio de compresión.
     """
-    message_data = f"{service:5s}{data}"
+    message = _encode_message(service, _compress_frame(data, peer_codecs, MAX_PAYLOAD_SIZE - BUS_STATUS_SIZE - len(service)))
+    log_payload(logger, "-> Enviando: %s", message)
+    sock.sendall(message)
 
-    # Verificación de longitud del mensaje:
-    # El protocolo define un largo de 5 dígitos, por lo que el payload (Servi + Datos)
-    # no puede exceder 99999 bytes.
-    if len(message_data.encode('utf-8')) > 99999:
-        raise ValueError(f"El mensaje es demasiado grande para enviar ({len(message_data.encode('utf-8'))} bytes). El límite del payload es 99999 bytes.")
+def _fits_in_frame(service, data):
+    """Indica si los datos caben en una sola trama del protocolo."""
+    return len(service) + len(data.encode('utf-8')) <= MAX_PAYLOAD_SIZE - BUS_STATUS_SIZE
 
-    message = f"{len(message_data.encode('utf-8')):05d}{message_data}".encode('utf-8')
-    # print(f"-> [BusConnector] Enviando: {message.decode()}", flush=True)
-    sock.sendall(message)
+def _starts_with(view, prefix_bytes):
+    """Indica si una vista de bytes comienza con el prefijo indicado."""
+    return view[:len(prefix_bytes)] == prefix_bytes
+
+def _split_stream_fields(view, count):
+    """
+    Separa los primeros `count` campos de control ("#STRM|<id>|<marca>|...") de
+    una trama del flujo.
+
+    Returns:
+        tuple: (lista de campos como texto, memoryview con el resto de la trama sin copiar).
+    """
+    fields = bytes(view[:STREAM_FIELDS_MAX_SIZE]).split(b'|', count)[:count]
+    offset = sum(len(field) + 1 for field in fields)
+    return [field.decode('ascii') for field in fields], view[offset:]
+
+def _binary_capacity(service, header):
+    """Bytes crudos que caben en una trama binaria junto a la cabecera indicada."""
+    header_size = len(header.encode('utf-8'))
+    overhead = len(service) + BUS_STATUS_SIZE + len(BINARY_PREFIX_BYTES) + len(str(header_size)) + 1 + header_size
+    return MAX_PAYLOAD_SIZE - overhead
+
+def _binary_frame(header, raw):
+    """Construye los datos de una trama binaria: cabecera de texto y bytes crudos."""
+    header_bytes = header.encode('utf-8')
+    return b"%b%d|%b%b" % (BINARY_PREFIX_BYTES, len(header_bytes), header_bytes, raw)
+
+def _split_binary_frame(view):
+    """
+    Separa una trama binaria en su cabecera y sus bytes crudos.
+
+    Returns:
+        tuple: (cabecera como texto, memoryview con los bytes crudos sin copiar).
+    """
+    (_, header_size), rest = _split_stream_fields(view, 2)
+    header_size = int(header_size)
+    return str(rest[:header_size], 'utf-8'), rest[header_size:]
+
+def _split_stream_chunk(view):
+    """
+    Separa una trama con un trozo de flujo, binaria ("#STRB") o en base64 ("#STRM").
+
+    Returns:
+        tuple: (id_flujo, marca, bytes del trozo). La marca es el número de
+               secuencia como texto, o "end"/"open" en las tramas de control.
+    """
+    (prefix, stream_id, marker), rest = _split_stream_fields(view, 3)
+    if prefix + '|' == STREAM_BINARY_PREFIX or marker in ("end", "open"):
+        return stream_id, marker, rest
+    return stream_id, marker, binascii.a2b_base64(rest)
+
+
+class _PrefetchedBody:
+    """
+    Cuerpo binario del que ya se leyó un primer bloque (para decidir si cabía
+    en una sola trama). Entrega primero ese bloque y luego el resto del cuerpo.
+    """
+    def __init__(self, head, body):
+        self._head = head
+        self._body = body
+
+    def read(self, size):
+        if not self._head:
+            return self._body.read(size)
+        chunk, self._head = self._head[:size], self._head[size:]
+        if len(chunk) < size:
+            chunk += self._body.read(size - len(chunk))
+        return chunk
+
+    def close(self):
+        self._body.close()
+
+def _iter_body_chunks(body):
+    """Recorre un objeto tipo archivo binario en trozos de STREAM_CHUNK_SIZE bytes."""
+    while True:
+        chunk = body.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+# --- MODO FLUJO DEL LADO DEL CLIENTE (PRIVADO) ---
+
+def _unwrap_response(payload):
+    """Descomprime el contenido de un payload de respuesta ("ServiEstadoContenido") si viene envuelto."""
+    if not _starts_with(payload[7:], ZFRAME_PREFIX_BYTES):
+        return payload
+    content, _ = _decompress_frame(payload[7:], MAX_PAYLOAD_SIZE)
+    return memoryview(bytes(payload[:7]) + content)
+
+def _exchange_raw(reader, service_name, data, peer_codecs=None):
+    """
+    Envía una trama y lee su respuesta en una conexión ya abierta.
+
+    Returns:
+        memoryview: El payload crudo de la respuesta ("ServiEstadoContenido").
+    """
+    _send_message(reader.sock, service_name, data, peer_codecs)
+    return _unwrap_response(reader.read_frame())
+
+def _decode_response(payload):
+    """Decodifica un payload de respuesta de texto en (nombre_servicio, estado, contenido)."""
+    payload = str(payload, 'utf-8')
+    return payload[:5], payload[5:7], payload[7:]
+
+def _exchange(reader, service_name, data, peer_codecs=None):
+    """
+    Envía una trama y lee su respuesta en una conexión ya abierta.
+
+    Returns:
+        tuple: (nombre_servicio, estado, contenido) de la respuesta del bus.
+    """
+    return _decode_response(_exchange_raw(reader, service_name, data, peer_codecs))
+
+def _negotiate_compression(reader, key, service_name):
+    """
+    Obtiene los códecs que acepta un servicio, consultándolos con "#CAPS" la
+    primera vez y recordando la respuesta (ver compression.py).
+
+    Returns:
+        tuple | None: Códecs aceptados, o None si las tramas deben ir sin envoltorio.
+    """
+    found, peer_codecs = _negotiated.get(key)
+    if found:
+        return peer_codecs
+    _, r_status, r_content = _exchange(reader, service_name, _caps_frame())
+    peer_codecs = _parse_caps_reply(r_status, r_content)
+    if r_status == "OK":
+        _negotiated.set(key, peer_codecs)
+    return peer_codecs
+
+def _expect_stream_ack(response, stream_id, marker):
+    """Valida que la respuesta sea el acuse de recibo esperado de una trama del flujo."""
+    _, r_status, r_content = response
+    if r_status != "OK" or r_content != f"{STREAM_ACK_PREFIX}{stream_id}|{marker}":
+        raise ConnectionError(f"El flujo '{stream_id}' fue rechazado en la trama '{marker}': {r_content}")
+
+def _stream_open_frame(service_name, stream_id, mode, header):
+    """Construye la trama de apertura de un flujo saliente desde el cliente."""
+    open_frame = f"{STREAM_PREFIX}{stream_id}|open|{mode}|{header}"
+    if not _fits_in_frame(service_name, open_frame):
+        raise ValueError(f"La cabecera del flujo es demasiado grande ({len(header.encode('utf-8'))} bytes).")
+    return open_frame
+
+def _stream_chunk_frame(stream_id, seq, chunk):
+    """Construye la trama binaria que transporta un trozo del cuerpo de un flujo."""
+    return b"%b%b|%d|%b" % (STREAM_BINARY_PREFIX_BYTES, stream_id.encode('ascii'), seq, chunk)
+
+def _prepare_request(service_name, data_payload, body):
+    """
+    Decide cómo enviar una solicitud.
+
+    Returns:
+        tuple: (datos de una trama única o None, cuerpo a enviar en modo flujo o None, modo).
+               Si el primer elemento no es None, la solicitud cabe en una sola trama.
+    """
+    if body is not None:
+        # Un cuerpo que cabe junto a la cabecera viaja en una única trama binaria.
+        capacity = _binary_capacity(service_name, data_payload)
+        head = body.read(max(capacity, 0) + 1)
+        if len(head) <= capacity:
+            return _binary_frame(data_payload, head), None, None
+        return None, _PrefetchedBody(head, body), STREAM_MODE_BODY
+    if not _fits_in_frame(service_name, data_payload):
+        return None, io.BytesIO(data_payload.encode('utf-8')), STREAM_MODE_TEXT
+    return data_payload, None, None
+
+def _parse_response(payload, sink):
+    """
+    Interpreta el payload crudo de la respuesta final de una transacción.
+
+    Si es una trama binaria, escribe sus bytes en `sink` y devuelve la cabecera
+    como contenido. Si es la apertura de un flujo, el contenido devuelto es esa
+    trama y quien llama debe recoger el resto con "#PULL".
+
+    Returns:
+        tuple: (nombre_servicio, estado, contenido).
+    """
+    content = payload[7:]
+    if payload[5:7] == b"OK" and _starts_with(content, BINARY_PREFIX_BYTES):
+        if sink is None:
+            raise ValueError("La respuesta incluye un cuerpo binario, pero no se indicó un destino (sink) para recibirlo.")
+        header, raw = _split_binary_frame(content)
+        sink.write(raw)
+        return str(payload[:5], 'utf-8'), "OK", header
+    return _decode_response(payload)
+
+def _download_target(open_content, sink):
+    """
+    Interpreta la trama de apertura de una respuesta en modo flujo.
+
+    Returns:
+        tuple: (id_flujo, modo, cabecera, destino donde escribir el cuerpo).
+    """
+    _, stream_id, _, mode, header = open_content.split('|', 4)
+    if mode == STREAM_MODE_TEXT:
+        return stream_id, mode, header, io.BytesIO()
+    if sink is None:
+        raise ValueError("La respuesta incluye un cuerpo binario, pero no se indicó un destino (sink) para recibirlo.")
+    return stream_id, mode, header, sink
+
+def _parse_pulled_chunk(payload, stream_id, seq):
+    """
+    Valida la respuesta a un "#PULL" y extrae su trozo.
+
+    Args:
+        payload (memoryview): Payload crudo de la respuesta ("ServiEstadoContenido").
+
+    Returns:
+        memoryview | bytes | None: El trozo, o None si el flujo terminó.
+    """
+    # Los trozos se leen directamente desde el búfer de lectura, sin pasar a texto.
+    content = payload[7:]
+    if payload[5:7] != b"OK" or not (_starts_with(content, STREAM_BINARY_PREFIX_BYTES) or _starts_with(content, STREAM_PREFIX_BYTES)):
+        raise ConnectionError(f"El flujo '{stream_id}' se interrumpió en la trama {seq}: {str(content, 'utf-8', errors='replace')}")
+
+    r_stream_id, marker, chunk = _split_stream_chunk(content)
+    if r_stream_id != stream_id:
+        raise ConnectionError(f"Se recibió una trama del flujo '{r_stream_id}' mientras se esperaba '{stream_id}'.")
+    if marker == "end":
+        return None
+    if int(marker) != seq:
+        raise ConnectionError(f"El flujo '{stream_id}' llegó fuera de orden: se esperaba la trama {seq} y se recibió {marker}.")
+    return chunk
+
+def _finish_download(mode, header, target):
+    """Devuelve el mensaje reensamblado (modo texto) o la cabecera (modo binario)."""
+    if mode == STREAM_MODE_TEXT:
+        return header + target.getvalue().decode('utf-8')
+    return header
+
+def _upload_stream(reader, service_name, header, body, mode, peer_codecs=None):
+    """
+    Envía un mensaje lógico como una secuencia de tramas numeradas.
+
+    Solo mantiene en memoria un trozo a la vez, por lo que el tamaño del
+    cuerpo no está limitado por la memoria disponible.
+
+    Args:
+        reader (_FrameReader): Lector de la conexión abierta con el bus.
+        service_name (str): Servicio de destino.
+        header (str): Cabecera de texto que acompaña al cuerpo (debe caber en una trama).
+        body (io.BufferedIOBase): Objeto tipo archivo binario con el cuerpo a enviar.
+        mode (str): STREAM_MODE_TEXT o STREAM_MODE_BODY.
+        peer_codecs (tuple, optional): Códecs de compresión que acepta el servicio.
+
+    Returns:
+        memoryview: El payload crudo de la respuesta del servicio a la trama final.
+    """
+    stream_id = uuid.uuid4().hex
+    open_frame = _stream_open_frame(service_name, stream_id, mode, header)
+    _expect_stream_ack(_exchange(reader, service_name, open_frame, peer_codecs), stream_id, "open")
+
+    seq = 0
+    for chunk in _iter_body_chunks(body):
+        response = _exchange(reader, service_name, _stream_chunk_frame(stream_id, seq, chunk), peer_codecs)
+        _expect_stream_ack(response, stream_id, seq)
+        seq += 1
+
+    return _exchange_raw(reader, service_name, f"{STREAM_PREFIX}{stream_id}|end|{seq}", peer_codecs)
+
+def _download_stream(reader, service_name, open_content, sink, peer_codecs=None):
+    """
+    Recibe una respuesta enviada en modo flujo, pidiendo cada trama con "#PULL".
+
+    Args:
+        reader (_FrameReader): Lector de la conexión abierta con el bus.
+        service_name (str): Servicio que originó el flujo.
+        open_content (str): Contenido de la trama de apertura recibida.
+        sink (io.BufferedIOBase | None): Destino donde escribir el cuerpo binario.
+        peer_codecs (tuple, optional): Códecs de compresión que acepta el servicio.
+
+    Returns:
+        str: El mensaje reensamblado (modo texto) o la cabecera (modo binario).
+    """
+    stream_id, mode, header, target = _download_target(open_content, sink)
+
+    seq = 0
+    while True:
+        payload = _exchange_raw(reader, service_name, f"{STREAM_PULL_PREFIX}{stream_id}|{seq}", peer_codecs)
+        chunk = _parse_pulled_chunk(payload, stream_id, seq)
+        if chunk is None:
+            break
+        target.write(chunk)
+        seq += 1
+
+    return _finish_download(mode, header, target)
+
+
+# --- MODO FLUJO DEL LADO DEL SERVICIO (PRIVADO) ---
+
+class _StreamRegistry:
+    """
+    Flujos en curso de un servicio, indexados por su ID.
+
+    Puede compartirse entre varias conexiones registradas bajo el mismo nombre
+    de servicio, ya que el bus puede entregar cada trama de un flujo a una
+    conexión distinta. El protocolo garantiza que las tramas de un mismo flujo
+    no se procesan en paralelo; el lock solo protege los diccionarios.
+    """
+    def __init__(self, on_chunk=None):
+        """
+        Args:
+            on_chunk (callable, optional): Recibe la cabecera de un flujo entrante
+                cada vez que llega uno de sus trozos (ej. para que el servicio
+                mantenga activa la operación a la que pertenece).
+        """
+        self.incoming = {}
+        self.outgoing = {}
+        self.lock = threading.Lock()
+        self.on_chunk = on_chunk
+
+    def discard(self, stream_id):
+        """Descarta un flujo en curso y libera sus recursos."""
+        with self.lock:
+            stream = self.incoming.pop(stream_id, None) or self.outgoing.pop(stream_id, None)
+        if stream is not None:
+            stream.get("spool", stream.get("body")).close()
+
+    def discard_all(self):
+        """Descarta todos los flujos en curso."""
+        with self.lock:
+            stream_ids = list(self.incoming) + list(self.outgoing)
+        for stream_id in stream_ids:
+            self.discard(stream_id)
+
+    def purge_stale(self):
+        """Descarta los flujos que llevan más de STREAM_IDLE_TIMEOUT segundos inactivos."""
+        now = time.monotonic()
+        with self.lock:
+            stale = [stream_id for streams in (self.incoming, self.outgoing)
+                     for stream_id, stream in streams.items()
+                     if now - stream["last_activity"] > STREAM_IDLE_TIMEOUT]
+        for stream_id in stale:
+            logger.warning("Flujo '%s' abandonado, descartando.", stream_id)
+            self.discard(stream_id)
+
+
+class _StreamEndpoint:
+    """
+    Estado del modo flujo del lado de un servicio.
+
+    Lleva los flujos entrantes (que se reensamblan) y salientes (que el cliente
+    recoge con "#PULL"). No realiza E/S: devuelve las respuestas de control
+    para que el conector (síncrono o asíncrono) las envíe.
+    """
+    def __init__(self, stream_registry=None):
+        # Cuerpo binario de la última transacción recibida en modo flujo (o None).
+        self.request_body = None
+        # Si el registro es compartido, su ciclo de vida lo maneja quien lo creó.
+        self._owns_streams = stream_registry is None
+        self._streams = stream_registry if stream_registry is not None else _StreamRegistry()
+        # Códecs que aceptó la última trama recibida; con ellos se envía la respuesta.
+        self._reply_codecs = None
+        # Solicitud entregada a la lógica de negocio y aún sin respuesta:
+        # (comando, instante de inicio, bytes recibidos), para las métricas.
+        self._pending_request = None
+
+    def _begin_request(self, message, bytes_in, started_at=None):
+        """Empieza a medir una solicitud que se entrega a la lógica de negocio."""
+        self._abandon_request()
+        self._pending_request = (command_name(message), started_at or time.monotonic(), bytes_in)
+
+    def _finish_request(self, response_data, bytes_out):
+        """Registra en las métricas la solicitud en curso, una vez preparada su respuesta."""
+        if self._pending_request is None:
+            return None
+        command, started_at, bytes_in = self._pending_request
+        self._pending_request = None
+        inbound_metrics.record(command, time.monotonic() - started_at, bytes_in, bytes_out, is_error_response(response_data))
+        return command
+
+    def _abandon_request(self):
+        """Registra como error una solicitud que quedó sin respuesta (ej. la lógica de negocio falló)."""
+        if self._pending_request is not None:
+            command, started_at, bytes_in = self._pending_request
+            self._pending_request = None
+            inbound_metrics.record(command, time.monotonic() - started_at, bytes_in, 0, error=True)
+
+    def _stats_reply(self, message, service_name):
+        """Devuelve la respuesta al comando reservado STATS_COMMAND, o None si el mensaje es otro."""
+        if command_name(message) != STATS_COMMAND:
+            return None
+        return stats_report(service_name)
+
+    def _unwrap_request(self, data):
+        """Quita el envoltorio de compresión de una trama recibida y recuerda los códecs del cliente."""
+        data, self._reply_codecs = _decompress_frame(data, MAX_PAYLOAD_SIZE)
+        return data
+
+    def _release_request_body(self):
+        """Cierra el cuerpo binario de la transacción anterior, si existía."""
+        if self.request_body is not None:
+            self.request_body.close()
+            self.request_body = None
+
+    def _close_streams(self):
+        """Libera el cuerpo de la última transacción y, si son propios, los flujos en curso."""
+        self._abandon_request()
+        self._release_request_body()
+        if self._owns_streams:
+            self._streams.discard_all()
+
+    def _handle_binary_frame(self, data):
+        """
+        Procesa una trama binaria: deja sus bytes en `self.request_body` y
+        devuelve la cabecera como mensaje para la lógica de negocio.
+        """
+        header, raw = _split_binary_frame(data)
+        # Se copia una vez porque el búfer de lectura se reutiliza en la siguiente trama.
+        self.request_body = io.BytesIO(raw)
+        self._begin_request(header, len(data))
+        return header
+
+    def _prepare_response(self, service_name, response_data, body):
+        """
+        Prepara los datos de la trama de respuesta.
+
+        Un cuerpo binario que cabe junto a la respuesta viaja en una trama binaria.
+        Si no cabe, o si la respuesta de texto no cabe en una trama, registra un
+        flujo saliente y devuelve su trama de apertura.
+        """
+        if body is None and _fits_in_frame(service_name, response_data):
+            self._finish_request(response_data, len(response_data))
+            return response_data
+
+        if body is None:
+            mode, header, body = STREAM_MODE_TEXT, "", io.BytesIO(response_data.encode('utf-8'))
+        else:
+            capacity = _binary_capacity(service_name, response_data)
+            head = body.read(max(capacity, 0) + 1)
+            if len(head) <= capacity:
+                body.close()
+                frame = _binary_frame(response_data, head)
+                self._finish_request(response_data, len(frame))
+                return frame
+            mode, header, body = STREAM_MODE_BODY, response_data, _PrefetchedBody(head, body)
+
+        # Los bytes del cuerpo se suman a las métricas del comando a medida que el cliente los recoge.
+        command = self._finish_request(response_data, len(header))
+        stream_id = uuid.uuid4().hex
+        with self._streams.lock:
+            self._streams.outgoing[stream_id] = {"body": body, "command": command, "next_seq": 0, "last_activity": time.monotonic()}
+        return f"{STREAM_PREFIX}{stream_id}|open|{mode}|{header}"
+
+    def _handle_stream_frame(self, data):
+        """
+        Procesa una trama del modo flujo.
+
+        Args:
+            data (memoryview): Datos de la trama, sin el nombre del servicio.
+
+        Returns:
+            tuple: (respuesta_de_control, mensaje). Solo uno de los dos es distinto
+                   de None: la respuesta de control que debe enviarse al bus, o el
+                   mensaje reensamblado cuando llega la trama final.
+        """
+        self._streams.purge_stale()
+
+        if data[:len(STREAM_PULL_PREFIX_BYTES)] == STREAM_PULL_PREFIX_BYTES:
+            _, stream_id, seq = str(data, 'ascii').split('|', 2)
+            return self._next_chunk_reply(stream_id, int(seq)), None
+
+        stream_id, marker, rest = _split_stream_chunk(data)
+        if marker == "open":
+            mode, header = str(rest, 'utf-8').split('|', 1)
+            with self._streams.lock:
+                self._streams.incoming[stream_id] = {
+                    "mode": mode,
+                    "header": header,
+                    "spool": tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_MAX_SIZE),
+                    "next_seq": 0,
+                    "bytes": len(data),
+                    "started_at": time.monotonic(),
+                    "last_activity": time.monotonic()
+                }
+            return f"{STREAM_ACK_PREFIX}{stream_id}|open", None
+
+        with self._streams.lock:
+            stream = self._streams.incoming.get(stream_id)
+            if stream is not None and marker == "end":
+                del self._streams.incoming[stream_id]
+        if stream is None:
+            return f"Error: El flujo '{stream_id}' no existe o expiró.", None
+
+        if marker == "end":
+            total_chunks = int(str(rest, 'ascii'))
+            if total_chunks != stream["next_seq"]:
+                stream["spool"].close()
+                return f"Error: El flujo '{stream_id}' terminó incompleto ({stream['next_seq']} de {total_chunks} trozos).", None
+
+            spool = stream["spool"]
+            spool.seek(0)
+            if stream["mode"] == STREAM_MODE_TEXT:
+                message = stream["header"] + spool.read().decode('utf-8')
+                spool.close()
+            else:
+                message = stream["header"]
+                self.request_body = spool
+            # La latencia de un mensaje en flujo se mide desde su trama de apertura.
+            self._begin_request(message, stream["bytes"] + len(data), stream["started_at"])
+            return None, message
+
+        if int(marker) != stream["next_seq"]:
+            self._streams.discard(stream_id)
+            return f"Error: El flujo '{stream_id}' llegó fuera de orden (se esperaba el trozo {stream['next_seq']}).", None
+
+        # El trozo se escribe directamente desde el búfer de lectura.
+        stream["spool"].write(rest)
+        stream["bytes"] += len(data)
+        stream["next_seq"] += 1
+        stream["last_activity"] = time.monotonic()
+        if self._streams.on_chunk is not None:
+            try:
+                self._streams.on_chunk(stream["header"])
+            except Exception as e:
+                logger.error("Error al notificar un trozo del flujo '%s': %s", stream_id, e)
+        return f"{STREAM_ACK_PREFIX}{stream_id}|{marker}", None
+
+    def _next_chunk_reply(self, stream_id, seq):
+        """Construye la respuesta a un "#PULL" con el siguiente trozo de un flujo saliente."""
+        with self._streams.lock:
+            stream = self._streams.outgoing.get(stream_id)
+        if stream is None or seq != stream["next_seq"]:
+            return f"Error: El flujo '{stream_id}' no existe, expiró o se pidió fuera de orden."
+
+        chunk = stream["body"].read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            self._streams.discard(stream_id)
+            return f"{STREAM_PREFIX}{stream_id}|end|{seq}"
+
+        stream["next_seq"] += 1
+        stream["last_activity"] = time.monotonic()
+        if stream["command"] is not None:
+            inbound_metrics.add_bytes_out(stream["command"], len(chunk))
+        return _stream_chunk_frame(stream_id, seq, chunk)
+
+
+def _is_stream_frame(data):
+    """Indica si los datos de una trama pertenecen al modo flujo."""
+    return data[:len(STREAM_PREFIX_BYTES)] in (STREAM_PREFIX_BYTES, STREAM_BINARY_PREFIX_BYTES, STREAM_PULL_PREFIX_BYTES)
 
 
 # --- INTERFACES DE ALTO NIVEL PARA SERVICIOS Y CLIENTES ---
 
-class ServiceConnector:
+class ServiceConnector(_StreamEndpoint):
     """
     Gestiona el ciclo de vida de la conexión de un servicio con el bus.
-    
+
     Provee una interfaz de alto nivel para que la lógica de negocio de un
     servicio no tenga que lidiar con los detalles del protocolo.
     """
-    def __init__(self, host, port, service_name):
+    def __init__(self, host, port, service_name, stream_registry=None):
         """Inicializa el conector del servicio.
-        
+
         Args:
             host (str): La dirección del host del bus.
             port (int): El puerto del bus.
             service_name (str): El nombre de este servicio.
+            stream_registry (_StreamRegistry, optional): Registro de flujos compartido
+                con otras conexiones del mismo servicio (ver ServiceWorkerPool).
         """
+        super().__init__(stream_registry)
         self.host = host
         self.port = port
         self.service_name = service_name
         self.sock = None
+        self._reader = None
 
     def connect_and_register(self):
         """Realiza la conexión con el bus y registra el servicio con 'sinit'."""
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.connect((self.host, self.port))
-        print(f"[BusConnector] Conectado al bus en {self.host}:{self.port}", flush=True)
-        
+        self._reader = _FrameReader(self.sock)
+        logger.info("Conectado al bus en %s:%s", self.host, self.port)
+
         # El primer paso después de conectar es siempre registrarse.
         _send_message(self.sock, "sinit", self.service_name)
-        sinit_response = _read_payload_from_socket(self.sock)
+        sinit_response = self._reader.read_text()
+
+        logger.debug("<- Respuesta de registro: %s", sinit_response)
 
-        print(f"<- [BusConnector] Respuesta de registro: {sinit_response}", flush=True)
-        
         # Valida que el bus haya confirmado el registro.
         if not sinit_response or "OK" not in sinit_response:
             raise ConnectionError("Fallo en el registro del servicio.")
-        print(f"[BusConnector] Servicio '{self.service_name}' registrado.", flush=True)
+        logger.info("Servicio '%s' registrado.", self.service_name)
 
     def wait_for_transaction(self):
         """
         Espera una transacción, la recibe y la parsea para la lógica de negocio.
-        
+
         La trama que llega del bus es "ServiDatos". Esta función extrae solo "Datos".
+        Las tramas de control del modo flujo se responden internamente; la lógica
+        de negocio solo recibe el mensaje una vez reensamblado. Si el mensaje trae
+        un cuerpo binario, queda disponible en `self.request_body`.
         """
-        print(f"[BusConnector] Esperando transacción para '{self.service_name}'...", flush=True)
-        payload = _read_payload_from_socket(self.sock)
-        
-        if payload is None:
-            return None
-            
-        print(f"<- [BusConnector] Payload recibido: {payload}", flush=True)
-        # Extrae y devuelve solo los datos, que es lo que le importa al servicio.
-        return payload[5:]
+        self._abandon_request()
+        self._release_request_body()
+        logger.debug("Esperando transacción para '%s'...", self.service_name)
+        while True:
+            frame = self._reader.read_frame()
+
+            # Las tramas de control del flujo se procesan sin decodificar sus trozos a texto.
+            data = self._unwrap_request(frame[5:])
+            if _starts_with(data, CAPS_PREFIX_BYTES):
+                _send_message(self.sock, self.service_name, _caps_frame(), self._reply_codecs)
+                continue
+            if _is_stream_frame(data):
+                control_reply, message = self._handle_stream_frame(data)
+                if control_reply is not None:
+                    _send_message(self.sock, self.service_name, control_reply, self._reply_codecs)
+                    continue # Trama de control ya respondida, esperar la siguiente.
+                log_payload(logger, "<- Mensaje en flujo reensamblado: %s", message)
+                return message
+
+            if _starts_with(data, BINARY_PREFIX_BYTES):
+                message = self._handle_binary_frame(data)
+                log_payload(logger, "<- Trama binaria recibida: %s", message)
+                return message
 
-    def send_response(self, response_data):
-        """Envía la respuesta de la lógica de negocio de vuelta al bus."""
-        _send_message(self.sock, self.service_name, response_data)
+            # Extrae y devuelve solo los datos, que es lo que le importa al servicio.
+            message = str(data, 'utf-8')
+            log_payload(logger, "<- Payload recibido: %s", message)
+            stats = self._stats_reply(message, self.service_name)
+            if stats is not None:
+                _send_message(self.sock, self.service_name, stats, self._reply_codecs)
+                continue
+            self._begin_request(message, len(data))
+            return message
+
+    def send_response(self, response_data, body=None):
+        """
+        Envía la respuesta de la lógica de negocio de vuelta al bus.
+
+        Si se adjunta un cuerpo binario (objeto tipo archivo) que cabe en una
+        trama, viaja como bytes crudos en una trama binaria. Si no cabe, o si la
+        respuesta de texto no cabe en una trama, se envía en modo flujo y el
+        cliente la recoge trama a trama.
+        """
+        response = self._prepare_response(self.service_name, response_data, body)
+        _send_message(self.sock, self.service_name, response, self._reply_codecs)
 
     def close(self):
         """Cierra la conexión del socket si está abierta."""
+        self._close_streams()
         if self.sock:
             self.sock.close()
             self.sock = None
-            print("[BusConnector] Conexión cerrada.", flush=True)
+            self._reader = None
+            logger.info("Conexión cerrada.")
+
+
+def _run_transaction(reader, service_name, data_payload, body=None, sink=None, peer_codecs=None):
+    """
+    Ejecuta una transacción completa sobre una conexión ya abierta con el bus.
+
+    Returns:
+        tuple: (nombre_servicio, estado, contenido) de la respuesta.
+    """
+    # Envía la solicitud del cliente (en una trama o en modo flujo) y recibe la respuesta.
+    single_frame, stream_body, mode = _prepare_request(service_name, data_payload, body)
+    if single_frame is not None:
+        payload = _exchange_raw(reader, service_name, single_frame, peer_codecs)
+    else:
+        header = data_payload if mode == STREAM_MODE_BODY else ""
+        payload = _upload_stream(reader, service_name, header, stream_body, mode, peer_codecs)
+    r_service, r_status, r_content = _parse_response(payload, sink)
+
+    # Registra la transacción cruda para depuración
+    log_payload(transact_logger, "<- RAW Payload: %s", payload)
+
+    # Si la respuesta viene en modo flujo, recoger el resto de las tramas.
+    if r_status == "OK" and r_content.startswith(STREAM_PREFIX):
+        r_content = _download_stream(reader, service_name, r_content, sink, peer_codecs)
+
+    return r_service, r_status, r_content
+
+
+class _ByteCounter:
+    """Envuelve el cuerpo o el destino binario de una transacción y cuenta los bytes que pasan."""
+    def __init__(self, stream):
+        self._stream = stream
+        self.count = 0
+
+    @classmethod
+    def wrap(cls, stream):
+        return cls(stream) if stream is not None else None
+
+    def read(self, size=-1):
+        chunk = self._stream.read(size)
+        self.count += len(chunk)
+        return chunk
+
+    def write(self, data):
+        self.count += len(data)
+        return self._stream.write(data)
+
+def _record_outbound(service_name, data_payload, started_at, result, body, sink):
+    """
+    Registra una transacción saliente en las métricas, bajo "servicio:comando".
+
+    Returns:
+        tuple: El mismo resultado recibido, para poder devolverlo directamente.
+    """
+    _, r_status, r_content = result
+    bytes_out = len(data_payload) + (body.count if body is not None else 0)
+    bytes_in = len(r_content) + (sink.count if sink is not None else 0)
+    error = r_status != "OK" or is_error_response(r_content)
+    outbound_metrics.record(f"{service_name}:{command_name(data_payload)}", time.monotonic() - started_at, bytes_in, bytes_out, error)
+    return result
+
+
+class TransactPool:
+    """
+    Pool de conexiones persistentes de cliente hacia el bus.
+
+    Reutiliza las conexiones entre transacciones para evitar abrir una conexión
+    TCP por solicitud. Es seguro usarlo desde varios hilos: cada transacción toma
+    una conexión exclusiva y la devuelve al terminar. Antes de reutilizar una
+    conexión se verifica que siga sana, y las que superan POOL_IDLE_TIMEOUT
+    segundos inactivas se cierran.
+    """
+    def __init__(self, host, port, max_idle=POOL_MAX_IDLE_CONNECTIONS, idle_timeout=POOL_IDLE_TIMEOUT):
+        """Inicializa el pool.
+
+        Args:
+            host (str): La dirección del host del bus.
+            port (int): El puerto del bus.
+            max_idle (int): Máximo de conexiones inactivas que se conservan.
+            idle_timeout (float): Segundos de inactividad tras los que se cierra una conexión.
+        """
+        self.host = host
+        self.port = port
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._idle = collections.deque() # (lector, instante_de_liberación), la más reciente a la derecha.
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """Abre una nueva conexión con el bus."""
+        sock = socket.create_connection((self.host, self.port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return _FrameReader(sock)
+
+    @staticmethod
+    def _is_healthy(reader):
+        """
+        Verifica que una conexión inactiva siga utilizable.
+
+        Una conexión inactiva no debería tener nada que leer: si el socket está
+        listo para lectura es porque el bus la cerró o envió datos inesperados.
+        """
+        try:
+            if reader.sock.fileno() < 0:
+                return False
+            readable, _, _ = select.select([reader.sock], [], [], 0)
+            return not readable
+        except (OSError, ValueError):
+            return False
+
+    def _evict_expired(self, now):
+        """Cierra las conexiones inactivas más antiguas que idle_timeout. Requiere el lock."""
+        expired = []
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.popleft()[0])
+        return expired
+
+    def _acquire(self):
+        """Obtiene una conexión sana del pool, o abre una nueva si no hay disponibles."""
+        while True:
+            with self._lock:
+                expired = self._evict_expired(time.monotonic())
+                reader = self._idle.pop()[0] if self._idle else None
+            for stale in expired:
+                stale.sock.close()
+
+            if reader is None:
+                return self._connect()
+            if self._is_healthy(reader):
+                return reader
+            reader.sock.close()
+
+    def _release(self, reader):
+        """Devuelve una conexión al pool, o la cierra si el pool ya está lleno."""
+        with self._lock:
+            expired = self._evict_expired(time.monotonic())
+            if len(self._idle) < self.max_idle:
+                self._idle.append((reader, time.monotonic()))
+                reader = None
+        for stale in expired:
+            stale.sock.close()
+        if reader is not None:
+            reader.sock.close()
+
+    def transact(self, service_name, data_payload, body=None, sink=None):
+        """
+        Realiza una transacción usando una conexión del pool.
+
+        Los argumentos y el valor de retorno son los mismos que los de `transact`.
+        Si ocurre un error, la conexión usada se descarta en lugar de volver al pool.
+        """
+        started_at = time.monotonic()
+        body, sink = _ByteCounter.wrap(body), _ByteCounter.wrap(sink)
+        try:
+            reader = self._acquire()
+        except Exception as e:
+            transact_logger.error("Ocurrió un error: %s", e)
+            return _record_outbound(service_name, data_payload, started_at, ("ERROR", "NK", str(e)), body, sink)
+
+        try:
+            peer_codecs = _negotiate_compression(reader, (self.host, self.port, service_name), service_name)
+            result = _run_transaction(reader, service_name, data_payload, body, sink, peer_codecs)
+        except Exception as e:
+            reader.sock.close()
+            transact_logger.error("Ocurrió un error: %s", e)
+            return _record_outbound(service_name, data_payload, started_at, ("ERROR", "NK", str(e)), body, sink)
+
+        self._release(reader)
+        return _record_outbound(service_name, data_payload, started_at, result, body, sink)
+
+    def close(self):
+        """Cierra todas las conexiones inactivas del pool."""
+        with self._lock:
+            idle, self._idle = self._idle, collections.deque()
+        for reader, _ in idle:
+            reader.sock.close()
+
+
+# Pools compartidos por `transact`, uno por cada dirección de bus.
+_pools = {}
+_pools_lock = threading.Lock()
 
+def get_pool(host, port):
+    """Devuelve el pool compartido para el bus indicado, creándolo si no existe."""
+    with _pools_lock:
+        pool = _pools.get((host, port))
+        if pool is None:
+            pool = _pools[(host, port)] = TransactPool(host, port)
+        return pool
 
-def transact(host, port, service_name, data_payload):
+def transact(host, port, service_name, data_payload, body=None, sink=None):
     """
     Realiza una transacción completa para un cliente.
 
-    Esta función de alto nivel conecta, envía una solicitud, recibe y parsea
-    la respuesta completa del bus (Servicio, Estado, Contenido).
+    Esta función de alto nivel envía una solicitud, recibe y parsea la
+    respuesta completa del bus (Servicio, Estado, Contenido). Los cuerpos
+    binarios viajan como bytes crudos en una trama binaria si caben en ella;
+    si no, y para los mensajes que no caben en una trama, se usa el modo flujo
+    sobre la misma conexión. Las conexiones se toman del pool compartido del
+    bus, por lo que se reutilizan entre llamadas.
 
     Args:
         host (str): La dirección del host del bus.
         port (int): El puerto del bus.
         service_name (str): El servicio de destino para la solicitud.
         data_payload (str): Los datos que se enviarán al servicio.
+        body (io.BufferedIOBase, optional): Cuerpo binario a enviar junto a los datos.
+        sink (io.BufferedIOBase, optional): Destino donde escribir el cuerpo binario
+                                            de la respuesta, si el servicio envía uno.
 
     Returns:
         tuple: Una tupla con (nombre_servicio, estado, contenido) de la respuesta.
     """
-    try:
-        # 'with' asegura que el socket se cierre automáticamente al finalizar.
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.connect((host, port))
-            
-            # Envía la solicitud del cliente
-            _send_message(sock, service_name, data_payload)
-            
-            # Recibe el payload completo de la respuesta
-            payload = _read_payload_from_socket(sock)
-            
-            if payload is None:
-                return "ERROR", "NK", "Conexión cerrada por el bus."
-            
-            # Imprime la transacción cruda para depuración
-            # print(f"<- RAW Payload: {payload}", flush=True)
-            
-            # Parsea el payload según el formato de respuesta del bus
-            r_service = payload[:5]
-            r_status = payload[5:7]
-            r_content = payload[7:]
-            
-            # Parsea el payload según el formato de respuesta del bus
-            return r_service, r_status, r_content
-        
-    except Exception as e:
-        print(f"[Transact] Ocurrió un error: {e}", flush=True)
-        return "ERROR", "NK", str(e)
\ No newline at end of file
+    return get_pool(host, port).transact(service_name, data_payload, body, sink)
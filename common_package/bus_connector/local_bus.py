@@ -0,0 +1,293 @@
+# common_package/bus_connector/local_bus.py
+"""
+Implementación local del bus de servicios (compatible con jrgiadach/soabus:v1).
+
+Permite ejecutar, probar y medir el sistema sin Docker. Se puede usar dentro
+del mismo proceso (LocalBus.start_in_thread) o como programa:
+
+    python -m bus_connector.local_bus --port 5000
+"""
+import argparse
+import asyncio
+import collections
+import json
+import threading
+import time
+
+from .logs import configure_logging, get_logger
+from .metrics import MetricsRegistry
+
+logger = get_logger("LocalBus")
+
+MAX_PAYLOAD_SIZE = 99999
+REGISTER_SERVICE = "sinit"
+
+
+async def _read_frame(reader):
+    """Lee una trama "LLLLL<payload>" y devuelve el payload, o None si la conexión se cerró."""
+    try:
+        raw_len = await reader.readexactly(5)
+        return await reader.readexactly(int(raw_len))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+def _encode_frame(payload):
+    """Antepone el largo de 5 dígitos a un payload."""
+    return b"%05d%b" % (len(payload), payload)
+
+
+class _Worker:
+    """Conexión registrada por un servicio con "sinit"."""
+    def __init__(self, name, reader, writer):
+        self.name = name
+        self.reader = reader
+        self.writer = writer
+
+    @property
+    def alive(self):
+        return not (self.reader.at_eof() or self.writer.is_closing())
+
+
+class _ServiceWorkers:
+    """Trabajadores registrados bajo un mismo nombre de servicio."""
+    def __init__(self, connections):
+        self.connections = connections  # Conexiones abiertas del bus, para olvidar las de trabajadores caídos.
+        self.idle = collections.deque()  # Orden FIFO: el reparto es determinista (round-robin).
+        self.alive = 0
+        self.condition = asyncio.Condition()
+
+    async def add(self, worker):
+        async with self.condition:
+            self.alive += 1
+            self.idle.append(worker)
+            self.condition.notify()
+
+    async def acquire(self):
+        """Espera un trabajador libre. Devuelve None si el servicio ya no tiene trabajadores."""
+        async with self.condition:
+            while True:
+                await self.condition.wait_for(lambda: self.idle or not self.alive)
+                if not self.idle:
+                    return None
+                worker = self.idle.popleft()
+                if worker.alive:
+                    return worker
+                self._remove(worker) # Se desconectó mientras estaba libre.
+
+    async def release(self, worker):
+        async with self.condition:
+            self.idle.append(worker)
+            self.condition.notify()
+
+    async def discard(self, worker):
+        async with self.condition:
+            self._remove(worker)
+            self.condition.notify_all()
+
+    def _remove(self, worker):
+        """Da de baja un trabajador caído. Requiere el lock de `condition`."""
+        self.alive -= 1
+        self.connections.discard(worker.writer)
+        worker.writer.close()
+
+
+class LocalBus:
+    """
+    Bus de servicios en asyncio.
+
+    Reproduce el protocolo del bus: cada trama es "LLLLL" + servicio (5
+    caracteres) + datos. Un servicio se registra con "sinit"; una solicitud de
+    cliente se reenvía a un trabajador libre de ese servicio y su respuesta se
+    devuelve con el estado "OK" (o "NK" si el servicio no está disponible). Varias
+    conexiones pueden registrarse con el mismo nombre: se reparten las
+    solicitudes en orden y cada una atiende una solicitud a la vez.
+
+    Lleva métricas de cada servicio (latencia, espera en cola, bytes y errores)
+    consultables con `stats()`.
+    """
+    def __init__(self, host="127.0.0.1", port=5000):
+        """Inicializa el bus.
+
+        Args:
+            host (str): Dirección donde escuchar.
+            port (int): Puerto donde escuchar (0 elige uno libre; ver `self.port`).
+        """
+        self.host = host
+        self.port = port
+        self._services = {}
+        self._server = None
+        self._stopped = None
+        self._connections = set()
+        self._loop = None
+        self._thread = None
+        self._latency = MetricsRegistry()
+        self._queue_wait = MetricsRegistry()
+
+    def _workers(self, name):
+        workers = self._services.get(name)
+        if workers is None:
+            workers = self._services[name] = _ServiceWorkers(self._connections)
+        return workers
+
+    async def start(self):
+        """Empieza a escuchar conexiones en el bucle de eventos actual."""
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Bus local escuchando en %s:%s", self.host, self.port)
+
+    async def serve_forever(self):
+        """Inicia el bus (si no lo está) y lo mantiene en ejecución hasta llamar a `stop`."""
+        if self._server is None:
+            await self.start()
+        await self._stopped.wait()
+
+    async def stop(self):
+        """Deja de aceptar conexiones y cierra las de clientes y servicios."""
+        if self._server is None:
+            return
+        self._server.close()
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+        self._stopped.set()
+
+    def start_in_thread(self):
+        """
+        Ejecuta el bus en un hilo propio y vuelve cuando ya acepta conexiones.
+
+        Returns:
+            LocalBus: El mismo bus, con `self.port` ya asignado.
+        """
+        ready = threading.Event()
+
+        async def run():
+            await self.start()
+            ready.set()
+            await self.serve_forever()
+
+        self._thread = threading.Thread(target=asyncio.run, args=(run(),), name="local-bus", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop_thread(self):
+        """Detiene un bus iniciado con `start_in_thread`."""
+        if self._thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def stats(self, reset=False):
+        """
+        Devuelve las métricas del bus por servicio.
+
+        Args:
+            reset (bool): Si es True, la latencia y la espera vuelven a cero (para medir por intervalos).
+
+        Returns:
+            dict: Para cada servicio, los trabajadores registrados y libres, la
+                  latencia de ida y vuelta ("latency") y la espera por un
+                  trabajador libre ("queue_wait"), ambas en el formato de metrics.py.
+        """
+        latency = self._latency.snapshot(reset)
+        queue_wait = self._queue_wait.snapshot(reset)
+        return {
+            name: {
+                "workers": workers.alive,
+                "idle_workers": len(workers.idle),
+                "latency": latency.get(name),
+                "queue_wait": queue_wait.get(name),
+            }
+            for name, workers in sorted(self._services.items())
+        }
+
+    async def _handle_connection(self, reader, writer):
+        """Atiende una conexión: la registra como trabajador o la trata como cliente."""
+        self._connections.add(writer)
+        try:
+            while True:
+                payload = await _read_frame(reader)
+                if payload is None:
+                    break
+
+                service = payload[:5].decode('utf-8', errors='replace')
+                if service == REGISTER_SERVICE:
+                    await self._register(payload[5:].decode('utf-8').strip(), reader, writer)
+                    return # Desde ahora la conexión la usa el bus para enviar solicitudes.
+
+                writer.write(_encode_frame(await self._dispatch(service, payload)))
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass # El cliente se desconectó o el bus se está deteniendo.
+        self._connections.discard(writer)
+        writer.close()
+
+    async def _register(self, name, reader, writer):
+        """Registra una conexión como trabajador de un servicio."""
+        writer.write(_encode_frame(f"{REGISTER_SERVICE}OK{name}".encode('utf-8')))
+        await writer.drain()
+        await self._workers(name).add(_Worker(name, reader, writer))
+        logger.info("Servicio '%s' registrado (%d trabajador(es)).", name, self._services[name].alive)
+
+    async def _dispatch(self, service, payload):
+        """Reenvía una solicitud a un trabajador del servicio y devuelve la respuesta para el cliente."""
+        started_at = time.monotonic()
+        workers = self._services.get(service)
+        worker = await workers.acquire() if workers is not None else None
+        waited = time.monotonic() - started_at
+        if worker is None:
+            self._latency.record(service, waited, len(payload), 0, error=True)
+            return f"{service}NKServicio no disponible".encode('utf-8')
+        self._queue_wait.record(service, waited)
+
+        try:
+            worker.writer.write(_encode_frame(payload))
+            await worker.writer.drain()
+            reply = await _read_frame(worker.reader)
+        except ConnectionError:
+            reply = None
+        if reply is None:
+            await workers.discard(worker)
+            logger.warning("Un trabajador de '%s' se desconectó durante una solicitud.", service)
+            self._latency.record(service, time.monotonic() - started_at, len(payload), 0, error=True)
+            return f"{service}NKEl servicio se desconectó".encode('utf-8')
+        await workers.release(worker)
+
+        response = reply[:5] + b"OK" + reply[5:]
+        if len(response) > MAX_PAYLOAD_SIZE:
+            response = f"{service}NKRespuesta demasiado grande".encode('utf-8')
+        self._latency.record(service, time.monotonic() - started_at, len(payload), len(response), error=response[5:7] != b"OK")
+        return response
+
+
+def main():
+    """Ejecuta el bus local como programa independiente."""
+    parser = argparse.ArgumentParser(description="Bus de servicios local (compatible con soabus).")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--stats-interval", type=float, default=0, help="Segundos entre reportes de métricas (0 los desactiva).")
+    args = parser.parse_args()
+
+    configure_logging("soabus")
+    bus = LocalBus(args.host, args.port)
+
+    async def report_stats():
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            logger.info("Métricas: %s", json.dumps(bus.stats()))
+
+    async def run():
+        if args.stats_interval > 0:
+            asyncio.get_running_loop().create_task(report_stats())
+        await bus.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        logger.info("Métricas finales: %s", json.dumps(bus.stats()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# common_package/bus_connector/logs.py
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+# --- CONFIGURACIÓN DE LOGS (POR SERVICIO, VÍA VARIABLES DE ENTORNO) ---
+# LOG_LEVEL: nivel general (DEBUG, INFO, WARNING, ERROR). Por defecto INFO.
+# LOG_LEVELS: niveles por componente, ej. "BusConnector=DEBUG,Transact=WARNING".
+# LOG_PAYLOAD_MAX_SIZE: caracteres de un payload que se muestran antes de truncarlo.
+# LOG_PAYLOAD_SAMPLE_RATE: fracción (0 a 1) de los payloads que se registran.
+# LOG_ASYNC: "1" (por defecto) escribe los logs desde un hilo aparte, sin
+#            bloquear a quien registra; "0" los escribe en el mismo hilo.
+LOG_FORMAT = "%(asctime)s %(levelname)s {service}[%(name)s] %(message)s"
+LOG_PAYLOAD_MAX_SIZE = int(os.getenv("LOG_PAYLOAD_MAX_SIZE", 256))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", 1.0))
+
+_listener = None
+
+
+class _Payload:
+    """
+    Representación truncada de un payload para los logs.
+
+    Solo se convierte a texto si el registro llega a emitirse, y nunca copia
+    más de LOG_PAYLOAD_MAX_SIZE bytes del payload original.
+    """
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        data = self.data
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            text = bytes(data[:LOG_PAYLOAD_MAX_SIZE]).decode('utf-8', errors='replace')
+        else:
+            text = data[:LOG_PAYLOAD_MAX_SIZE]
+        if len(data) <= LOG_PAYLOAD_MAX_SIZE:
+            return text
+        return f"{text}... (+{len(data) - LOG_PAYLOAD_MAX_SIZE} truncados)"
+
+
+def _stop_listener():
+    """Vacía la cola de logs pendientes y detiene el hilo escritor, si existe."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(_stop_listener)
+
+
+def get_logger(name):
+    """Devuelve el logger de un componente (ej. "BusConnector", "ServiceLogic")."""
+    return logging.getLogger(name)
+
+def log_payload(logger, message, data, level=logging.DEBUG):
+    """
+    Registra un mensaje que incluye un payload, truncado y muestreado.
+
+    Args:
+        logger (logging.Logger): Logger del componente.
+        message (str): Mensaje con un "%s" donde va el payload.
+        data (str | bytes | memoryview): El payload.
+        level (int): Nivel del registro (DEBUG por defecto).
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if LOG_PAYLOAD_SAMPLE_RATE < 1 and random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    logger.log(level, message, _Payload(data))
+
+def configure_logging(service_name=None):
+    """
+    Configura los logs del proceso según las variables de entorno.
+
+    Debe llamarse una vez al iniciar el servicio. Si LOG_ASYNC está activo, los
+    registros se formatean en el hilo que los emite y se escriben en stdout desde
+    un hilo dedicado (QueueHandler + QueueListener).
+
+    Args:
+        service_name (str, optional): Nombre del servicio, incluido en cada línea.
+    """
+    global _listener
+
+    root = logging.getLogger()
+    _stop_listener()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT.format(service=f"{service_name} " if service_name else "")))
+
+    if os.getenv("LOG_ASYNC", "1") != "0":
+        log_queue = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+        _listener.start()
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+    else:
+        root.addHandler(stream_handler)
+
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    for entry in os.getenv("LOG_LEVELS", "").split(','):
+        if '=' in entry:
+            name, level = entry.split('=', 1)
+            logging.getLogger(name.strip()).setLevel(level.strip().upper())
@@ -0,0 +1,169 @@
+# common_package/bus_connector/metrics.py
+import bisect
+import json
+import threading
+import time
+
+# --- MÉTRICAS POR COMANDO ---
+# Cada proceso lleva dos registros: las solicitudes que atiende (por comando) y
+# las que envía con `transact` (por "servicio:comando"). Para cada comando se
+# cuentan solicitudes, errores y bytes de entrada/salida, y las latencias se
+# acumulan en un histograma de cubetas geométricas, por lo que la memoria usada
+# no crece con el número de solicitudes. Un servicio responde sus métricas, y los
+# valores instantáneos que registre con `register_gauge`, al comando reservado
+# STATS_COMMAND.
+STATS_COMMAND = "__stats"
+METRICS_MAX_COMMANDS = 64  # Comandos distintos por registro; el resto se agrupa.
+METRICS_OTHER_COMMAND = "__otros"
+COMMAND_NAME_MAX_SIZE = 32
+
+# Límites superiores (en segundos) de las cubetas del histograma: de 0,1 ms a ~10 min,
+# creciendo un 20 % por cubeta. El error relativo de un percentil es de a lo sumo 20 %.
+_BUCKET_BOUNDS = []
+_bound = 0.0001
+while _bound < 600:
+    _BUCKET_BOUNDS.append(_bound)
+    _bound *= 1.2
+del _bound
+
+
+def command_name(data):
+    """Extrae el nombre del comando ("comando|payload") para agrupar métricas."""
+    return data.split('|', 1)[0][:COMMAND_NAME_MAX_SIZE] or "?"
+
+def is_error_response(text):
+    """Indica si una respuesta de texto de un servicio informa un error."""
+    return text.startswith("Error") or text.startswith('{"status": "ERROR"')
+
+
+class _CommandMetrics:
+    """Contadores e histograma de latencias de un comando. Requiere el lock del registro."""
+    __slots__ = ("count", "errors", "bytes_in", "bytes_out", "total_seconds", "max_seconds", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(_BUCKET_BOUNDS) + 1)
+
+    def percentile(self, fraction):
+        """Estima un percentil (en segundos) con el límite superior de su cubeta."""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.buckets):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return min(_BUCKET_BOUNDS[index] if index < len(_BUCKET_BOUNDS) else self.max_seconds, self.max_seconds)
+        return self.max_seconds
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "mean_ms": round(self.total_seconds / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.50) * 1000, 3),
+            "p95_ms": round(self.percentile(0.95) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "max_ms": round(self.max_seconds * 1000, 3),
+        }
+
+
+class MetricsRegistry:
+    """Métricas por comando, seguras para usarse desde varios hilos."""
+    def __init__(self):
+        self._commands = {}
+        self._lock = threading.Lock()
+
+    def _get(self, command):
+        """Devuelve (creándolas si hace falta) las métricas de un comando. Requiere el lock."""
+        metrics = self._commands.get(command)
+        if metrics is None:
+            if len(self._commands) >= METRICS_MAX_COMMANDS:
+                command = METRICS_OTHER_COMMAND
+                metrics = self._commands.get(command)
+            if metrics is None:
+                metrics = self._commands[command] = _CommandMetrics()
+        return metrics
+
+    def record(self, command, seconds, bytes_in=0, bytes_out=0, error=False):
+        """
+        Registra una solicitud completada.
+
+        Args:
+            command (str): Nombre del comando.
+            seconds (float): Latencia de la solicitud.
+            bytes_in (int): Bytes recibidos (datos y cuerpo).
+            bytes_out (int): Bytes enviados (datos y cuerpo).
+            error (bool): Si la solicitud terminó en error.
+        """
+        bucket = bisect.bisect_left(_BUCKET_BOUNDS, seconds)
+        with self._lock:
+            metrics = self._get(command)
+            metrics.count += 1
+            metrics.errors += 1 if error else 0
+            metrics.bytes_in += bytes_in
+            metrics.bytes_out += bytes_out
+            metrics.total_seconds += seconds
+            metrics.max_seconds = max(metrics.max_seconds, seconds)
+            metrics.buckets[bucket] += 1
+
+    def add_bytes_out(self, command, size):
+        """Suma bytes enviados después de registrar la solicitud (ej. trozos de un flujo saliente)."""
+        with self._lock:
+            self._get(command).bytes_out += size
+
+    def snapshot(self, reset=False):
+        """
+        Devuelve las métricas de todos los comandos como un diccionario.
+
+        Args:
+            reset (bool): Si es True, las métricas vuelven a cero (para medir por intervalos).
+        """
+        with self._lock:
+            snapshot = {command: metrics.snapshot() for command, metrics in sorted(self._commands.items())}
+            if reset:
+                self._commands = {}
+            return snapshot
+
+
+# Registros del proceso: solicitudes atendidas y solicitudes enviadas con `transact`.
+inbound_metrics = MetricsRegistry()
+outbound_metrics = MetricsRegistry()
+_gauges = {}
+_started_at = time.monotonic()
+
+def register_gauge(name, read):
+    """
+    Registra un valor instantáneo del servicio que se informa con STATS_COMMAND.
+
+    Args:
+        name (str): Nombre del valor (ej. "active_transactions").
+        read (callable): Función sin argumentos que devuelve el valor actual.
+    """
+    _gauges[name] = read
+
+def _read_gauges():
+    values = {}
+    for name, read in list(_gauges.items()):
+        try:
+            values[name] = read()
+        except Exception as e:
+            values[name] = f"Error: {e}"
+    return values
+
+def stats_report(service_name):
+    """Construye la respuesta JSON al comando STATS_COMMAND."""
+    return json.dumps({
+        "service": service_name,
+        "uptime_seconds": round(time.monotonic() - _started_at, 1),
+        "inbound": inbound_metrics.snapshot(),
+        "outbound": outbound_metrics.snapshot(),
+        "gauges": _read_gauges(),
+    })
@@ -0,0 +1,95 @@
+# common_package/bus_connector/workers.py
+import threading
+import time
+
+from .batch import _dispatch_batch, _is_batch
+from .connector import ServiceConnector, _StreamRegistry
+from .logs import get_logger
+
+logger = get_logger("WorkerPool")
+
+# Segundos de espera antes de que un trabajador intente reconectarse al bus.
+RECONNECT_DELAY = 5
+
+
+class ServiceWorkerPool:
+    """
+    Atiende un servicio con varias conexiones registradas bajo el mismo nombre.
+
+    Cada trabajador es un hilo con su propia conexión al bus y su propio bucle
+    esperar -> procesar -> responder, por lo que el orden solicitud/respuesta de
+    cada conexión se mantiene. Una solicitud lenta solo ocupa a su trabajador;
+    las demás siguen atendiéndose por las otras conexiones. Los trabajadores
+    comparten el registro de flujos, ya que el bus puede repartir las tramas de
+    un mismo flujo entre conexiones distintas.
+
+    El manejador recibe (datos, cuerpo_binario) y devuelve la respuesta como
+    texto o como una tupla (respuesta, cuerpo_binario). Debe ser seguro para
+    ejecutarse desde varios hilos a la vez. Los lotes ("#BTCH", ver batch.py) se desempaquetan
+    aquí: el manejador recibe cada subsolicitud por separado, por lo que todo
+    servicio atendido por el pool los admite sin cambios.
+    """
+    def __init__(self, host, port, service_name, handler, workers=1, on_stream_chunk=None):
+        """Inicializa el pool de trabajadores.
+
+        Args:
+            host (str): La dirección del host del bus.
+            port (int): El puerto del bus.
+            service_name (str): El nombre del servicio.
+            handler (callable): Función que procesa cada solicitud.
+            workers (int): Número de conexiones (y de hilos) a registrar.
+            on_stream_chunk (callable, optional): Recibe la cabecera (ej. "comando|{...}")
+                de una solicitud en modo flujo cada vez que llega uno de sus trozos,
+                antes de que la solicitud completa llegue al manejador.
+        """
+        self.host = host
+        self.port = port
+        self.service_name = service_name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self._streams = _StreamRegistry(on_chunk=on_stream_chunk)
+
+    def _serve(self, connector):
+        """Atiende solicitudes en una conexión ya registrada hasta que el bus la cierre."""
+        while True:
+            data_received = connector.wait_for_transaction()
+            if data_received is None:
+                logger.warning("[%s] El bus cerró la conexión, se intentará reconectar.", threading.current_thread().name)
+                return
+
+            if _is_batch(data_received):
+                response = _dispatch_batch(self.handler, data_received, connector.request_body)
+            else:
+                response = self.handler(data_received, connector.request_body)
+            if isinstance(response, tuple):
+                connector.send_response(*response)
+            else:
+                connector.send_response(response)
+
+    def _worker_loop(self):
+        """Mantiene una conexión registrada, reconectando si se pierde."""
+        while True:
+            connector = ServiceConnector(self.host, self.port, self.service_name, stream_registry=self._streams)
+            try:
+                connector.connect_and_register()
+                self._serve(connector)
+            except Exception as e:
+                logger.error("[%s] Error: %s. Reintentando en %d segundos...", threading.current_thread().name, e, RECONNECT_DELAY)
+            finally:
+                connector.close()
+            time.sleep(RECONNECT_DELAY)
+
+    def run(self):
+        """Inicia los trabajadores y bloquea mientras el servicio esté en ejecución."""
+        logger.info("Iniciando %d trabajador(es) para '%s'.", self.workers, self.service_name)
+        threads = [
+            threading.Thread(target=self._worker_loop, name=f"{self.service_name}-worker-{i + 1}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        finally:
+            self._streams.discard_all()
@@ -0,0 +1,3 @@
+# common_package/object_storage/__init__.py
+from .compression import STORAGE_CODEC_NONE, STORAGE_CODECS, DecompressingReader, choose_storage_codec, storage_compressor
+from .layout import OBJECTS_DIR, find_object, object_path, open_object, open_objects
@@ -0,0 +1,105 @@
+# common_package/object_storage/compression.py
+import bz2
+import lzma
+import zlib
+
+# --- COMPRESIÓN DE LAS COPIAS GUARDADAS EN DISCO ---
+# backup-service guarda cada objeto (archivo completo o trozo) comprimido con el
+# códec configurado, salvo que su primer bloque no se reduzca al menos a
+# STORAGE_MIN_RATIO de su tamaño (datos ya comprimidos, imágenes, etc.): entonces
+# se guarda tal cual ("none"). El códec forma parte del nombre del objeto
+# (<hash>.<códec>) y se registra en la base de datos; el hash es siempre el del
+# contenido original, que restore-service verifica después de descomprimir.
+STORAGE_CODEC_NONE = "none"
+STORAGE_MIN_RATIO = 0.9
+STORAGE_READ_SIZE = 1024 * 1024
+
+# Compresor y descompresor incremental de cada códec.
+_STORAGE_CODECS = {
+    "zlib": (lambda: zlib.compressobj(6), zlib.decompressobj),
+    "lzma": (lambda: lzma.LZMACompressor(preset=1), lzma.LZMADecompressor),
+    "bz2": (bz2.BZ2Compressor, bz2.BZ2Decompressor),
+}
+STORAGE_CODECS = (STORAGE_CODEC_NONE,) + tuple(_STORAGE_CODECS)
+
+
+def storage_compressor(codec):
+    """Devuelve un compresor incremental (compress/flush) para el códec, o None para "none"."""
+    if codec == STORAGE_CODEC_NONE:
+        return None
+    return _STORAGE_CODECS[codec][0]()
+
+def choose_storage_codec(sample, codec):
+    """
+    Decide con qué códec guardar un contenido, comprimiendo su primer bloque.
+
+    Args:
+        sample (bytes): Primer bloque del contenido.
+        codec (str): Códec configurado.
+
+    Returns:
+        str: `codec` si el bloque se reduce lo suficiente; si no, "none".
+    """
+    if codec not in _STORAGE_CODECS or not sample:
+        return STORAGE_CODEC_NONE
+    compressor = storage_compressor(codec)
+    packed_size = len(compressor.compress(sample)) + len(compressor.flush())
+    return codec if packed_size <= len(sample) * STORAGE_MIN_RATIO else STORAGE_CODEC_NONE
+
+
+class DecompressingReader:
+    """
+    Objeto tipo archivo que descomprime por bloques un archivo guardado con un
+    códec de almacenamiento. Usa memoria acotada aunque el contenido se expanda
+    mucho, y admite volver al inicio con seek(0).
+    """
+    def __init__(self, stream, codec):
+        """
+        Args:
+            stream (io.BufferedIOBase): Archivo comprimido, abierto en modo binario.
+            codec (str): Códec con que se comprimió.
+        """
+        if codec not in _STORAGE_CODECS:
+            raise ValueError(f"Códec de almacenamiento desconocido: '{codec}'.")
+        self._stream = stream
+        self._codec = codec
+        self.seek(0)
+
+    def _decompress_more(self):
+        """Descomprime hasta STORAGE_READ_SIZE bytes más; devuelve b"" al final del contenido."""
+        decompressor = self._decompressor
+        while not decompressor.eof:
+            if self._codec == "zlib":
+                data = decompressor.unconsumed_tail or self._stream.read(STORAGE_READ_SIZE)
+            else:
+                data = self._stream.read(STORAGE_READ_SIZE) if decompressor.needs_input else b""
+            if not data and (self._codec == "zlib" or decompressor.needs_input):
+                raise IOError("El objeto comprimido está incompleto.")
+            data = decompressor.decompress(data, STORAGE_READ_SIZE)
+            if data:
+                return data
+        return b""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            data = self._decompress_more()
+            if not data:
+                break
+            self._buffer += data
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def seek(self, offset, whence=0):
+        """Solo admite volver al inicio."""
+        if offset != 0 or whence != 0:
+            raise ValueError("DecompressingReader solo admite seek(0).")
+        self._stream.seek(0)
+        self._decompressor = _STORAGE_CODECS[self._codec][1]()
+        self._buffer = bytearray()
+        return 0
+
+    def close(self):
+        self._stream.close()
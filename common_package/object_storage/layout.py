@@ -0,0 +1,48 @@
+# common_package/object_storage/layout.py
+import os
+from bus_connector import ChunkedFileReader
+from .compression import STORAGE_CODEC_NONE, STORAGE_CODECS, DecompressingReader
+
+# --- UBICACIÓN DE LOS OBJETOS EN UN ALMACÉN ---
+# backup-service escribe cada contenido en objects/<2 primeros caracteres del
+# hash>/<hash>, con el códec como extensión si se guardó comprimido
+# (<hash>.<códec>); restore-service los lee desde los mismos volúmenes.
+OBJECTS_DIR = "objects"
+
+
+def object_path(base_dir, file_hash, codec=STORAGE_CODEC_NONE):
+    """Ruta del objeto con el hash dado dentro de un almacén, guardado con el códec indicado."""
+    path = os.path.join(base_dir, OBJECTS_DIR, file_hash[:2], file_hash)
+    return path if codec == STORAGE_CODEC_NONE else f"{path}.{codec}"
+
+def find_object(base_dir, file_hash, codec=STORAGE_CODEC_NONE):
+    """
+    Busca un objeto en un almacén, primero con el códec indicado (ej. el registrado
+    en la BD) y luego con los demás: cada almacén pudo guardarlo con un códec distinto.
+
+    Returns:
+        tuple: (ruta, códec), o None si el objeto no está.
+    """
+    for candidate in (codec,) + tuple(c for c in STORAGE_CODECS if c != codec):
+        path = object_path(base_dir, file_hash, candidate)
+        if os.path.exists(path):
+            return path, candidate
+    return None
+
+def open_object(path, codec=STORAGE_CODEC_NONE):
+    """Abre un objeto para leer su contenido original, descomprimiéndolo al leer si hace falta."""
+    file_handle = open(path, "rb")
+    return file_handle if codec == STORAGE_CODEC_NONE else DecompressingReader(file_handle, codec)
+
+def open_objects(found_objects, hasher=None):
+    """
+    Abre como un único archivo una secuencia de objetos (ej. los trozos de un archivo).
+
+    Args:
+        found_objects (list): Tuplas (ruta, códec), en orden, como las de find_object.
+        hasher (optional): Objeto de hashlib que se actualiza con los bytes leídos.
+
+    Returns:
+        ChunkedFileReader: Lector del contenido original, concatenado.
+    """
+    return ChunkedFileReader(list(found_objects), hasher, opener=lambda found: open_object(*found))
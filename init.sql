@@ -23,9 +23,36 @@ CREATE TABLE IF NOT EXISTS BackedUpFiles (
     path_within_source VARCHAR(4096) NOT NULL,
     size BIGINT NOT NULL CHECK (size >= 0),
     file_hash VARCHAR(64) NOT NULL,
+    mtime DOUBLE PRECISION, -- Fecha de modificación en el origen (segundos), para respaldos incrementales
+    cloud_status VARCHAR(16) NOT NULL DEFAULT 'replicated', -- Copia en la nube: 'pending', 'retrying', 'replicated' o 'superseded' (reemplazada en la nube por una instancia posterior)
+    compression VARCHAR(8) DEFAULT 'none', -- Códec de la copia local ('none', 'zlib', 'lzma', 'bz2'); NULL si se guardó por trozos
+    object_refs BOOLEAN NOT NULL DEFAULT FALSE, -- TRUE si el archivo tiene referencias en el almacén de objetos (FALSE: copia por ruta, o ya liberadas al eliminar la instancia)
     FOREIGN KEY (backup_instance_id) REFERENCES BackupInstances(id) ON DELETE CASCADE
 );
 
+-- Trozos (definidos por contenido) de los archivos grandes, guardados como objetos por separado
+CREATE TABLE IF NOT EXISTS FileChunks (
+    backed_up_file_id INT NOT NULL,
+    chunk_index INT NOT NULL,
+    chunk_hash VARCHAR(64) NOT NULL,
+    size BIGINT NOT NULL CHECK (size >= 0),
+    compression VARCHAR(8) NOT NULL DEFAULT 'none', -- Códec con que se guardó el trozo
+    PRIMARY KEY (backed_up_file_id, chunk_index),
+    FOREIGN KEY (backed_up_file_id) REFERENCES BackedUpFiles(id) ON DELETE CASCADE
+);
+
+-- Bases de datos creadas antes de los respaldos incrementales
+ALTER TABLE BackedUpFiles ADD COLUMN IF NOT EXISTS mtime DOUBLE PRECISION;
+-- Bases de datos creadas antes de la replicación asíncrona a la nube
+ALTER TABLE BackedUpFiles ADD COLUMN IF NOT EXISTS cloud_status VARCHAR(16) NOT NULL DEFAULT 'replicated';
+-- Bases de datos creadas antes de la compresión de las copias locales
+ALTER TABLE BackedUpFiles ADD COLUMN IF NOT EXISTS compression VARCHAR(8) DEFAULT 'none';
+ALTER TABLE FileChunks ADD COLUMN IF NOT EXISTS compression VARCHAR(8) NOT NULL DEFAULT 'none';
+-- Bases de datos creadas antes de registrar las referencias al almacén de objetos: sus
+-- archivos quedan como copias por ruta, así que eliminarlos nunca libera objetos que
+-- usen instancias posteriores (a lo sumo, esos objetos no se liberan).
+ALTER TABLE BackedUpFiles ADD COLUMN IF NOT EXISTS object_refs BOOLEAN NOT NULL DEFAULT FALSE;
+
 -- Datos de prueba para AutoBackupJobs
 INSERT INTO AutoBackupJobs (job_name, source_path, destination_structure, frequency_hours, last_run_timestamp) VALUES
 ('Documentos de tesis', 'my_docs/files/universidad/tesis', 'backups/universidad', 24, NULL), -- Debería ejecutarse al iniciar
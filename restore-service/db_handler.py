@@ -1,13 +1,16 @@
 # restore-service/db_handler.py
 import psycopg
 import os
+from bus_connector import get_logger
+
+logger = get_logger("RestoreDBHandler")
 
 def get_db_connection():
     try:
         conn_string = f"dbname='{os.getenv('DB_NAME')}' user='{os.getenv('DB_USER')}' host='{os.getenv('DB_HOST')}' password='{os.getenv('DB_PASS')}'"
         return psycopg.connect(conn_string)
     except psycopg.OperationalError as e:
-        print(f"[RestoreDBHandler] Error al conectar: {e}", flush=True)
+        logger.error("Error al conectar: %s", e)
         return None
 
 def get_backup_instance_details(instance_id):
@@ -26,7 +29,7 @@ def get_backup_instance_details(instance_id):
                 return result[0], result[1] # structure, auto_job_id
             return None, None
     except Exception as e:
-        print(f"[RestoreDBHandler] Error al obtener detalles de instancia {instance_id}: {e}", flush=True)
+        logger.error("Error al obtener detalles de instancia %s: %s", instance_id, e)
         return None, None
     finally:
         if conn:
@@ -68,8 +71,41 @@ def get_files_for_instance(instance_id, specific_files_relative_paths=None):
                 })
         return files_data
     except Exception as e:
-        print(f"[RestoreDBHandler] Error al obtener archivos para instancia {instance_id}: {e}", flush=True)
+        logger.error("Error al obtener archivos para instancia %s: %s", instance_id, e)
         return []
     finally:
         if conn:
-            conn.close()
\ No newline at end of file
+            conn.close()
+
+
+def get_file_storage(instance_id, relative_path):
+    """
+    Obtiene cómo se guardó un archivo en las copias locales.
+
+    Returns:
+        tuple: (códec de la copia si se guardó completo, [[hash, tamaño, códec], ...]
+               con sus trozos en orden, o una lista vacía si se guardó completo).
+               Si no se pudo consultar, ('none', []).
+    """
+    conn = get_db_connection()
+    if conn is None:
+        return "none", []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT f.compression, c.chunk_hash, c.size, c.compression
+                FROM BackedUpFiles f LEFT JOIN FileChunks c ON c.backed_up_file_id = f.id
+                WHERE f.backup_instance_id = %s AND f.path_within_source = %s
+                ORDER BY c.chunk_index
+            """, (instance_id, relative_path))
+            rows = cur.fetchall()
+            if not rows:
+                return "none", []
+            chunks = [[row[1], row[2], row[3]] for row in rows if row[1] is not None]
+            return rows[0][0] or "none", chunks
+    except Exception as e:
+        logger.error("Error al obtener el almacenamiento de '%s' en la instancia %s: %s", relative_path, instance_id, e)
+        return "none", []
+    finally:
+        if conn:
+            conn.close()
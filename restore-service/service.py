@@ -1,63 +1,127 @@
 import os
 import json
 import hashlib
-import base64
-import time
-from bus_connector import ServiceConnector, transact
-from db_handler import get_backup_instance_details, get_files_for_instance
+import tempfile
+from bus_connector import ServiceWorkerPool, configure_logging, get_logger, transact
+from object_storage import STORAGE_CODEC_NONE, find_object, open_object, open_objects
+from db_handler import get_backup_instance_details, get_file_storage, get_files_for_instance
 
 BUS_HOST = os.getenv("BUS_HOST")
-BUS_PORT = 5000
+BUS_PORT = int(os.getenv("BUS_PORT", 5000))
 SERVICE_NAME = os.getenv("SERVICE_NAME", "rstrv")
+# Número de conexiones (trabajadores) que el servicio registra en el bus.
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "1"))
+
+logger = get_logger("RestoreService")
 
 # Rutas base dentro del contenedor donde se montan los volúmenes de respaldo
-PRIMARY_SOURCE_BASE = "/sources/primary"
-SECONDARY_SOURCE_BASE = "/sources/secondary"
+PRIMARY_SOURCE_BASE = os.getenv("PRIMARY_SOURCE_BASE", "/sources/primary")
+SECONDARY_SOURCE_BASE = os.getenv("SECONDARY_SOURCE_BASE", "/sources/secondary")
+
+# Tamaño de los bloques usados al hashear archivos sin cargarlos completos en memoria.
+HASH_BUFFER_SIZE = 1024 * 1024
+# Sobre este tamaño, los archivos descargados desde la nube se guardan en disco temporal.
+CLOUD_SPOOL_MAX_SIZE = 4 * 1024 * 1024
 
 def verify_hash(content_bytes, expected_hash):
     """Calcula el hash SHA256 del contenido y lo compara con el esperado."""
     current_hash = hashlib.sha256(content_bytes).hexdigest()
     return current_hash == expected_hash
 
-def attempt_restore_from_path(full_path, expected_hash):
-    """Intenta leer un archivo desde una ruta, verifica su hash y devuelve su contenido en base64."""
+def verify_stream_hash(file_stream, expected_hash):
+    """
+    Calcula el hash SHA256 de un objeto tipo archivo leyéndolo por bloques y lo
+    compara con el esperado. Deja el objeto posicionado al inicio.
+    """
+    hasher = hashlib.sha256()
+    for chunk in iter(lambda: file_stream.read(HASH_BUFFER_SIZE), b""):
+        hasher.update(chunk)
+    file_stream.seek(0)
+    return hasher.hexdigest() == expected_hash
+
+def attempt_restore_from_path(full_path, expected_hash, codec=STORAGE_CODEC_NONE):
+    """
+    Intenta abrir un archivo desde una ruta, descomprimiéndolo al leer si se guardó
+    con un códec, verifica el hash del contenido original y devuelve el archivo abierto.
+    """
     if os.path.exists(full_path):
         try:
-            with open(full_path, "rb") as f:
-                content_bytes = f.read()
-            if verify_hash(content_bytes, expected_hash):
-                return True, base64.b64encode(content_bytes).decode('utf-8')
+            file_handle = open_object(full_path, codec)
+            if verify_stream_hash(file_handle, expected_hash):
+                return True, file_handle
             else:
-                print(f"[RestoreService] Fallo de hash para {full_path}", flush=True)
+                file_handle.close()
+                logger.error("Fallo de hash para %s", full_path)
                 return False, "hash_mismatch"
         except Exception as e:
-            print(f"[RestoreService] Error leyendo {full_path}: {e}", flush=True)
+            logger.error("Error leyendo %s: %s", full_path, e)
             return False, f"read_error: {str(e)}"
     return False, "not_found"
 
+def attempt_restore_from_chunks(base_dir, chunks, expected_hash):
+    """Intenta reconstruir un archivo guardado por trozos desde el almacén de objetos y verifica su hash."""
+    found = [find_object(base_dir, chunk_hash, codec) for chunk_hash, _, codec in chunks]
+    if None in found:
+        return False, "not_found"
+    reader = open_objects(found)
+    try:
+        if verify_stream_hash(reader, expected_hash):
+            return True, reader
+        reader.close()
+        logger.error("Fallo de hash al reconstruir desde trozos en %s", base_dir)
+        return False, "hash_mismatch"
+    except Exception as e:
+        reader.close()
+        logger.error("Error leyendo trozos en %s: %s", base_dir, e)
+        return False, f"read_error: {str(e)}"
+
+def attempt_restore_from_copy(base_dir, instance_structure, relative_path, expected_hash, chunks=None, codec=STORAGE_CODEC_NONE):
+    """
+    Intenta restaurar desde una copia local: primero desde el almacén de objetos
+    (completo o por trozos) y, para respaldos anteriores a él, desde la ruta de la
+    estructura de la instancia.
+    """
+    if chunks:
+        return attempt_restore_from_chunks(base_dir, chunks, expected_hash)
+    found = find_object(base_dir, expected_hash, codec)
+    if found:
+        return attempt_restore_from_path(found[0], expected_hash, found[1])
+    return attempt_restore_from_path(os.path.join(base_dir, instance_structure, relative_path), expected_hash)
+
 def attempt_restore_from_cloud(cloud_service_name, cloud_path, expected_hash):
     """Intenta restaurar desde la nube a través del cloud-service."""
-    print(f"[RestoreService] Intentando desde nube: {cloud_path}", flush=True)
+    logger.debug("Intentando desde nube: %s", cloud_path)
     message_to_send = f"download|{cloud_path}"
-    r_service, r_status, r_content = transact(BUS_HOST, BUS_PORT, cloud_service_name, message_to_send)
+    # El contenido llega en modo flujo y se guarda en un archivo temporal (en disco si es grande).
+    content_spool = tempfile.SpooledTemporaryFile(max_size=CLOUD_SPOOL_MAX_SIZE)
+    r_service, r_status, r_content = transact(BUS_HOST, BUS_PORT, cloud_service_name, message_to_send, sink=content_spool)
 
     if r_status == "OK" and not r_content.startswith("Error:"):
         try:
-            content_bytes = base64.b64decode(r_content)
-            if verify_hash(content_bytes, expected_hash):
-                return True, r_content # r_content ya está en base64
+            content_spool.seek(0)
+            if verify_stream_hash(content_spool, expected_hash):
+                return True, content_spool
             else:
-                print(f"[RestoreService] Fallo de hash para archivo de nube {cloud_path}", flush=True)
+                content_spool.close()
+                logger.error("Fallo de hash para archivo de nube %s", cloud_path)
                 return False, "hash_mismatch_cloud"
         except Exception as e:
-            print(f"[RestoreService] Error decodificando/hasheando contenido de nube para {cloud_path}: {e}", flush=True)
+            content_spool.close()
+            logger.error("Error leyendo/hasheando contenido de nube para %s: %s", cloud_path, e)
             return False, f"cloud_data_error: {str(e)}"
     else:
-        print(f"[RestoreService] Error de cloud-service para {cloud_path}: {r_content}", flush=True)
+        content_spool.close()
+        logger.error("Error de cloud-service para %s: %s", cloud_path, r_content)
         return False, f"cloud_service_error: {r_content}"
 
 
-def process_request(data_received):
+def process_request(data_received, body=None):
+    """
+    Procesa las solicitudes del servicio de restauración.
+
+    Devuelve la respuesta como texto o, para request_file_restore exitoso, una
+    tupla (respuesta, archivo_abierto) cuyo contenido se envía en modo flujo.
+    """
     try:
         command, json_payload_str = data_received.split('|', 1)
         payload = json.loads(json_payload_str)
@@ -98,32 +162,31 @@ def process_request(data_received):
             return json.dumps({"status": "ERROR", "message": f"Archivo '{relative_path}' no encontrado en la instancia {instance_id}."})
         
         expected_hash = file_meta_list[0]["hash"]
+        codec, chunks = get_file_storage(instance_id, relative_path)
         
         # Prioridad 1: Copia local primaria
-        primary_path = os.path.join(PRIMARY_SOURCE_BASE, instance_structure, relative_path)
-        print(f"[RestoreService] Intentando desde primaria: {primary_path}", flush=True)
-        success, content_or_msg = attempt_restore_from_path(primary_path, expected_hash)
+        logger.debug("Intentando desde primaria: %s", relative_path)
+        success, content_or_msg = attempt_restore_from_copy(PRIMARY_SOURCE_BASE, instance_structure, relative_path, expected_hash, chunks, codec)
         if success:
-            return json.dumps({"status": "OK", "relative_path": relative_path, "content_b64": content_or_msg, "source_medium": "local_primary", "original_hash": expected_hash})
+            return json.dumps({"status": "OK", "relative_path": relative_path, "source_medium": "local_primary", "original_hash": expected_hash}), content_or_msg
 
-        print(f"[RestoreService] Fallo desde primaria para {relative_path}: {content_or_msg}", flush=True)
+        logger.warning("Fallo desde primaria para %s: %s", relative_path, content_or_msg)
 
         # Prioridad 2: Copia local secundaria
-        secondary_path = os.path.join(SECONDARY_SOURCE_BASE, instance_structure, relative_path)
-        print(f"[RestoreService] Intentando desde secundaria: {secondary_path}", flush=True)
-        success, content_or_msg = attempt_restore_from_path(secondary_path, expected_hash)
+        logger.debug("Intentando desde secundaria: %s", relative_path)
+        success, content_or_msg = attempt_restore_from_copy(SECONDARY_SOURCE_BASE, instance_structure, relative_path, expected_hash, chunks, codec)
         if success:
-            return json.dumps({"status": "OK", "relative_path": relative_path, "content_b64": content_or_msg, "source_medium": "local_secondary", "original_hash": expected_hash})
+            return json.dumps({"status": "OK", "relative_path": relative_path, "source_medium": "local_secondary", "original_hash": expected_hash}), content_or_msg
         
-        print(f"[RestoreService] Fallo desde secundaria para {relative_path}: {content_or_msg}", flush=True)
+        logger.warning("Fallo desde secundaria para %s: %s", relative_path, content_or_msg)
         
         # Prioridad 3: Nube
         cloud_path = os.path.join(instance_structure, relative_path).replace("\\", "/") # Asegurar separadores / para la nube
         success, content_or_msg = attempt_restore_from_cloud("clcsv", cloud_path, expected_hash)
         if success:
-            return json.dumps({"status": "OK", "relative_path": relative_path, "content_b64": content_or_msg, "source_medium": "cloud", "original_hash": expected_hash})
+            return json.dumps({"status": "OK", "relative_path": relative_path, "source_medium": "cloud", "original_hash": expected_hash}), content_or_msg
 
-        print(f"[RestoreService] Fallo desde nube para {relative_path}: {content_or_msg}", flush=True)
+        logger.error("Fallo desde nube para %s: %s", relative_path, content_or_msg)
         return json.dumps({"status": "FAIL", "relative_path": relative_path, "message": f"No se pudo restaurar el archivo '{relative_path}' desde ninguna fuente o la verificación de integridad falló. Último error: {content_or_msg}"})
     
     else:
@@ -131,23 +194,9 @@ def process_request(data_received):
 
 
 def main():
-    print(f"--- Iniciando lógica de negocio del servicio: {SERVICE_NAME} ---", flush=True)
-    while True:
-        connector = ServiceConnector(BUS_HOST, BUS_PORT, SERVICE_NAME)
-        try:
-            connector.connect_and_register()
-            while True:
-                data_received = connector.wait_for_transaction()
-                if data_received is None: 
-                    print("[RestoreService] El bus cerró la conexión.", flush=True)
-                    break 
-                response_data_json = process_request(data_received)
-                connector.send_response(response_data_json)
-        except Exception as e:
-            print(f"[RestoreService] Error en el bucle principal: {e}. Reintentando en 5 segundos...", flush=True)
-        finally:
-            connector.close()
-        time.sleep(5)
+    configure_logging(SERVICE_NAME)
+    logger.info("--- Iniciando lógica de negocio del servicio: %s ---", SERVICE_NAME)
+    ServiceWorkerPool(BUS_HOST, BUS_PORT, SERVICE_NAME, process_request, workers=SERVICE_WORKERS).run()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file